@@ -1,23 +1,282 @@
 import os
-from flask import Flask, render_template, request, redirect, url_for, session, flash
-from werkzeug.security import generate_password_hash, check_password_hash
+import atexit
+import csv
+import hashlib
+import hmac
+import io
+import json
+import mimetypes
+import secrets
+import time
+from flask import Flask, render_template, request, redirect, url_for, session, flash, g, Response, stream_with_context, jsonify
+from flask import has_request_context, send_from_directory
+from flask import before_render_template, template_rendered
+from jinja2 import FileSystemBytecodeCache
+from werkzeug.security import generate_password_hash, safe_join
 import sqlite3
-from datetime import datetime
+import threading
+import click
+from audit import AuditUnavailable, AuditWriter, audit_record, insert_audit
+from group_commit import GroupCommitWriter, WriterBusy
+from live_tallies import TallyBroadcaster
+from password_hashing import LoginBusy, PasswordHasher
+from session_store import MemorySessionStore, ServerSessionInterface, SqliteSessionStore
+from election_archive import archive_election
+from kiosk_api import create_kiosk, parse_ballot
+from ledger import LedgerSealer, last_report as last_ledger_report, record_report, verify as verify_ledger
+from schema import TALLIED, prepare as prepare_schema
+from static_assets import BUILD_DIR, build_assets, load_manifest
+from fragment_cache import FragmentCache, FragmentCacheExtension
+from tabulation import METHODS, RANKED, load_ballots, tabulate, tabulate_counts
+from turnout import add_turnout, eligible_voters, remove_turnout, turnout_report
+from instrumentation import (InstrumentationMiddleware, InstrumentedConnection, Metrics, SlowRequestProfiler,
+                             current_request, template_finished, template_started)
+from roster_import import DEFAULT_PASSWORD, allocate_regnos, import_roster, read_roster, regno_prefix
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from types import MappingProxyType
 from functools import wraps
 from werkzeug.utils import secure_filename
 
-DATABASE = 'database.db'
+DATABASE = os.environ.get('DATABASE', 'database.db')
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+ELECTION_TIME_FORMAT = "%Y-%m-%dT%H:%M"  # elections.start_date/deadline, as the settings form's datetime-local sends them
+DB_BUSY_TIMEOUT = 5000  # milliseconds
+DB_STATEMENT_CACHE = 256
+DB_PRAGMAS = (
+    'journal_mode = WAL',
+    'synchronous = NORMAL',
+    f'busy_timeout = {DB_BUSY_TIMEOUT}',
+    'mmap_size = 268435456',
+    'cache_size = -16000',
+    'temp_store = MEMORY',
+)
 
 app = Flask(__name__)
-app.secret_key = 'your_secret_key'  # Change to a strong secret key
+app.config.update(
+    DATABASE=DATABASE,
+    # Sessions live server-side under random ids, so a per-process key only affects Flask internals;
+    # set SECRET_KEY to keep it stable across workers and restarts
+    SECRET_KEY=os.environ.get('SECRET_KEY') or secrets.token_hex(32),
+    # Queue ballots for a background writer that commits many voters per transaction
+    VOTE_GROUP_COMMIT=os.environ.get('VOTE_GROUP_COMMIT') == '1',
+    VOTE_BATCH_SIZE=int(os.environ.get('VOTE_BATCH_SIZE', 200)),
+    VOTE_BATCH_LATENCY=float(os.environ.get('VOTE_BATCH_LATENCY', 0.005)),  # seconds
+    # How long a voter waits for the writer before getting a 503 and submitting again
+    VOTE_WRITE_TIMEOUT=float(os.environ.get('VOTE_WRITE_TIMEOUT', 10.0)),  # seconds
+    # How long results pages may trust the last tally version seen before re-checking the database
+    RESULTS_MAX_STALENESS=float(os.environ.get('RESULTS_MAX_STALENESS', 0)),  # seconds
+    # How long an IRV/STV count is reused while votes keep arriving; redone at once when the ballot changes
+    RANKED_RESULTS_MAX_AGE=float(os.environ.get('RANKED_RESULTS_MAX_AGE', 10.0)),  # seconds
+    # Closed elections are moved into this SQLite file to keep the live database small
+    ELECTION_ARCHIVE=os.environ.get('ELECTION_ARCHIVE', 'archive.db'),
+    # Werkzeug method for new password hashes; older hashes are upgraded on the next login
+    PASSWORD_HASH_METHOD=os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000'),
+    LOGIN_HASH_WORKERS=int(os.environ.get('LOGIN_HASH_WORKERS', 0)) or None,  # default: CPU count
+    LOGIN_MAX_PENDING=int(os.environ.get('LOGIN_MAX_PENDING', 0)) or None,  # default: 8 per hash worker
+    LOGIN_QUEUE_TIMEOUT=float(os.environ.get('LOGIN_QUEUE_TIMEOUT', 2.0)),  # seconds
+    # 'sqlite' shares sessions across gunicorn workers; 'memory' is for a single process
+    SESSION_BACKEND=os.environ.get('SESSION_BACKEND', 'sqlite'),
+    SESSION_CACHE_TTL=float(os.environ.get('SESSION_CACHE_TTL', 2.0)),  # seconds
+    PERMANENT_SESSION_LIFETIME=timedelta(hours=float(os.environ.get('SESSION_LIFETIME_HOURS', 12))),
+    # Lets a Prometheus scraper read /admin/metrics with "Authorization: Bearer <token>"
+    METRICS_TOKEN=os.environ.get('METRICS_TOKEN'),
+    # cProfile the sampled fraction of requests and keep the slowest PROFILE_KEEP; also toggled from /admin/metrics
+    PROFILE_REQUESTS=os.environ.get('PROFILE_REQUESTS') == '1',
+    PROFILE_KEEP=int(os.environ.get('PROFILE_KEEP', 10)),
+    PROFILE_SAMPLE_RATE=float(os.environ.get('PROFILE_SAMPLE_RATE', 1.0)),
+    # Ballots accepted per /api/kiosk/ballots request
+    KIOSK_MAX_BATCH=int(os.environ.get('KIOSK_MAX_BATCH', 500)),
+    # Browser cache lifetime for static files that have no fingerprinted build (e.g. uploads)
+    STATIC_MAX_AGE=int(os.environ.get('STATIC_MAX_AGE', 3600)),  # seconds
+    # Audit rows are buffered and written in batches off the request path; '0' writes each inline
+    AUDIT_ASYNC=os.environ.get('AUDIT_ASYNC', '1') == '1',
+    AUDIT_BATCH_SIZE=int(os.environ.get('AUDIT_BATCH_SIZE', 500)),
+    AUDIT_BATCH_LATENCY=float(os.environ.get('AUDIT_BATCH_LATENCY', 0.2)),  # seconds
+    # Records land here when the database stays locked, and are replayed after the next flush
+    AUDIT_SPILL=os.environ.get('AUDIT_SPILL', 'audit_spill.jsonl'),
+    # How often each worker hash-chains new ballot and audit ledger entries
+    LEDGER_SEAL_INTERVAL=float(os.environ.get('LEDGER_SEAL_INTERVAL', 5.0)),  # seconds
+    # How often the turnout analytics page re-reads the rollups while it is open
+    TURNOUT_REFRESH=float(os.environ.get('TURNOUT_REFRESH', 15.0)),  # seconds
+    # Live-count streams each hold a worker thread; past this many per process, pages poll /api/tallies
+    LIVE_TALLIES_STREAMS=int(os.environ.get('LIVE_TALLIES_STREAMS', 4)),
+    # Rendered {% cache %} fragments kept per worker; 0 renders every block every time
+    FRAGMENT_CACHE_SIZE=int(os.environ.get('FRAGMENT_CACHE_SIZE', 512)),
+    # Compiled templates shared by every worker and restart, relative to the app's directory; '' compiles
+    # them in each process
+    TEMPLATE_BYTECODE_CACHE=os.environ.get('TEMPLATE_BYTECODE_CACHE', 'jinja_cache'),
+    # create_app() builds the ballot, results and template caches before gunicorn forks its workers
+    WARM_CACHES=os.environ.get('WARM_CACHES', '1') == '1',
+    # sqlite3.Connection subclass for every app connection; tools may extend InstrumentedConnection
+    DB_FACTORY=InstrumentedConnection,
+)
+_db_local = threading.local()
+_ballot_cache = {}  # election id -> BallotDefinition
+_vote_writer = None
+_password_hasher = None
+_tally_version = (None, 0.0, None)  # (version key, checked at, first seen at)
+_results_cache = {}
+_tabulation_cache = {}  # (election id, position id) -> (key, counted at, Tabulation) for ranked positions
+_schema_ready = None  # the DATABASE path init_database() last prepared
+_schema_lock = threading.Lock()
 
 # ------------------- Helpers -------------------
 
-def get_db():
-    conn = sqlite3.connect(DATABASE)
+Candidate = namedtuple('Candidate', 'id name position_id avatar')
+# grouped: position name -> candidates, as vote.html renders it; choices: position id -> valid candidate ids;
+# methods: position id -> counting method
+BallotDefinition = namedtuple('BallotDefinition', 'version grouped choices methods')
+
+def init_database():
+    """Create or migrate DATABASE once per process; a preloading gunicorn master does it before forking."""
+    global _schema_ready
+    with _schema_lock:
+        if _schema_ready != DATABASE:
+            prepare_schema(DATABASE)
+            _schema_ready = DATABASE
+
+def connect_db():
+    if _schema_ready != DATABASE:
+        init_database()
+    conn = sqlite3.connect(DATABASE, timeout=DB_BUSY_TIMEOUT / 1000,
+                           cached_statements=DB_STATEMENT_CACHE, factory=app.config['DB_FACTORY'])
     conn.row_factory = sqlite3.Row
+    for pragma in DB_PRAGMAS:
+        conn.execute(f"PRAGMA {pragma}")
     return conn
 
+def get_db():
+    # One connection per request, reused by the same worker thread across requests
+    if 'db' not in g:
+        db = getattr(_db_local, 'conn', None)
+        if db is None:
+            db = _db_local.conn = connect_db()
+        g.db = db
+    return g.db
+
+@app.teardown_appcontext
+def release_db(exception):
+    db = g.pop('db', None)
+    if db is not None and db.in_transaction:
+        db.rollback()
+
+# Per-process request, SQL and template timings, shown at /admin/metrics
+metrics = Metrics()
+request_profiler = SlowRequestProfiler()  # set up from app.config by configure_app()
+app.wsgi_app = InstrumentationMiddleware(app.wsgi_app, metrics, request_profiler)
+
+@app.before_request
+def label_request_metrics():
+    stats = current_request()
+    if stats is not None:
+        stats.endpoint = request.endpoint or 'unmatched'
+
+@before_render_template.connect_via(app)
+def time_template_start(sender, template, context, **extra):
+    template_started(template)
+
+@template_rendered.connect_via(app)
+def time_template_end(sender, template, context, **extra):
+    template_finished(template)
+
+# Fingerprinted assets from `flask build-assets`; their URLs change with their content
+ASSET_MAX_AGE = 365 * 24 * 3600  # seconds
+asset_manifest = load_manifest(app.static_folder)
+
+def asset_url_for(endpoint, **values):
+    # Templates' url_for: built static files get their fingerprinted name (icons a sprite fragment)
+    if endpoint == 'static':
+        built = asset_manifest.get(values.get('filename'))
+        if built:
+            filename, _, anchor = built.partition('#')
+            return url_for('static', **dict(values, filename=filename), _anchor=anchor or None)
+    return url_for(endpoint, **values)
+
+app.jinja_env.globals['url_for'] = asset_url_for
+
+app.jinja_env.add_extension(FragmentCacheExtension)
+
+def serve_static(filename):
+    if not filename.startswith(f'{BUILD_DIR}/'):
+        return send_from_directory(app.static_folder, filename, max_age=app.config['STATIC_MAX_AGE'])
+    # Built files never change under their name: send the pre-compressed copy and let browsers keep it
+    response = None
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        path = safe_join(app.static_folder, filename + suffix)
+        if encoding in request.accept_encodings and path and os.path.isfile(path):
+            response = send_from_directory(app.static_folder, filename + suffix, max_age=ASSET_MAX_AGE,
+                                           mimetype=mimetypes.guess_type(filename)[0])
+            response.content_encoding = encoding
+            break
+    if response is None:
+        response = send_from_directory(app.static_folder, filename, max_age=ASSET_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    response.vary.add('Accept-Encoding')
+    return response
+
+app.view_functions['static'] = serve_static
+
+# Elections open to a student, and whether one is taking votes right now (`now` in ELECTION_TIME_FORMAT)
+ELIGIBLE_SQL = ("e.status != 'archived' AND (e.course IS NULL OR e.course = s.course COLLATE NOCASE) "
+                "AND (e.batch IS NULL OR e.batch = s.batch)")
+VOTING_SQL = ("({e}.status = 'open' AND COALESCE({e}.start_date, '') <= :now "
+              "AND :now < COALESCE(NULLIF({e}.deadline, ''), '9999'))")
+
+def current_voter():
+    """The signed-in user's row and current election, looked up once per request so voted/avatar are never stale.
+
+    Students get the eligible election named by the request's election_id, else the one taking
+    votes now (class-specific before school-wide), else the newest other one; admins get the
+    election picked on the settings page. election_open is set while that election takes votes.
+    """
+    if 'voter' not in g:
+        user = session.get('user')
+        g.voter = user and get_db().execute(f'''
+            SELECT s.regno, s.name, s.course, s.batch, s.avatar, ce.id AS election_id,
+                   ce.status AS election_status, {VOTING_SQL.format(e='ce')} AS election_open,
+                   ev.regno IS NOT NULL AS voted
+            FROM students s
+            LEFT JOIN elections ce ON ce.id = COALESCE(:picked, (
+                SELECT e.id FROM elections e
+                WHERE {ELIGIBLE_SQL}
+                ORDER BY e.id = :requested DESC, {VOTING_SQL.format(e='e')} DESC,
+                         (e.course IS NOT NULL) + (e.batch IS NOT NULL) DESC,
+                         e.status = 'open' DESC, e.start_date DESC, e.id DESC
+                LIMIT 1
+            ))
+            LEFT JOIN election_voters ev ON ev.election_id = ce.id AND ev.regno = s.regno
+            WHERE s.regno = :user
+        ''', {'picked': session.get('election_id') if session.get('role') == 'admin' else None,
+              'requested': request.values.get('election_id', type=int), 'user': user,
+              'now': datetime.now().strftime(ELECTION_TIME_FORMAT)}).fetchone()
+    return g.voter
+
+def voter_elections():
+    """Every election open to the signed-in student, taking votes now first, with whether they voted in it."""
+    return get_db().execute(f'''
+        SELECT e.id, e.title, e.start_date, e.deadline, {VOTING_SQL.format(e='e')} AS open, ev.regno IS NOT NULL AS voted
+        FROM students s
+        JOIN elections e ON {ELIGIBLE_SQL}
+        LEFT JOIN election_voters ev ON ev.election_id = e.id AND ev.regno = s.regno
+        WHERE s.regno = :user
+        ORDER BY open DESC, e.start_date DESC, e.id DESC
+    ''', {'user': session.get('user'), 'now': datetime.now().strftime(ELECTION_TIME_FORMAT)}).fetchall()
+
+def current_election_id():
+    voter = current_voter()
+    if voter and voter['election_id'] is not None:
+        return voter['election_id']
+    if session.get('role') != 'admin':
+        return None  # no election is open to this student's class
+    row = get_db().execute("SELECT id FROM elections WHERE status != 'archived' ORDER BY id DESC LIMIT 1").fetchone()
+    return row['id'] if row else None
+
+@app.context_processor
+def inject_voter():
+    return {'voter': current_voter()}
+
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -35,39 +294,406 @@ def admin_required(f):
         return f(*args, **kwargs)
     return admin_check
 
-def get_election_info():
+def get_election_info(election_id=None):
     db = get_db()
-    election = db.execute("SELECT * FROM elections WHERE id = 1").fetchone()
-    db.close()
+    election = db.execute("SELECT * FROM elections WHERE id = ?",
+                          (election_id or current_election_id(),)).fetchone()
     return election
 
 def get_vote_by_id(vote_id):
     db = get_db()
     vote = db.execute('''
-        SELECT v.id, v.student_regno, c.name AS candidate_name
+        SELECT v.id, v.election_id, v.student_regno, c.name AS candidate_name
         FROM ballots v
         JOIN candidates c ON v.candidate_id = c.id
         WHERE v.id = ?
     ''', (vote_id,)).fetchone()
-    db.close()
     if vote:
         return dict(vote)
     return None
 
+def get_version(db, name):
+    row = db.execute("SELECT version FROM versions WHERE name = ?", (name,)).fetchone()
+    return row['version'] if row else 0
+
+def bump_version(db, name):
+    db.execute('''
+        INSERT INTO versions (name, version) VALUES (?, 1)
+        ON CONFLICT (name) DO UPDATE SET version = version + 1
+    ''', (name,))
+
+def get_ballot(db, election_id):
+    """Return an election's BallotDefinition, rebuilt only after positions or candidates are edited."""
+    version = get_version(db, 'ballot')
+    ballot = _ballot_cache.get(election_id)
+    if ballot is None or ballot.version != version:
+        positions = db.execute("SELECT id, name, method FROM positions WHERE election_id = ? ORDER BY id",
+                               (election_id,)).fetchall()
+        by_position = {pos['id']: [] for pos in positions}
+        for c in db.execute("""
+            SELECT c.id, c.name, c.position_id, s.avatar
+            FROM candidates c
+            LEFT JOIN students s ON s.regno = c.student_regno
+            WHERE c.election_id = ?
+            ORDER BY c.id
+        """, (election_id,)):
+            if c['position_id'] in by_position:
+                by_position[c['position_id']].append(Candidate(*c))
+
+        grouped = {}
+        for pos in positions:
+            grouped[pos['name']] = tuple(by_position[pos['id']])
+        choices = {pos_id: frozenset(c.id for c in cands) for pos_id, cands in by_position.items()}
+        methods = {pos['id']: pos['method'] for pos in positions}
+        ballot = _ballot_cache[election_id] = BallotDefinition(version, MappingProxyType(grouped),
+                                                               MappingProxyType(choices), MappingProxyType(methods))
+    return ballot
+
+def add_tallies(db, election_id, student):
+    # Tallies hold plurality votes, approvals and first preferences: the student's TALLIED rows
+    db.execute(f'''
+        INSERT INTO tallies (election_id, position_id, candidate_id, votes)
+        SELECT election_id, position_id, candidate_id, 1 FROM ballots
+        WHERE election_id = ? AND student_regno = ? AND {TALLIED}
+        ON CONFLICT (election_id, position_id, candidate_id) DO UPDATE SET votes = votes + 1
+    ''', (election_id, student))
+    bump_version(db, 'tallies')
+
+def ballot_selections(ballot, picks):
+    """Turn {position id: [candidate ids, in order of preference]} into (position, candidate, rank) rows.
+
+    Returns None unless every position that has candidates gets distinct listed candidates
+    that its method allows: exactly one for plurality, one or more for approval and ranked.
+    Picks are ranked in the order given; approval counts them all alike (see schema.TALLIED).
+    """
+    if not picks or picks.keys() != {pos_id for pos_id, ids in ballot.choices.items() if ids}:
+        return None
+    selections = []
+    for position_id, candidate_ids in picks.items():
+        method = ballot.methods[position_id]
+        if (not candidate_ids or len(set(candidate_ids)) != len(candidate_ids)
+                or not ballot.choices[position_id].issuperset(candidate_ids)
+                or (method == 'plurality' and len(candidate_ids) != 1)):
+            return None
+        selections.extend((position_id, candidate_id, rank)
+                          for rank, candidate_id in enumerate(candidate_ids, start=1))
+    return selections
+
+def record_ballot(db, election_id, student, selections, timestamp):
+    """Write one voter's ballot inside the caller's transaction; False if they had already voted.
+
+    `selections` are (position id, candidate id, rank) rows from ballot_selections().
+    """
+    claimed = db.execute('''
+        INSERT INTO election_voters (election_id, regno, timestamp) VALUES (?, ?, ?)
+        ON CONFLICT (election_id, regno) DO NOTHING
+    ''', (election_id, student, timestamp))
+    if claimed.rowcount != 1:
+        return False
+    db.execute("SAVEPOINT ballot")
+    try:
+        db.executemany("INSERT INTO ballots (election_id, student_regno, position_id, candidate_id, rank, timestamp) "
+                       "VALUES (?, ?, ?, ?, ?, ?)",
+                       [(election_id, student, position_id, candidate_id, rank, timestamp)
+                        for position_id, candidate_id, rank in selections])
+    except sqlite3.IntegrityError:
+        # Leftover ballots for this student already hold one of these (position, rank) slots
+        # in idx_ballots_election_student; keep the voter row so it matches the ballots on record
+        db.execute("ROLLBACK TO ballot")
+        db.execute("RELEASE ballot")
+        return False
+    db.execute("RELEASE ballot")
+    add_tallies(db, election_id, student)
+    add_turnout(db, election_id, student, timestamp)
+    insert_audit(db, [audit_record('Vote Cast', student, f'Ballot submitted for election {election_id}',
+                                   timestamp, election_id=election_id, target=student)])
+    return True
+
+def connect_vote_writer():
+    conn = connect_db()
+    # Group commit amortises the fsync, so the writer can afford full durability
+    conn.execute("PRAGMA synchronous = FULL")
+    return conn
+
+def get_vote_writer():
+    global _vote_writer
+    if _vote_writer is None:
+        _vote_writer = GroupCommitWriter(connect_vote_writer, record_ballot,
+                                         max_batch=app.config['VOTE_BATCH_SIZE'],
+                                         max_latency=app.config['VOTE_BATCH_LATENCY'],
+                                         timeout=app.config['VOTE_WRITE_TIMEOUT'])
+    return _vote_writer
+
+def get_password_hasher():
+    global _password_hasher
+    if _password_hasher is None:
+        _password_hasher = PasswordHasher(app.config['PASSWORD_HASH_METHOD'],
+                                          workers=app.config['LOGIN_HASH_WORKERS'],
+                                          max_pending=app.config['LOGIN_MAX_PENDING'],
+                                          queue_timeout=app.config['LOGIN_QUEUE_TIMEOUT'])
+    return _password_hasher
+
+def hash_password(password):
+    return generate_password_hash(password, method=app.config['PASSWORD_HASH_METHOD'])
+
+tally_broadcaster = None  # built by configure_app()
+
+def tallies_changed():
+    # Called after this process commits a tally or ballot-layout change
+    global _tally_version
+    _tally_version = (None, 0.0, None)
+    tally_broadcaster.notify()
+
+def read_tally_version(db):
+    rows = dict(db.execute("SELECT name, version FROM versions WHERE name IN ('ballot', 'tallies')").fetchall())
+    return rows.get('ballot', 0), rows.get('tallies', 0)
+
+def current_tally_version():
+    """Return ((ballot version, tallies version), last modified); may be RESULTS_MAX_STALENESS old."""
+    global _tally_version
+    key, checked_at, seen_at = _tally_version
+    if key is None or time.monotonic() - checked_at >= app.config['RESULTS_MAX_STALENESS']:
+        latest = read_tally_version(get_db())
+        if latest != key:
+            seen_at = datetime.now(timezone.utc).replace(microsecond=0)
+        key = latest
+        _tally_version = (key, time.monotonic(), seen_at)
+    return key, seen_at
+
+def get_cached_results(version, election_id, include_empty=False):
+    cache_key = (election_id, include_empty)
+    hit = _results_cache.get(cache_key)
+    if hit is not None and hit[0] == version:
+        return hit[1]
+    results = get_results(get_db(), election_id, include_empty)
+    _results_cache[cache_key] = (version, results)
+    return results
+
+def render_results(template, include_empty=False):
+    """Render the current election's results from the cache, or answer 304 if the browser's copy is current."""
+    election_id = current_election_id()
+    version, last_modified = current_tally_version()
+    # Pages also show the viewer's name, so the tag covers who is asking as well as the tallies
+    etag = hashlib.sha1(repr((election_id, version, template, include_empty,
+                              session.get('user'), session.get('role'))).encode()).hexdigest()
+    if '_flashes' not in session and request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        results = get_cached_results(version, election_id, include_empty)
+        response = app.make_response(render_template(template, results=results, layout=version[0],
+                                                     results_key=(election_id, version, include_empty)))
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    staleness = app.config['RESULTS_MAX_STALENESS']
+    response.headers['Cache-Control'] = f'private, max-age={int(staleness)}' if staleness >= 1 else 'private, no-cache'
+    return response
+
+def remove_tallies(db, where, params):
+    # Decrement the tallies for every ballot matched by `where` before those ballots are deleted
+    db.execute(f'''
+        UPDATE tallies SET votes = votes - (
+            SELECT COUNT(*) FROM ballots
+            WHERE {where}
+              AND ballots.election_id = tallies.election_id
+              AND ballots.position_id = tallies.position_id
+              AND ballots.candidate_id = tallies.candidate_id
+              AND {TALLIED}
+        )
+        WHERE (election_id, position_id, candidate_id) IN (
+            SELECT election_id, position_id, candidate_id FROM ballots WHERE {where} AND {TALLIED}
+        )
+    ''', params + params)
+    bump_version(db, 'tallies')
+
+def get_ranked_tabulation(db, election_id, position_id, method, seats, candidate_ids):
+    """Count a ranked position from its ballots, reusing this worker's last count for up to
+    RANKED_RESULTS_MAX_AGE seconds unless the ballot layout, method or seats changed since."""
+    # Ranked counts need every ballot; the tallies only hold first preferences
+    key = (get_version(db, 'ballot'), method, seats, tuple(candidate_ids))
+    hit = _tabulation_cache.get((election_id, position_id))
+    if hit is not None and hit[0] == key and time.monotonic() - hit[1] < app.config['RANKED_RESULTS_MAX_AGE']:
+        return hit[2]
+    tabulation = tabulate(method, load_ballots(db, election_id, position_id, candidate_ids), seats)
+    _tabulation_cache[(election_id, position_id)] = (key, time.monotonic(), tabulation)
+    return tabulation
+
+def get_results(db, election_id, include_empty=False):
+    """Count every position with its method; returns {position name: result dict} in position order.
+
+    Each result has the method, seats, rounds (for ranked methods), tied candidate names, and
+    candidates in finishing order with their tallied votes (first preferences when ranked),
+    final-round count and whether they were elected. Positions with no candidates are
+    only listed when include_empty is set. Tallied votes are always current; ranked rounds
+    may lag them by RANKED_RESULTS_MAX_AGE (see get_ranked_tabulation).
+    """
+    data = db.execute(f"""
+        SELECT p.id as position_id, p.name as position, p.method, p.seats,
+               c.id as candidate_id, c.name as candidate, COALESCE(t.votes, 0) as votes
+        FROM positions p
+        {'LEFT JOIN' if include_empty else 'JOIN'} candidates c ON c.election_id = p.election_id AND p.id = c.position_id
+        LEFT JOIN tallies t ON t.election_id = p.election_id AND t.candidate_id = c.id AND t.position_id = p.id
+        WHERE p.election_id = ?
+        ORDER BY p.id, votes DESC
+    """, (election_id,)).fetchall()
+
+    positions = {}
+    for row in data:
+        positions.setdefault(row['position_id'], []).append(row)
+
+    results_by_position = {}
+    for position_id, rows in positions.items():
+        method, seats = rows[0]['method'], rows[0]['seats']
+        names = {row['candidate_id']: row['candidate'] for row in rows}
+        counts = {row['candidate_id']: row['votes'] for row in rows if row['candidate_id'] is not None}
+        if method in RANKED and counts:
+            tabulation = get_ranked_tabulation(db, election_id, position_id, method, seats, list(counts))
+        else:
+            tabulation = tabulate_counts(method, counts, seats)
+
+        order = {candidate_id: i for i, candidate_id in enumerate(tabulation.winners)}
+        candidates = [{'candidate_id': row['candidate_id'], 'candidate': row['candidate'], 'votes': row['votes'],
+                       'final': tabulation.counts.get(row['candidate_id'], 0),
+                       'elected': row['candidate_id'] in order} for row in rows]
+        candidates.sort(key=lambda c: (order.get(c['candidate_id'], len(order)), -c['final'], -c['votes']))
+        results_by_position[rows[0]['position']] = {
+            'method': method,
+            'method_name': METHODS.get(method, method),
+            'seats': seats,
+            'candidates': candidates,
+            'tied': [names[c] for c in tabulation.tied],
+            'exhausted': tabulation.exhausted,
+            'rounds': [{'counts': sorted(((names[c], votes) for c, votes in r.counts.items()), key=lambda x: -x[1]),
+                        'elected': [names[c] for c in r.elected],
+                        'eliminated': [names[c] for c in r.eliminated],
+                        'tiebreak': r.tiebreak} for r in tabulation.rounds] if method in RANKED else [],
+        }
+    return results_by_position
+
 def delete_vote(vote_id):
     db = get_db()
+    remove_tallies(db, 'id = ?', (vote_id,))
     db.execute('DELETE FROM ballots WHERE id = ?', (vote_id,))
     db.commit()
-    db.close()
 
-def log_audit_entry(action, user, details, timestamp):
+def format_timestamp(value):
+    """Normalize a datetime or ISO-ish string to TIMESTAMP_FORMAT so stored timestamps sort correctly."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.strftime(TIMESTAMP_FORMAT)
+
+audit_writer = None  # built by configure_app()
+ledger_sealer = None
+
+@atexit.register
+def flush_audit_log():
+    if audit_writer is not None:
+        audit_writer.flush()
+
+@app.before_request
+def start_ledger_sealer():
+    ledger_sealer.ensure_started()
+
+def log_audit_entry(action, user, details, timestamp=None, election_id=None, target=None, sync=False):
+    """Queue an audit record for the background writer; with sync=True, return only once it is durable.
+
+    Writes that must be atomic with the action they describe use insert_audit() inside
+    that action's transaction instead.
+    """
+    record = audit_record(action, user, details, timestamp, election_id, target,
+                          request.remote_addr if has_request_context() else None)
+    if app.config['AUDIT_ASYNC']:
+        try:
+            audit_writer.log(record, sync=sync)
+            return
+        except AuditUnavailable:
+            pass  # not durable in time: write it here; the uid keeps a late copy from doubling it
     db = get_db()
-    db.execute('''
-        INSERT INTO audit_log (action, user, details, timestamp)
-        VALUES (?, ?, ?, ?)
-    ''', (action, user, details, timestamp))
+    insert_audit(db, [record])
     db.commit()
-    db.close()
+
+AUDIT_PAGE_SIZE = 50
+EXPORT_CHUNK = 500  # rows fetched from the cursor per streamed chunk
+
+def audit_log_filters(args):
+    """Build the WHERE clauses for the audit log's user/action/time-range filters."""
+    clauses, params = [], []
+    if args.get('user'):
+        clauses.append("user = ?")
+        params.append(args['user'])
+    if args.get('action'):
+        clauses.append("action = ?")
+        params.append(args['action'])
+    for field, op, pad in (('from', '>=', ':00'), ('to', '<=', ':59')):
+        value = args.get(field)
+        if value:
+            try:
+                # datetime-local inputs send "YYYY-MM-DDTHH:MM"
+                moment = datetime.fromisoformat(value + pad if len(value) == 16 else value)
+            except ValueError:
+                continue
+            clauses.append(f"timestamp {op} ?")
+            params.append(format_timestamp(moment))
+    return clauses, params
+
+def stream_export(query, params, columns, fmt, filename):
+    """Stream a query as CSV or JSON lines, EXPORT_CHUNK rows at a time, so memory stays flat."""
+    def generate():
+        cursor = get_db().execute(query, params)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if fmt == 'csv':
+            writer.writerow(columns)
+        while True:
+            rows = cursor.fetchmany(EXPORT_CHUNK)
+            if not rows:
+                break
+            if fmt == 'csv':
+                writer.writerows(rows)
+            else:
+                buffer.writelines(json.dumps(dict(zip(columns, row))) + '\n' for row in rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(generate()), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}.{fmt}'})
+
+def results_certificates(election, rows):
+    """Render one fpdf certificate page per position from (position, candidate, votes) rows."""
+    from fpdf import FPDF  # optional; only the PDF export needs it
+
+    def text(value):
+        # The core PDF fonts are Latin-1 only
+        return str(value).encode('latin-1', 'replace').decode('latin-1')
+
+    pdf = FPDF()
+    pdf.set_auto_page_break(True, margin=20)
+    title = election['title'] if election else 'Election'
+    issued = datetime.now().strftime(TIMESTAMP_FORMAT)
+    position = None
+    for row in rows:
+        if row['position'] != position:
+            position = row['position']
+            pdf.add_page()
+            pdf.set_font('Arial', 'B', 20)
+            pdf.cell(0, 14, text(title), 0, 1, 'C')
+            pdf.set_font('Arial', '', 13)
+            pdf.cell(0, 9, text(f"Certificate of Results: {position}"), 0, 1, 'C')
+            pdf.cell(0, 7, text(f"Issued {issued}"), 0, 1, 'C')
+            pdf.ln(8)
+            pdf.set_font('Arial', 'B', 12)
+            pdf.cell(130, 9, 'Candidate', 1, 0)
+            pdf.cell(0, 9, 'Votes', 1, 1, 'R')
+            pdf.set_font('Arial', '', 12)
+        pdf.cell(130, 9, text(row['candidate']), 1, 0)
+        pdf.cell(0, 9, str(row['votes']), 1, 1, 'R')
+    if position is None:
+        pdf.add_page()
+        pdf.set_font('Arial', 'B', 16)
+        pdf.cell(0, 14, text(f"{title}: no positions to report"), 0, 1, 'C')
+    return pdf.output(dest='S').encode('latin-1')
 
 from functools import wraps
 from flask import session, redirect, url_for, flash
@@ -103,14 +729,28 @@ def login():
 
         db = get_db()
         user = db.execute("SELECT * FROM students WHERE regno = ?", (user_regno,)).fetchone()
-        db.close()
+        hasher = get_password_hasher()
+
+        try:
+            authenticated = user is not None and hasher.verify(user['password'], password)
+        except LoginBusy:
+            error = "Too many sign-ins right now. Please try again in a moment."
+            return render_template('login.html', error=error, body_class='login-page'), 503, {'Retry-After': '5'}
 
-        if user and check_password_hash(user['password'], password):
+        if authenticated and hasher.needs_rehash(user['password']):
+            # Upgrade to the current hashing policy while we have the plain password; best effort
+            try:
+                db.execute("UPDATE students SET password = ? WHERE regno = ? AND password = ?",
+                           (hasher.hash(password), user['regno'], user['password']))
+                db.commit()
+            except (LoginBusy, sqlite3.OperationalError):
+                if db.in_transaction:
+                    db.rollback()
+
+        if authenticated:
+            session.clear()
+            session.regenerate()
             session['user'] = user['regno']
-            session['name'] = user['name']
-            session['course'] = user['course']
-            session['batch'] = user['batch']
-            session['voted'] = user['voted']
             session['role'] = 'admin' if user_regno == 'admin' else 'student'
 
             if session['role'] == 'admin':
@@ -135,28 +775,33 @@ def logout():
 def student_dashboard():
     db = get_db()
     election = get_election_info()
+    if election is None:
+        flash("There is no election for your class yet.")
+        return render_template('student_dashboard.html', election=None, remaining=0, started=False,
+                               closed=False, elections=[], leaders=[], session=session)
 
     now = datetime.now()
-    start = datetime.strptime(election['start_date'], "%Y-%m-%dT%H:%M")
-    end = datetime.strptime(election['deadline'], "%Y-%m-%dT%H:%M")
+    end = datetime.strptime(election['deadline'], ELECTION_TIME_FORMAT)
 
     remaining = (end - now).total_seconds()
-    started = now >= start
+    started = bool(current_voter()['election_open'])
+    closed = election['status'] != 'open' or remaining <= 0
 
     leaders = db.execute("""
-        SELECT p.name AS position, c.name AS candidate, COUNT(b.id) as votes
+        SELECT p.name AS position, c.name AS candidate, COALESCE(t.votes, 0) as votes
         FROM positions p
-        JOIN candidates c ON p.id = c.position_id
-        LEFT JOIN ballots b ON c.id = b.candidate_id
-        GROUP BY p.id, c.id
+        JOIN candidates c ON c.election_id = p.election_id AND p.id = c.position_id
+        LEFT JOIN tallies t ON t.election_id = p.election_id AND t.candidate_id = c.id AND t.position_id = p.id
+        WHERE p.election_id = ?
         ORDER BY p.id, votes DESC
-    """).fetchall()
-    db.close()
+    """, (election['id'],)).fetchall()
 
     return render_template('student_dashboard.html',
                            election=election,
                            remaining=remaining,
                            started=started,
+                           closed=closed,
+                           elections=voter_elections(),
                            leaders=leaders,
                            session=session)
 
@@ -164,45 +809,149 @@ def student_dashboard():
 @app.route('/vote')
 @login_required
 def vote():
-    if session.get('voted'):
-        return redirect(url_for('ballot_summary'))
-
-    db = get_db()
-    positions = db.execute("SELECT * FROM positions").fetchall()
-    candidates = db.execute("SELECT * FROM candidates").fetchall()
-    db.close()
-
-    # Group candidates by position
-    grouped = {}
-    for pos in positions:
-        grouped[pos['name']] = [c for c in candidates if c['position_id'] == pos['id']]
+    voter = current_voter()
+    if voter['voted']:
+        return redirect(url_for('ballot_summary', election_id=voter['election_id']))
+    if not voter['election_open']:
+        flash("There is no election taking votes for your class right now.")
+        return redirect(url_for('student_dashboard'))
 
-    return render_template('vote.html', grouped=grouped)
+    ballot = get_ballot(get_db(), voter['election_id'])
+    return render_template('vote.html', grouped=ballot.grouped, methods=ballot.methods,
+                           election_id=voter['election_id'], ballot_key=(voter['election_id'], ballot.version))
 
 @app.route('/submit_vote', methods=['POST'])
 @login_required
 def submit_vote():
     db = get_db()
     student = session['user']
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-    for key, value in request.form.items():
-        if key.startswith("position_"):
-            position_id = key.split("_")[1]
-            candidate_id = value
-            db.execute("INSERT INTO ballots (student_regno, position_id, candidate_id, timestamp) VALUES (?, ?, ?, ?)",
-                       (student, position_id, candidate_id, timestamp))
-
-    db.execute("UPDATE students SET voted = 1 WHERE regno = ?", (student,))
-    db.commit()
-
-    db.execute("INSERT INTO audit_log (user, action, details, timestamp) VALUES (?, ?, ?, ?)",
-               (student, 'Vote Cast', 'Ballot submitted', timestamp))
-    db.commit()
-    db.close()
-
-    session['voted'] = 1
-    return redirect(url_for('ballot_summary'))
+    timestamp = datetime.now().strftime(TIMESTAMP_FORMAT)
+    voter = current_voter()
+    election_id = voter['election_id']
+    # The form names its election; current_voter() falls back to another one if it is not this student's
+    if request.form.get('election_id', type=int) != election_id or not voter['election_open']:
+        flash("That election is not taking votes from your class right now.")
+        return redirect(url_for('student_dashboard'))
+
+    # Each position_<id> field repeats once per pick; ranked positions list them in order of preference
+    try:
+        picks = {int(key.split("_")[1]): [int(value) for value in request.form.getlist(key) if value]
+                 for key in request.form if key.startswith("position_")}
+    except ValueError:
+        picks = None
+
+    selections = ballot_selections(get_ballot(db, election_id), picks)
+    if selections is None:
+        flash("Please make a valid choice for every position.")
+        return redirect(url_for('vote', election_id=election_id))
+
+    # Ballots, tallies, the voter row and the audit row are written in one transaction
+    try:
+        if app.config['VOTE_GROUP_COMMIT']:
+            recorded = get_vote_writer().submit(election_id, student, selections, timestamp)
+        else:
+            db.execute("BEGIN IMMEDIATE")
+            recorded = record_ballot(db, election_id, student, selections, timestamp)
+            db.commit()
+    except (WriterBusy, sqlite3.OperationalError):
+        # A vote that did land is reported as already recorded when it is submitted again
+        if db.in_transaction:
+            db.rollback()
+        return ("The ballot box is busy right now. Please submit your vote again in a moment.",
+                503, {'Retry-After': '5'})
+    tallies_changed()
+
+    if not recorded:
+        flash("Your vote has already been recorded.")
+    return redirect(url_for('ballot_summary', election_id=election_id))
+
+@app.route('/api/kiosk/ballots', methods=['POST'])
+def kiosk_ballots():
+    """Bulk-ingest signed ballots collected offline by a polling-station kiosk.
+
+    The kiosk names itself in X-Kiosk-Id and posts {"ballots": [...]}, each ballot signed as
+    kiosk_api.parse_ballot() describes. Valid ballots are committed in one transaction and every
+    ballot gets an outcome: recorded, duplicate (the student had already voted, here or in
+    this batch) or rejected with a reason. Serve it from the "kiosk" process in the Procfile,
+    whose own pool of threads keeps slow uploads from station links off the web workers.
+    """
+    db = get_db()
+    kiosk = db.execute("SELECT id, secret FROM kiosks WHERE id = ? AND active = 1",
+                       (request.headers.get('X-Kiosk-Id', ''),)).fetchone()
+    if kiosk is None:
+        return jsonify(error="Unknown or revoked kiosk."), 401
+    payload = request.get_json(silent=True)
+    ballots = payload.get('ballots') if isinstance(payload, dict) else None
+    if not isinstance(ballots, list):
+        return jsonify(error='Expected a JSON body like {"ballots": [...]}.'), 400
+    if len(ballots) > app.config['KIOSK_MAX_BATCH']:
+        return jsonify(error=f"At most {app.config['KIOSK_MAX_BATCH']} ballots per request."), 413
+
+    outcomes = [None] * len(ballots)
+    parsed = {}
+    for i, ballot in enumerate(ballots):
+        try:
+            parsed[i] = parse_ballot(kiosk['secret'], ballot, TIMESTAMP_FORMAT)
+        except ValueError as e:
+            outcomes[i] = ('rejected', str(e))
+
+    # One lookup each for the batch's students and elections
+    regnos = list({regno for _, regno, _, _ in parsed.values()})
+    students = {row['regno']: row for row in db.execute(
+        f"SELECT regno, course, batch FROM students WHERE regno IN ({', '.join('?' * len(regnos))})", regnos)}
+    election_ids = list({election_id for election_id, _, _, _ in parsed.values()})
+    elections = {row['id']: row for row in db.execute(
+        f"SELECT id, course, batch, status, start_date, deadline FROM elections "
+        f"WHERE id IN ({', '.join('?' * len(election_ids))})", election_ids)}
+
+    accepted = []
+    seen = set()
+    for i, (election_id, regno, picks, cast_at) in parsed.items():
+        election = elections.get(election_id)
+        student = students.get(regno)
+        selections = ballot_selections(get_ballot(db, election_id), picks) if election else None
+        # The ballot must have been cast while the election was taking votes, whenever it is uploaded
+        cast_minute = datetime.strptime(cast_at, TIMESTAMP_FORMAT).strftime(ELECTION_TIME_FORMAT)
+        if (election is None or election['status'] != 'open'
+                or not (election['start_date'] or '') <= cast_minute < (election['deadline'] or '9999')):
+            outcomes[i] = ('rejected', "Election is not open.")
+        elif student is None:
+            outcomes[i] = ('rejected', "Unknown student.")
+        elif ((election['course'] and election['course'].upper() != student['course'].upper())
+              or (election['batch'] and election['batch'] != student['batch'])):
+            outcomes[i] = ('rejected', "Student is not eligible for this election.")
+        elif selections is None:
+            outcomes[i] = ('rejected', "Make a valid choice of listed candidates for every position.")
+        elif (election_id, regno) in seen:
+            outcomes[i] = ('duplicate', None)
+        else:
+            seen.add((election_id, regno))
+            accepted.append((i, election_id, regno, selections, cast_at))
+
+    if accepted:
+        # One transaction and one fsync for the whole batch; record_ballot skips students who already voted
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            for i, election_id, regno, selections, cast_at in accepted:
+                recorded = record_ballot(db, election_id, regno, selections, cast_at)
+                outcomes[i] = ('recorded' if recorded else 'duplicate', None)
+            recorded = sum(1 for status, _ in outcomes if status == 'recorded')
+            insert_audit(db, [audit_record('Kiosk Sync', kiosk['id'], f"{recorded} of {len(ballots)} ballot(s) recorded",
+                                           target=kiosk['id'], remote_addr=request.remote_addr)])
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        tallies_changed()
+
+    results = []
+    for ballot, (status, error) in zip(ballots, outcomes):
+        result = {'id': ballot.get('id') if isinstance(ballot, dict) else None, 'status': status}
+        if error:
+            result['error'] = error
+        results.append(result)
+    counts = {status: sum(1 for r in results if r['status'] == status) for status in ('recorded', 'duplicate', 'rejected')}
+    return jsonify(kiosk=kiosk['id'], results=results, **counts)
 
 @app.route('/ballot_summary')
 @login_required
@@ -215,9 +964,9 @@ def ballot_summary():
         FROM ballots b
         JOIN candidates c ON b.candidate_id = c.id
         JOIN positions p ON c.position_id = p.id
-        WHERE b.student_regno = ?
-    """, (student,)).fetchall()
-    db.close()
+        WHERE b.election_id = ? AND b.student_regno = ?
+        ORDER BY b.position_id, b.rank
+    """, (current_election_id(), student)).fetchall()
 
     # Fixed template name here
     return render_template('ballot_summary.html', summary=summary)
@@ -228,72 +977,141 @@ def ballot_summary():
 @admin_required
 def admin_dashboard():
     db = get_db()
-    students = db.execute("SELECT * FROM students").fetchall()
-    total_voters = len(students)
-    voted = sum([1 for s in students if s['voted']])
     election = get_election_info()
-    db.close()
-    return render_template('dashboard.html', students=students, total=total_voters, voted=voted, election=election)
+    total, voted = 0, 0
+    if election is not None:
+        # Eligible voters are the students in the election's course/batch (everyone if unscoped)
+        total = eligible_voters(db, election['course'], election['batch'])
+        voted = db.execute("SELECT COUNT(*) FROM election_voters WHERE election_id = ?",
+                           (election['id'],)).fetchone()[0]
+    return render_template('dashboard.html', total=total, voted=voted, election=election)
+
+# Sortable columns of the voter table, in DataTables column order
+STUDENT_SORT_COLUMNS = ['s.regno', 's.name COLLATE NOCASE', 's.course COLLATE NOCASE', 's.batch COLLATE NOCASE', 'voted']
+STUDENT_PAGE_MAX = 100
+
+@app.route('/admin/api/students')
+@admin_required
+def admin_students_api():
+    """Server-side page of the voter table, in the DataTables serverSide request/response format."""
+    args = request.args
+    start = max(args.get('start', 0, type=int), 0)
+    length = min(max(args.get('length', 25, type=int), 1), STUDENT_PAGE_MAX)
+    search = args.get('search[value]', args.get('search', '')).strip()
+    column = args.get('order[0][column]', 0, type=int)
+    order_by = STUDENT_SORT_COLUMNS[column] if 0 <= column < len(STUDENT_SORT_COLUMNS) else 's.regno'
+    direction = 'DESC' if args.get('order[0][dir]') == 'desc' else 'ASC'
+
+    where, params = '', ()
+    if search:
+        # Prefix match so the NOCASE indexes can serve it
+        pattern = search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        where = ("WHERE s.regno LIKE ? ESCAPE '\\' OR s.name LIKE ? ESCAPE '\\' "
+                 "OR s.course LIKE ? ESCAPE '\\' OR s.batch LIKE ? ESCAPE '\\'")
+        params = (pattern,) * 4
+
+    db = get_db()
+    total = db.execute("SELECT COUNT(*) FROM students").fetchone()[0]
+    filtered = db.execute(f"SELECT COUNT(*) FROM students s {where}", params).fetchone()[0] if where else total
+    # "Voted" means voted in the election selected on the settings page
+    rows = db.execute(f"""
+        SELECT s.regno, s.name, s.course, s.batch, ev.regno IS NOT NULL AS voted
+        FROM students s
+        LEFT JOIN election_voters ev ON ev.election_id = ? AND ev.regno = s.regno
+        {where}
+        ORDER BY {order_by} {direction}, s.regno {direction}
+        LIMIT ? OFFSET ?
+    """, (current_election_id(),) + params + (length, start)).fetchall()
+
+    return jsonify({
+        'draw': args.get('draw', 0, type=int),
+        'recordsTotal': total,
+        'recordsFiltered': filtered,
+        'data': [dict(row) for row in rows],
+    })
 
 @app.route('/manage_positions', methods=['GET', 'POST'])
 @admin_required
 def manage_positions():
     db = get_db()
+    election_id = current_election_id()
     if request.method == 'POST':
         action = request.form.get('action')
         name = request.form.get('name')
         pos_id = request.form.get('id')
+        method = request.form.get('method', 'plurality')
+        seats = request.form.get('seats', '1')
+        if method not in METHODS or not seats.isdigit() or int(seats) < 1:
+            flash("Choose a counting method and at least one seat.")
+            return redirect(url_for('manage_positions'))
+        # An instant runoff elects one candidate; STV is its multi-seat form
+        seats = 1 if method == 'irv' else int(seats)
 
         if action == 'add' and name:
-            db.execute("INSERT INTO positions (name) VALUES (?)", (name,))
+            db.execute("INSERT INTO positions (election_id, name, method, seats) VALUES (?, ?, ?, ?)",
+                       (election_id, name, method, seats))
         elif action == 'edit' and name and pos_id:
-            db.execute("UPDATE positions SET name = ? WHERE id = ?", (name, pos_id))
+            # Ballots already cast were shaped by the old method, so it is fixed once voting starts
+            cast = db.execute("SELECT 1 FROM ballots WHERE election_id = ? AND position_id = ? LIMIT 1",
+                              (election_id, pos_id)).fetchone()
+            current = db.execute("SELECT method FROM positions WHERE id = ? AND election_id = ?",
+                                 (pos_id, election_id)).fetchone()
+            if cast and current and current['method'] != method:
+                flash("The counting method can't change once ballots have been cast for this position.")
+                return redirect(url_for('manage_positions'))
+            db.execute("UPDATE positions SET name = ?, method = ?, seats = ? WHERE id = ? AND election_id = ?",
+                       (name, method, seats, pos_id, election_id))
         elif action == 'delete' and pos_id:
-            db.execute("DELETE FROM positions WHERE id = ?", (pos_id,))
+            db.execute("DELETE FROM positions WHERE id = ? AND election_id = ?", (pos_id, election_id))
 
+        bump_version(db, 'ballot')
         db.commit()
-        db.close()
+        tallies_changed()
         return redirect(url_for('manage_positions'))
 
-    positions = db.execute("SELECT * FROM positions").fetchall()
-    db.close()
-    return render_template('positions.html', positions=positions)
+    positions = db.execute("SELECT * FROM positions WHERE election_id = ?", (election_id,)).fetchall()
+    return render_template('positions.html', positions=positions, methods=METHODS)
 
 @app.route('/manage_candidates', methods=['GET', 'POST'])
 @admin_required
 def manage_candidates():
     db = get_db()
+    election_id = current_election_id()
     if request.method == 'POST':
         action = request.form.get('action')
         student_regno = request.form.get('student_regno')
         pos_id = request.form.get('position_id')
         cand_id = request.form.get('id')
 
-        if action == 'add' and student_regno and pos_id:
+        position = pos_id and db.execute("SELECT id FROM positions WHERE id = ? AND election_id = ?",
+                                         (pos_id, election_id)).fetchone()
+        if action == 'add' and student_regno and position:
             student = db.execute("SELECT * FROM students WHERE regno = ?", (student_regno,)).fetchone()
             if student:
-                db.execute("INSERT INTO candidates (name, position_id, student_regno) VALUES (?, ?, ?)",
-                           (student['name'], pos_id, student_regno))
-        elif action == 'edit' and student_regno and pos_id and cand_id:
+                db.execute("INSERT INTO candidates (election_id, name, position_id, student_regno) VALUES (?, ?, ?, ?)",
+                           (election_id, student['name'], pos_id, student_regno))
+        elif action == 'edit' and student_regno and position and cand_id:
             student = db.execute("SELECT * FROM students WHERE regno = ?", (student_regno,)).fetchone()
             if student:
-                db.execute("UPDATE candidates SET name = ?, position_id = ?, student_regno = ? WHERE id = ?",
-                           (student['name'], pos_id, student_regno, cand_id))
+                db.execute("UPDATE candidates SET name = ?, position_id = ?, student_regno = ? "
+                           "WHERE id = ? AND election_id = ?",
+                           (student['name'], pos_id, student_regno, cand_id, election_id))
         elif action == 'delete' and cand_id:
-            db.execute("DELETE FROM candidates WHERE id = ?", (cand_id,))
+            db.execute("DELETE FROM candidates WHERE id = ? AND election_id = ?", (cand_id, election_id))
 
+        bump_version(db, 'ballot')
         db.commit()
-        db.close()
+        tallies_changed()
         return redirect(url_for('manage_candidates'))
 
-    positions = db.execute("SELECT * FROM positions").fetchall()
+    positions = db.execute("SELECT * FROM positions WHERE election_id = ?", (election_id,)).fetchall()
     candidates = db.execute("""
         SELECT c.*, p.name as position, s.avatar as avatar
         FROM candidates c
         JOIN positions p ON c.position_id = p.id
         LEFT JOIN students s ON s.regno = c.student_regno
-    """).fetchall()
-    db.close()
+        WHERE c.election_id = ?
+    """, (election_id,)).fetchall()
     return render_template('manage_candidates.html', positions=positions, candidates=candidates)
 
 
@@ -301,56 +1119,134 @@ def manage_candidates():
 @admin_required
 def election_settings():
     db = get_db()
+    election = get_election_info()
     if request.method == 'POST':
         title = request.form.get('title')
         start_date = request.form.get('start')
         deadline = request.form.get('deadline')
+        # Blank course/batch leaves the election open to everyone
+        course = request.form.get('course', '').strip().upper() or None
+        batch = request.form.get('batch', '').strip() or None
 
-        if title and start_date and deadline:
-            db.execute("UPDATE elections SET title = ?, start_date = ?, deadline = ? WHERE id = 1",
-                       (title, start_date, deadline))
+        if not (title and start_date and deadline):
+            flash('Please fill all fields.')
+        elif request.form.get('action') == 'create':
+            election_id = db.execute(
+                "INSERT INTO elections (title, start_date, deadline, course, batch) VALUES (?, ?, ?, ?, ?)",
+                (title, start_date, deadline, course, batch)).lastrowid
+            db.commit()
+            session['election_id'] = election_id
+            flash(f'Election "{title}" created. Add its positions and candidates next.')
+            return redirect(url_for('manage_positions'))
+        elif election is not None:
+            db.execute("UPDATE elections SET title = ?, start_date = ?, deadline = ?, course = ?, batch = ? WHERE id = ?",
+                       (title, start_date, deadline, course, batch, election['id']))
             db.commit()
-            db.close()
             flash('Election settings updated.')
             return redirect(url_for('admin_dashboard'))
-        else:
-            flash('Please fill all fields.')
 
-    election = get_election_info()
-    return render_template('election_settings.html', election=election)
+    elections = db.execute("SELECT id, title, course, batch, status FROM elections ORDER BY id DESC").fetchall()
+    return render_template('election_settings.html', election=election, elections=elections)
 
-@app.route('/results')
-@login_required
-def results():
+@app.route('/admin/elections/select', methods=['POST'])
+@admin_required
+def select_election():
+    election = get_election_info(request.form.get('election_id', type=int))
+    if election is None:
+        flash('Election not found.')
+    else:
+        session['election_id'] = election['id']
+    return redirect(request.referrer or url_for('admin_dashboard'))
+
+@app.route('/admin/elections/<int:election_id>/status', methods=['POST'])
+@admin_required
+def set_election_status(election_id):
+    status = request.form.get('status')
+    if status not in ('open', 'closed'):
+        flash('Unknown election status.')
+        return redirect(url_for('election_settings'))
     db = get_db()
-    data = db.execute("""
-    SELECT p.name as position, c.name as candidate, COUNT(b.id) as votes
-    FROM positions p
-    JOIN candidates c ON p.id = c.position_id
-    LEFT JOIN ballots b ON c.id = b.candidate_id AND b.position_id = p.id
-    GROUP BY p.id, c.id
-    ORDER BY p.id, votes DESC
-""").fetchall()
-
-
-    db.close()
+    db.execute("UPDATE elections SET status = ? WHERE id = ? AND status != 'archived'", (status, election_id))
+    db.commit()
+    log_audit_entry(
+        action='Election Status',
+        user=session.get('user'),
+        details=f"Election {election_id} {'reopened' if status == 'open' else 'closed'}",
+        timestamp=datetime.now(),
+        election_id=election_id
+    )
+    flash(f"Election {'reopened' if status == 'open' else 'closed'}.")
+    return redirect(url_for('election_settings'))
 
-    results_by_position = {}
-    for row in data:
-        pos = row['position']
-        if pos not in results_by_position:
-            results_by_position[pos] = []
-        results_by_position[pos].append({'candidate': row['candidate'], 'votes': row['votes']})
+@app.route('/admin/elections/<int:election_id>/archive', methods=['POST'])
+@admin_required
+def archive_election_route(election_id):
+    try:
+        moved = archive_election(DATABASE, election_id, app.config['ELECTION_ARCHIVE'])
+    except ValueError as e:
+        flash(str(e))
+        return redirect(url_for('election_settings'))
+    bump_version(get_db(), 'ballot')
+    get_db().commit()
+    tallies_changed()
+    if session.get('election_id') == election_id:
+        session.pop('election_id')
+    log_audit_entry(
+        action='Archive Election',
+        user=session.get('user'),
+        details=f"Election {election_id} archived to {app.config['ELECTION_ARCHIVE']} ({moved} ballot(s))",
+        timestamp=datetime.now(),
+        election_id=election_id,
+        sync=True
+    )
+    flash(f"Election archived: {moved} ballot(s) moved to {app.config['ELECTION_ARCHIVE']}.")
+    return redirect(url_for('election_settings'))
 
-    return render_template('results.html', results=results_by_position)
+@app.route('/results')
+@login_required
+def results():
+    return render_results('results.html')
 
 @app.route('/audit_log')
 @admin_required
 def audit_log():
     db = get_db()
-    logs = db.execute("SELECT * FROM audit_log ORDER BY timestamp DESC").fetchall()
-    db.close()
-    return render_template('audit_log.html', logs=logs)
+    clauses, params = audit_log_filters(request.args)
+
+    # Keyset pagination: ?before=<timestamp>|<id> continues after the last row of the previous page
+    before = request.args.get('before', '')
+    before_ts, _, before_id = before.rpartition('|')
+    if before_ts and before_id.isdigit():
+        clauses.append("(timestamp, id) < (?, ?)")
+        params += [before_ts, int(before_id)]
+
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    logs = db.execute(f"""
+        SELECT * FROM audit_log {where}
+        ORDER BY timestamp DESC, id DESC
+        LIMIT ?
+    """, params + [AUDIT_PAGE_SIZE + 1]).fetchall()
+
+    next_cursor = None
+    if len(logs) > AUDIT_PAGE_SIZE:
+        logs = logs[:AUDIT_PAGE_SIZE]
+        next_cursor = f"{logs[-1]['timestamp']}|{logs[-1]['id']}"
+
+    filters = {key: request.args[key] for key in ('user', 'action', 'from', 'to') if request.args.get(key)}
+    return render_template('audit_log.html', logs=logs, filters=filters, next_cursor=next_cursor,
+                           paged=bool(before))
+
+@app.route('/audit_log/export.<any(csv, jsonl):fmt>')
+@admin_required
+def export_audit_log(fmt):
+    """Stream the filtered audit log without loading it into memory."""
+    clauses, params = audit_log_filters(request.args)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    columns = ('id', 'timestamp', 'user', 'action', 'details', 'election_id', 'target', 'remote_addr')
+    return stream_export(f"""
+        SELECT {', '.join(columns)} FROM audit_log {where}
+        ORDER BY timestamp DESC, id DESC
+    """, params, columns, fmt, 'audit_log')
 
 @app.route('/admin/delete_vote/<int:vote_id>', methods=['GET', 'POST'])
 @admin_required
@@ -367,11 +1263,15 @@ def admin_delete_vote(vote_id):
             return redirect(request.url)
 
         delete_vote(vote_id)
+        tallies_changed()
         log_audit_entry(
             action='Delete Vote',
             user=session.get('user'),
             details=f"Deleted vote ID {vote_id}. Remark: {remark}",
-            timestamp=datetime.now()
+            timestamp=datetime.now(),
+            election_id=vote['election_id'],
+            target=vote['student_regno'],
+            sync=True
         )
         flash('Vote deleted successfully.')
         return redirect(url_for('admin_dashboard'))
@@ -391,30 +1291,41 @@ def add_student():
             return redirect(url_for('add_student'))
 
         db = get_db()
-        prefix = f"{course.upper()}{batch}_"
-        last = db.execute("SELECT regno FROM students WHERE regno LIKE ? ORDER BY regno DESC LIMIT 1", (prefix + '%',)).fetchone()
-        if last:
-            try:
-                last_num = int(last['regno'].split('_')[-1])
-                next_num = last_num + 1
-            except:
-                next_num = 1001
-        else:
-            next_num = 1001
-
-        new_regno = f"{prefix}{next_num}"
-        default_pw_hash = generate_password_hash("voter123")
+        default_pw_hash = hash_password(DEFAULT_PASSWORD)
+        prefix = regno_prefix(course, batch)
 
+        db.execute("BEGIN IMMEDIATE")
+        new_regno = f"{prefix}{allocate_regnos(db, prefix, 1)[0]}"
         db.execute("INSERT INTO students (regno, name, course, batch, password, voted) VALUES (?, ?, ?, ?, ?, 0)",
                    (new_regno, name, course, batch, default_pw_hash))
         db.commit()
-        db.close()
 
         flash(f"Student '{name}' added with Reg No: {new_regno} and default password 'voter123'.")
         return redirect(url_for('admin_dashboard'))
 
     return render_template('add_student.html')
 
+@app.route('/admin/import_students', methods=['GET', 'POST'])
+@admin_required
+def import_students():
+    report = None
+    if request.method == 'POST':
+        upload = request.files.get('roster')
+        if not upload or not upload.filename:
+            flash("Choose a CSV or XLSX file to import.")
+            return redirect(url_for('import_students'))
+
+        report = import_roster(get_db(), read_roster(upload.stream, upload.filename),
+                               method=app.config['PASSWORD_HASH_METHOD'], processes=False)
+        log_audit_entry(
+            action='Import Students',
+            user=session.get('user'),
+            details=f"Imported {report.imported} student(s) from {secure_filename(upload.filename)}; "
+                    f"{report.failed} row(s) rejected",
+            timestamp=datetime.now()
+        )
+    return render_template('import_students.html', report=report, default_password=DEFAULT_PASSWORD)
+
 
 @app.route('/edit_student/<regno>', methods=['GET', 'POST'])
 @admin_required
@@ -434,11 +1345,9 @@ def edit_student(regno):
             db.execute("UPDATE students SET name = ?, course = ?, batch = ? WHERE regno = ?",
                        (name, course, batch, regno))
             db.commit()
-            db.close()
             flash("Student updated.")
             return redirect(url_for('admin_dashboard'))
 
-    db.close()
     return render_template('edit_student.html', student=student)
 
 
@@ -448,7 +1357,6 @@ def delete_student(regno):
     db = get_db()
     db.execute("DELETE FROM students WHERE regno = ?", (regno,))
     db.commit()
-    db.close()
     flash(f"Deleted student: {regno}")
     return redirect(url_for('admin_dashboard'))
 
@@ -456,16 +1364,23 @@ def delete_student(regno):
 @admin_required
 def reset_vote(regno):
     db = get_db()
+    election_id = current_election_id()
 
-    db.execute("DELETE FROM ballots WHERE student_regno = ?", (regno,))
-    db.execute("UPDATE students SET voted = 0 WHERE regno = ?", (regno,))
+    remove_tallies(db, 'election_id = ? AND student_regno = ?', (election_id, regno))
+    remove_turnout(db, election_id, regno)
+    db.execute("DELETE FROM ballots WHERE election_id = ? AND student_regno = ?", (election_id, regno))
+    db.execute("DELETE FROM election_voters WHERE election_id = ? AND regno = ?", (election_id, regno))
     db.commit()
+    tallies_changed()
 
     log_audit_entry(
         action="Reset Vote",
         user=session.get("user"),
-        details=f"Vote reset for student: {regno}",
-        timestamp=datetime.now()
+        details=f"Vote reset for student: {regno} (election {election_id})",
+        timestamp=datetime.now(),
+        election_id=election_id,
+        target=regno,
+        sync=True
     )
 
     flash(f"Vote reset for {regno}.")
@@ -476,76 +1391,128 @@ def reset_vote(regno):
 @admin_required
 def admin_votes():
     db = get_db()
+    election_id = current_election_id()
 
     # Fetch vote count per candidate (only for existing candidates with valid positions)
     vote_data = db.execute("""
-        SELECT p.name AS position, c.name AS candidate, COUNT(b.id) AS votes
+        SELECT p.name AS position, c.id AS candidate_id, c.name AS candidate, COALESCE(t.votes, 0) AS votes
         FROM candidates c
         JOIN positions p ON c.position_id = p.id
-        LEFT JOIN ballots b ON c.id = b.candidate_id
-        GROUP BY c.id
+        LEFT JOIN tallies t ON t.election_id = c.election_id AND t.candidate_id = c.id AND t.position_id = p.id
+        WHERE c.election_id = ?
         ORDER BY p.name, votes DESC
-    """).fetchall()
-
-    # Fetch individual ballots — only those where candidate still exists
-    ballots = db.execute("""
-        SELECT b.id, b.student_regno, c.name as candidate, p.name as position, b.timestamp
+    """, (election_id,)).fetchall()
+
+    # Fetch individual ballots — only those where candidate still exists. Called from the
+    # template, so a cached ballot table skips the query too.
+    def ballots():
+        return db.execute("""
+            SELECT b.id, b.student_regno, c.name as candidate, p.name as position, b.timestamp
+            FROM ballots b
+            JOIN candidates c ON b.candidate_id = c.id
+            JOIN positions p ON b.position_id = p.id
+            WHERE b.election_id = ?
+            ORDER BY b.timestamp DESC
+        """, (election_id,)).fetchall()
+
+    # Every ballot written or removed bumps the tallies version; edits to names bump the ballot version
+    layout = get_version(db, 'ballot')
+    return render_template('admin_votes.html', vote_data=vote_data, ballots=ballots, layout=layout,
+                           ballots_key=(election_id, layout, get_version(db, 'tallies')))
+
+@app.route('/admin/turnout')
+@admin_required
+def admin_turnout():
+    election = get_election_info()
+    report = turnout_report(get_db(), election) if election is not None else None
+    if request.args.get('format') == 'json':
+        response = jsonify(report)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    return render_template('turnout.html', election=election, report=report,
+                           refresh=app.config['TURNOUT_REFRESH'])
+
+@app.route('/admin/export/turnout.<any(csv, jsonl):fmt>')
+@admin_required
+def export_turnout(fmt):
+    # The per-minute rollup itself, for sizing the next election's servers
+    return stream_export("""
+        SELECT minute, course, batch, votes FROM turnout_minutes
+        WHERE election_id = ? AND votes > 0
+        ORDER BY minute
+    """, (current_election_id(),), ('minute', 'course', 'batch', 'votes'), fmt, 'turnout')
+
+@app.route('/admin/export/results.<any(csv, jsonl, pdf):fmt>')
+@admin_required
+def export_results(fmt):
+    query = """
+        SELECT p.id AS position_id, p.name AS position, c.id AS candidate_id, c.name AS candidate,
+               COALESCE(t.votes, 0) AS votes
+        FROM positions p
+        JOIN candidates c ON c.election_id = p.election_id AND c.position_id = p.id
+        LEFT JOIN tallies t ON t.election_id = p.election_id AND t.candidate_id = c.id AND t.position_id = p.id
+        WHERE p.election_id = ?
+        ORDER BY p.id, votes DESC, c.id
+    """
+    election = get_election_info()
+    params = (election['id'] if election else None,)
+    if fmt != 'pdf':
+        return stream_export(query, params, ('position_id', 'position', 'candidate_id', 'candidate', 'votes'),
+                             fmt, 'results')
+    try:
+        pdf = results_certificates(election, get_db().execute(query, params))
+    except ImportError:
+        flash("PDF export needs the fpdf package.")
+        return redirect(url_for('admin_votes'))
+    return Response(pdf, mimetype='application/pdf',
+                    headers={'Content-Disposition': 'attachment; filename=results.pdf'})
+
+@app.route('/admin/export/ballots.<any(csv, jsonl):fmt>')
+@admin_required
+def export_ballots(fmt):
+    return stream_export("""
+        SELECT b.id, b.student_regno, p.name AS position, c.name AS candidate, b.timestamp
         FROM ballots b
         JOIN candidates c ON b.candidate_id = c.id
         JOIN positions p ON b.position_id = p.id
-        ORDER BY b.timestamp DESC
-    """).fetchall()
+        WHERE b.election_id = ?
+        ORDER BY b.id
+    """, (current_election_id(),), ('id', 'student_regno', 'position', 'candidate', 'timestamp'), fmt, 'ballots')
 
-    db.close()
-
-    return render_template('admin_votes.html', vote_data=vote_data, ballots=ballots)
+@app.route('/admin/export/roster.<any(csv, jsonl):fmt>')
+@admin_required
+def export_roster(fmt):
+    return stream_export("""
+        SELECT s.regno, s.name, s.course, s.batch, ev.regno IS NOT NULL AS voted
+        FROM students s
+        LEFT JOIN election_voters ev ON ev.election_id = ? AND ev.regno = s.regno
+        ORDER BY s.regno
+    """, (current_election_id(),), ('regno', 'name', 'course', 'batch', 'voted'), fmt, 'voter_list')
 
 @app.route('/live_vote_count')
 @login_required
 def live_vote_count():
-    db = get_db()
-    data = db.execute("""
-        SELECT p.name as position, c.name as candidate, COUNT(b.id) as votes
-        FROM positions p
-        JOIN candidates c ON p.id = c.position_id
-        LEFT JOIN ballots b ON c.id = b.candidate_id AND b.position_id = p.id
-        GROUP BY p.id, c.id
-        ORDER BY p.id, votes DESC
-    """).fetchall()
-    db.close()
-
-    results_by_position = {}
-    for row in data:
-        pos = row['position']
-        if pos not in results_by_position:
-            results_by_position[pos] = []
-        results_by_position[pos].append({'candidate': row['candidate'], 'votes': row['votes']})
-
-    return render_template('live_vote_count.html', results=results_by_position)
+    return render_results('live_vote_count.html')
 
 @app.route('/student/live_vote_count')
 @login_required
 def student_live_vote_count():
-    db = get_db()
-    data = db.execute("""
-        SELECT p.name as position, c.name as candidate, COUNT(b.id) as votes
-        FROM positions p
-        LEFT JOIN candidates c ON p.id = c.position_id
-        LEFT JOIN ballots b ON c.id = b.candidate_id AND b.position_id = p.id
-        GROUP BY p.id, c.id
-        ORDER BY p.id, votes DESC
-    """).fetchall()
-    db.close()
+    return render_results('live_vote_count.html', include_empty=True)
 
-    # Structure data grouped by position for template
-    results_by_position = {}
-    for row in data:
-        pos = row['position']
-        if pos not in results_by_position:
-            results_by_position[pos] = []
-        results_by_position[pos].append({'candidate': row['candidate'], 'votes': row['votes']})
+@app.route('/stream/tallies')
+@login_required
+def stream_tallies():
+    return Response(stream_with_context(tally_broadcaster.stream(current_election_id())), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
-    return render_template('live_vote_count.html', results=results_by_position)
+@app.route('/api/tallies')
+@login_required
+def poll_tallies():
+    """What a live-count page polling from sequence `since` has missed; see TallyBroadcaster.poll()."""
+    update = tally_broadcaster.poll(current_election_id(), request.args.get('since', type=int))
+    if update is None:
+        return jsonify(error="Live counts are not available yet."), 503, {'Retry-After': '5'}
+    return jsonify(update), 200, {'Cache-Control': 'no-store'}
 
 @app.route('/student/profile')
 @student_required
@@ -566,14 +1533,18 @@ def change_password():
     db = get_db()
     user = db.execute("SELECT * FROM students WHERE regno = ?", (session['user'],)).fetchone()
 
-    if not check_password_hash(user['password'], old):
-        flash("Current password is incorrect.")
+    hasher = get_password_hasher()
+    try:
+        if not hasher.verify(user['password'], old):
+            flash("Current password is incorrect.")
+            return redirect(url_for('student_profile'))
+        hashed_new = hasher.hash(new)
+    except LoginBusy:
+        flash("Too many sign-ins right now. Please try again in a moment.")
         return redirect(url_for('student_profile'))
-
-    hashed_new = generate_password_hash(new)
     db.execute("UPDATE students SET password = ? WHERE regno = ?", (hashed_new, session['user']))
     db.commit()
-    db.close()
+    session_store.revoke(user=session['user'], keep=session.sid)
 
     flash("Password updated successfully.")
     return redirect(url_for('student_profile'))
@@ -581,15 +1552,108 @@ def change_password():
 @app.route('/admin/reset_password/<regno>', methods=['POST'])
 @admin_required
 def admin_reset_password(regno):
-    from werkzeug.security import generate_password_hash
 
     db = get_db()
-    db.execute("UPDATE students SET password = ? WHERE regno = ?", (generate_password_hash("voter123"), regno))
+    db.execute("UPDATE students SET password = ? WHERE regno = ?", (hash_password(DEFAULT_PASSWORD), regno))
     db.commit()
-    db.close()
+    session_store.revoke(user=regno)
 
     flash(f"Password for {regno} has been reset to default ('voter123').")
     return redirect(url_for('admin_dashboard'))
+
+@app.route('/admin/sessions/revoke', methods=['POST'])
+@admin_required
+def revoke_sessions():
+    # 'students' signs every voter out; 'all' also signs out other admins, but never this one
+    scope = request.form.get('scope', 'students')
+    if scope == 'all':
+        revoked = session_store.revoke(keep=session.sid)
+    else:
+        revoked = session_store.revoke(role='student')
+
+    log_audit_entry(
+        action='Revoke Sessions',
+        user=session.get('user'),
+        details=f"Signed out {revoked} session(s) ({'everyone else' if scope == 'all' else 'all students'})",
+        timestamp=datetime.now()
+    )
+    flash(f"Signed out {revoked} session(s).")
+    return redirect(url_for('admin_dashboard'))
+
+@app.route('/admin/metrics')
+def admin_metrics():
+    # Admins see the page; scrapers holding METRICS_TOKEN get Prometheus text without a session
+    token = app.config['METRICS_TOKEN']
+    scraper = bool(token) and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not scraper and session.get('role') != 'admin':
+        flash('Admin access required.')
+        return redirect(url_for('login'))
+
+    fmt = request.args.get('format')
+    if fmt is None:
+        fmt = 'prometheus' if scraper or request.accept_mimetypes.best_match(
+            ['text/html', 'text/plain']) == 'text/plain' else 'html'
+    if fmt == 'prometheus':
+        return Response(metrics.prometheus(), mimetype='text/plain; version=0.0.4')
+    endpoints, statements = metrics.summary()
+    if fmt == 'json':
+        return jsonify(pid=os.getpid(), since=metrics.since, endpoints=endpoints, statements=statements,
+                       profiler={'enabled': request_profiler.enabled, 'profiles': [
+                           {k: v for k, v in p.items() if k != 'report'} for p in request_profiler.profiles()]})
+    return render_template('metrics.html', endpoints=endpoints, statements=statements, pid=os.getpid(),
+                           since=datetime.fromtimestamp(metrics.since).strftime(TIMESTAMP_FORMAT),
+                           profiler=request_profiler, profiles=request_profiler.profiles())
+
+@app.route('/admin/metrics/profiler', methods=['POST'])
+@admin_required
+def toggle_profiler():
+    # Metrics and profiles live in each worker process, so this affects the worker that serves it
+    action = request.form.get('action')
+    if action == 'enable':
+        request_profiler.enabled = True
+        flash(f"Profiling {request_profiler.sample_rate:.0%} of requests; keeping the slowest {request_profiler.keep}.")
+    elif action == 'disable':
+        request_profiler.enabled = False
+        flash("Profiling stopped.")
+    elif action == 'clear':
+        request_profiler.clear()
+        flash("Captured profiles cleared.")
+    elif action == 'reset':
+        metrics.reset()
+        flash("Metrics reset.")
+    return redirect(url_for('admin_metrics'))
+
+@app.route('/admin/metrics/profiles/<int:profile_id>')
+@admin_required
+def request_profile(profile_id):
+    profile = request_profiler.get(profile_id)
+    if profile is None:
+        flash("That profile is no longer kept.")
+        return redirect(url_for('admin_metrics'))
+    header = f"{profile['endpoint']} {profile['path']} took {profile['ms']:.1f} ms at {profile['captured']}\n\n"
+    return Response(header + profile['report'], mimetype='text/plain')
+@app.route('/admin/ledger/verify', methods=['GET', 'POST'])
+@admin_required
+def ledger_verify():
+    """The latest verification report; POST queues a new run on this worker's ledger sealer.
+
+    Incremental by default (only blocks sealed or modified since the last verification are
+    re-hashed); full=1 re-hashes everything. Poll with GET until the report's `id` moves on.
+    """
+    if request.method == 'POST':
+        ledger_sealer.verify_soon(full=request.values.get('full') == '1', requested_by=session.get('user'))
+        return jsonify(queued=True, last=last_ledger_report(get_db())), 202
+    report = last_ledger_report(get_db())
+    if report is None:
+        return jsonify(error="The ledger has not been verified yet; POST here to start a run."), 404
+    return jsonify(report), 200 if report['ok'] else 409
+
+def audit_ledger_report(db, report):
+    # Called on the sealer thread, inside the transaction that records the report
+    if not report['ok']:
+        insert_audit(db, [audit_record('Ledger Verification Failed', report['requested_by'] or 'system',
+                                       '; '.join(report['problems'])[:1000], report['finished'])])
+
 @app.route('/upload_avatar', methods=['POST'])
 def upload_avatar():
     if 'avatar' in request.files:
@@ -599,16 +1663,204 @@ def upload_avatar():
         filepath = os.path.join('static/uploads/avatars', filename)
         file.save(filepath)
 
-        # Update session (and DB if needed)
-        session['avatar'] = f'uploads/avatars/{filename}'
+        db = get_db()
+        db.execute("UPDATE students SET avatar = ? WHERE regno = ?",
+                   (f'uploads/avatars/{filename}', session.get('user')))
+        if db.execute("SELECT 1 FROM candidates WHERE student_regno = ? LIMIT 1", (session.get('user'),)).fetchone():
+            # The ballot shows candidates' photos, so cached ballots must pick up the new one
+            bump_version(db, 'ballot')
+        db.commit()
 
         flash('Avatar updated successfully.')
     return redirect(url_for('student_profile'))
 
+@app.cli.command('rebuild-tallies')
+def rebuild_tallies_command():
+    """Recount the tallies table from the ballots table."""
+    from schema import rebuild_tallies
+    db = get_db()
+    rebuild_tallies(db)
+    bump_version(db, 'tallies')
+    db.commit()
+    print("Tallies rebuilt from ballots.")
+
+@app.cli.command('migrate')
+def migrate_command():
+    """Apply pending schema migrations."""
+    from schema import migrate
+    print(f"Applied {migrate(DATABASE)} migration(s).")
+
+@app.cli.command('check-plans')
+def check_plans_command():
+    """Fail if any hot-path query no longer uses an index."""
+    from schema import check_query_plans
+    problems = check_query_plans(get_db())
+    for name, detail in problems:
+        print(f"{name}: {detail}")
+    if problems:
+        raise SystemExit(1)
+    print("All hot queries use an index.")
+
+@app.cli.command('archive-election')
+@click.argument('election_id', type=int)
+@click.option('--to', 'archive_path', default=None, help='Archive database file (default: ELECTION_ARCHIVE).')
+def archive_election_command(election_id, archive_path):
+    """Move a closed election's ballots and tallies into the archive database."""
+    archive_path = archive_path or app.config['ELECTION_ARCHIVE']
+    moved = archive_election(DATABASE, election_id, archive_path)
+    db = get_db()
+    bump_version(db, 'ballot')
+    db.commit()
+    print(f"Archived election {election_id}: {moved} ballot(s) moved to {archive_path}.")
+
+@app.cli.command('verify-ledger')
+@click.option('--full', is_flag=True, help='Re-hash every block, not just those changed since the last run.')
+def verify_ledger_command(full):
+    """Check the ballot and audit hash chain and its Merkle checkpoints; exits 1 if tampered with."""
+    db = get_db()
+    report = record_report(db, verify_ledger(db, full=full))
+    audit_ledger_report(db, report)
+    db.commit()
+    for problem in report['problems']:
+        print(problem)
+    print(f"{'OK' if report['ok'] else 'FAILED'}: checked {report['blocks_checked']} of "
+          f"{report['blocks_sealed']} block(s), {report['entries_checked']} of {report['entries_total']} "
+          f"entries, in {report['elapsed_ms']} ms.")
+    if not report['ok']:
+        raise SystemExit(1)
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """Fingerprint and pre-compress static files and bundle the icons into one sprite."""
+    manifest = build_assets(app.static_folder)
+    sprited = sum(1 for built in manifest.values() if '#' in built)
+    print(f"Built {len(manifest) - sprited} asset(s) and a sprite of {sprited} icon(s) into "
+          f"{os.path.join(app.static_folder, BUILD_DIR)}. Restart the app to serve them.")
+
+@app.cli.command('compile-templates')
+def compile_templates_command():
+    """Compile every template into the bytecode cache, so new workers start with it warm."""
+    if app.jinja_env.bytecode_cache is None:
+        print("TEMPLATE_BYTECODE_CACHE is off; nothing to do.")
+        return
+    names = app.jinja_env.list_templates()
+    for name in names:
+        app.jinja_env.get_template(name)
+    print(f"Compiled {len(names)} template(s) into {app.jinja_env.bytecode_cache.directory}.")
+
+@app.cli.command('add-kiosk')
+@click.argument('name')
+def add_kiosk_command(name):
+    """Register a polling-station kiosk and print its id and signing secret."""
+    db = get_db()
+    kiosk_id, secret = create_kiosk(db, name)
+    db.commit()
+    print(f"Kiosk {kiosk_id} ({name})\nSecret: {secret}\nThe secret is not shown again; configure it on the kiosk now.")
+
+@app.cli.command('revoke-kiosk')
+@click.argument('kiosk_id')
+def revoke_kiosk_command(kiosk_id):
+    """Stop accepting ballots signed by a kiosk."""
+    db = get_db()
+    revoked = db.execute("UPDATE kiosks SET active = 0 WHERE id = ?", (kiosk_id,)).rowcount
+    db.commit()
+    print(f"Kiosk {kiosk_id} revoked." if revoked else f"No kiosk {kiosk_id}.")
+
+@app.cli.command('import-students')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--workers', type=int, default=None, help='Password hashing processes (default: CPU count).')
+def import_students_command(path, workers):
+    """Bulk-import students from a CSV or XLSX roster with name, course and batch columns."""
+    with open(path, 'rb') as stream:
+        report = import_roster(get_db(), read_roster(stream, path), workers=workers,
+                               method=app.config['PASSWORD_HASH_METHOD'])
+    for line, message in report.errors:
+        print(f"line {line}: {message}")
+    rate = report.imported / report.elapsed if report.elapsed else 0
+    print(f"Imported {report.imported} student(s), rejected {report.failed}, "
+          f"in {report.elapsed:.1f}s ({rate:,.0f} rows/sec).")
+
+# ----------- App factory -----------
+
+def configure_app():
+    """(Re)build the per-process helpers that read app.config. Builds nothing that starts a thread
+    or opens the database, so the app can be imported, and a gunicorn master can fork, freely."""
+    global DATABASE, session_store, audit_writer, ledger_sealer, tally_broadcaster
+    global _db_local, _vote_writer, _password_hasher, _tally_version
+    flush_audit_log()
+    # Pooled connections, cached ballots and results, and lazy helpers all belong to the previous config
+    conn = getattr(_db_local, 'conn', None)
+    if conn is not None:
+        conn.close()
+    _db_local = threading.local()  # other threads' pooled connections are dropped with it
+    _ballot_cache.clear()
+    _results_cache.clear()
+    _tabulation_cache.clear()
+    _tally_version = (None, 0.0, None)
+    _vote_writer = _password_hasher = None
+    DATABASE = app.config['DATABASE']
+    request_profiler.keep = app.config['PROFILE_KEEP']
+    request_profiler.sample_rate = app.config['PROFILE_SAMPLE_RATE']
+    request_profiler.enabled = app.config['PROFILE_REQUESTS']
+    tally_broadcaster = TallyBroadcaster(connect_db, max_streams=app.config['LIVE_TALLIES_STREAMS'])
+    if app.config['SESSION_BACKEND'] == 'memory':
+        session_store = MemorySessionStore()
+    else:
+        session_store = SqliteSessionStore(connect_db, cache_ttl=app.config['SESSION_CACHE_TTL'])
+    app.session_interface = ServerSessionInterface(session_store)
+    audit_writer = AuditWriter(connect_db, app.config['AUDIT_SPILL'], batch_size=app.config['AUDIT_BATCH_SIZE'],
+                               max_latency=app.config['AUDIT_BATCH_LATENCY'])
+    ledger_sealer = LedgerSealer(connect_db, interval=app.config['LEDGER_SEAL_INTERVAL'], on_report=audit_ledger_report)
+    app.jinja_env.fragment_cache = (FragmentCache(app.config['FRAGMENT_CACHE_SIZE'])
+                                    if app.config['FRAGMENT_CACHE_SIZE'] else None)
+    app.jinja_env.bytecode_cache = None
+    if app.config['TEMPLATE_BYTECODE_CACHE']:
+        # Keyed by each template's source checksum, so an edited template is simply recompiled
+        directory = os.path.join(app.root_path, app.config['TEMPLATE_BYTECODE_CACHE'])
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except OSError:
+            pass  # read-only install: templates compile in each process instead
+        else:
+            app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+
+configure_app()
+
+def warm_caches():
+    """Build the ballot and results caches of every election not archived, and load every template.
+
+    Uses its own connection and closes it, so nothing database-bound is left for forked workers to share.
+    """
+    conn = connect_db()
+    try:
+        version = read_tally_version(conn)
+        elections = [row['id'] for row in conn.execute("SELECT id FROM elections WHERE status != 'archived'")]
+        for election_id in elections:
+            get_ballot(conn, election_id)
+            for include_empty in (False, True):
+                _results_cache[(election_id, include_empty)] = (version, get_results(conn, election_id, include_empty))
+    finally:
+        conn.close()
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    return len(elections)
+
+def create_app(config=None):
+    """Return the app set up for serving: environment config plus `config`, a ready database and warm caches.
+
+    gunicorn.conf.py preloads it once in the master, so every forked worker starts with the schema
+    checked and the caches built, shared copy-on-write. A bare `import app` skips all of this and
+    checks the schema on its first connection instead.
+    """
+    if config:
+        app.config.update(config)
+        configure_app()
+    init_database()
+    if app.config['WARM_CACHES']:
+        warm_caches()
+    return app
+
 # ----------- Main -----------
 
 if __name__ == '__main__':
-    if not os.path.exists(DATABASE):
-        from schema import create_schema
-        create_schema()
-    app.run(debug=True)
+    create_app().run(debug=True)
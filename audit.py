@@ -0,0 +1,206 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from collections import namedtuple
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows dev servers: one process, so the in-process lock is enough
+    fcntl = None
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# uid makes a record idempotent: a spill file replayed twice (crash between commit and
+# truncate) inserts each record once
+AuditRecord = namedtuple('AuditRecord', 'uid timestamp user action details election_id target remote_addr')
+AUDIT_COLUMNS = AuditRecord._fields
+
+
+def audit_record(action, user, details=None, timestamp=None, election_id=None, target=None, remote_addr=None):
+    """Build a record with a fresh uid and its timestamp normalised to TIMESTAMP_FORMAT."""
+    if timestamp is None:
+        timestamp = datetime.now()
+    elif isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    return AuditRecord(uuid.uuid4().hex, timestamp.strftime(TIMESTAMP_FORMAT), user or 'anonymous', action,
+                       details, election_id, None if target is None else str(target), remote_addr)
+
+
+def insert_audit(conn, records):
+    """Insert records inside the caller's transaction (no commit)."""
+    conn.executemany(f"INSERT OR IGNORE INTO audit_log ({', '.join(AUDIT_COLUMNS)}) "
+                     f"VALUES ({', '.join('?' * len(AUDIT_COLUMNS))})", records)
+
+
+class AuditUnavailable(Exception):
+    """Raised by log(sync=True) when the record could not be made durable in time."""
+
+
+def _parse_spilled(line):
+    try:
+        return AuditRecord(**json.loads(line))
+    except (ValueError, TypeError):
+        return None  # blank, or torn by a crash mid-append
+
+
+class _Pending:
+    __slots__ = ('record', 'done', 'failed')
+
+    def __init__(self, record, done=None):
+        self.record = record
+        self.done = done
+        self.failed = False
+
+
+class AuditWriter:
+    """Buffer audit records in memory and write them in batches from a background thread.
+
+    log() returns once the record is queued; log(sync=True) waits until it is durable, in the
+    database or the spill file. The flusher commits up to `batch_size` records per
+    transaction, waiting at most `max_latency` for more. When the database stays locked past
+    `busy_timeout` (or the buffer of `max_buffer` records is full) records are appended to
+    the JSONL `spill_path` instead, and replayed into audit_log after the next successful
+    flush. The spill file is shared by every worker process, guarded by flock.
+
+    If the spill fails too (disk full, say) the records are counted in `lost` and the
+    flusher carries on; sync callers get AuditUnavailable, as they do after waiting
+    `sync_timeout` seconds, so they can write the record some other way.
+    """
+
+    def __init__(self, connect, spill_path, batch_size=500, max_latency=0.2, max_buffer=10000, busy_timeout=0.5,
+                 sync_timeout=5.0):
+        self.connect = connect
+        self.spill_path = spill_path
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.busy_timeout = busy_timeout
+        self.sync_timeout = sync_timeout
+        self._queue = queue.Queue(max_buffer)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self.spilled = 0
+        self.lost = 0
+
+    def log(self, record, sync=False):
+        self._ensure_started()
+        item = _Pending(record, threading.Event() if sync else None)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            # Never drop or block on an audit record: the spill file is durable too
+            if not self._spill_or_count([record]) and sync:
+                raise AuditUnavailable()
+            return
+        if sync and (not item.done.wait(self.sync_timeout) or item.failed):
+            raise AuditUnavailable()
+
+    def flush(self, timeout=5.0):
+        """Block until everything queued before this call is written; for shutdown and tests."""
+        if self._thread is None:
+            return
+        marker = _Pending(None, threading.Event())
+        self._queue.put(marker)
+        marker.done.wait(timeout)
+
+    def _ensure_started(self):
+        # Started lazily so each forked gunicorn worker gets its own flusher thread
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+                    self._thread.start()
+
+    def _open(self):
+        conn = self.connect()
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout * 1000)}")
+        # Batching amortises the fsync, so audit rows can afford full durability
+        conn.execute("PRAGMA synchronous = FULL")
+        self._replay(conn)
+        return conn
+
+    def _run(self):
+        conn = None
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_latency
+            while len(batch) < self.batch_size and batch[-1].record is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            records = [item.record for item in batch if item.record is not None]
+            durable = True
+            if records:
+                try:
+                    if conn is None:
+                        conn = self._open()
+                    written = self._write(conn, records)
+                except Exception:
+                    # Could not connect (or worse): spill, and reconnect for the next batch
+                    written, conn = False, None
+                if not written:
+                    durable = self._spill_or_count(records)
+                else:
+                    try:
+                        self._replay(conn)
+                    except Exception:
+                        conn = None  # the spill stays put for the next successful flush
+            for item in batch:
+                if item.done is not None:
+                    item.failed = not durable
+                    item.done.set()
+
+    def _write(self, conn, records):
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            insert_audit(conn, records)
+            conn.commit()
+            return True
+        except sqlite3.Error:
+            # Busy past busy_timeout (or worse): the caller spills rather than lose records
+            if conn.in_transaction:
+                conn.rollback()
+            return False
+
+    def _spill_or_count(self, records):
+        try:
+            self.spill(records)
+            return True
+        except Exception:
+            self.lost += len(records)
+            return False
+
+    def spill(self, records):
+        lines = ''.join(json.dumps(record._asdict(), separators=(',', ':')) + '\n' for record in records)
+        with self._spill_lock:
+            with open(self.spill_path, 'a', encoding='utf-8') as f:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+            self.spilled += len(records)
+
+    def _replay(self, conn):
+        try:
+            if os.path.getsize(self.spill_path) == 0:
+                return
+        except OSError:
+            return
+        with self._spill_lock:
+            with open(self.spill_path, 'r+', encoding='utf-8') as f:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                records = [record for record in map(_parse_spilled, f) if record is not None]
+                if records and not self._write(conn, records):
+                    return  # still busy; the next successful flush tries again
+                f.truncate(0)
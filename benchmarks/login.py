@@ -0,0 +1,119 @@
+"""Login latency under a burst of concurrent sign-ins.
+
+Usage: python benchmarks/login.py [--users 400] [--concurrency 32] [--method pbkdf2:sha256:600000]
+                                  [--workers N] [--max-pending N] [--queue-timeout 2.0]
+                                  [--stored-method M] [--repeat 1] [--dir PATH]
+
+Seeds a database with --users students hashed with --method, then POSTs /login
+through the Flask test client from --concurrency threads and reports p50/p99
+latency, throughput and how many attempts were shed with a 503. --repeat > 1
+signs every student in again, which exercises the verified-credential cache.
+Pass --stored-method to seed with an older policy and measure the rehash-on-login
+path.
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import generate_password_hash
+
+from submit_vote import seed as seed_election
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+PASSWORD = 'bench-password'
+
+
+def seed(path, users, method):
+    seed_election(path, 0, 1, 2)
+    conn = sqlite3.connect(path)
+    # Every row gets its own salt, as real accounts would
+    conn.executemany("INSERT INTO students (regno, name, course, batch, password) VALUES (?, ?, 'BENCH', '2025', ?)",
+                     [(f'BENCH_{i}', f'Voter {i}', generate_password_hash(PASSWORD, method=method))
+                      for i in range(users)])
+    conn.commit()
+    conn.close()
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run(workdir, args):
+    path = os.path.join(workdir, 'database.db')
+    seed(path, args.users, args.stored_method or args.method)
+    import app as voting
+    voting.DATABASE = path
+    voting.app.config.update(TESTING=True, PASSWORD_HASH_METHOD=args.method,
+                             LOGIN_HASH_WORKERS=args.workers, LOGIN_MAX_PENDING=args.max_pending,
+                             LOGIN_QUEUE_TIMEOUT=args.queue_timeout)
+    local = threading.local()
+
+    def login(regno):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = voting.app.test_client()
+        started = time.perf_counter()
+        response = client.post('/login', data={'regno': regno, 'password': PASSWORD})
+        elapsed = time.perf_counter() - started
+        with client.session_transaction() as sess:
+            sess.clear()
+        assert response.status_code in (302, 503), response.status_code
+        return elapsed, response.status_code
+
+    jobs = [f'BENCH_{i}' for i in range(args.users)] * args.repeat
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        results = list(pool.map(login, jobs))
+    wall = time.perf_counter() - started
+
+    conn = sqlite3.connect(path)
+    upgraded = conn.execute("SELECT COUNT(*) FROM students WHERE password LIKE ?",
+                            (args.method + '$%',)).fetchone()[0]
+    conn.close()
+    return results, wall, upgraded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--method', default='pbkdf2:sha256:600000')
+    parser.add_argument('--stored-method', default=None, help='hash the seeded passwords with this method instead')
+    parser.add_argument('--workers', type=int, default=None, help='hashing threads (default: CPU count)')
+    parser.add_argument('--max-pending', type=int, default=None, help='admitted checks (default: 8 per worker)')
+    parser.add_argument('--queue-timeout', type=float, default=2.0)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--dir', default=None, help='directory for the benchmark database')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='login-bench-', dir=args.dir)
+    cwd = os.getcwd()
+    # app.py touches ./database.db on import, so never import it from the project root
+    os.chdir(workdir)
+    try:
+        results, wall, upgraded = run(workdir, args)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    served = [elapsed for elapsed, status in results if status == 302]
+    shed = len(results) - len(served)
+    print(f"{len(results)} logins, concurrency {args.concurrency}, {args.method}: "
+          f"{len(served) / wall:,.1f} logins/sec, {shed} shed")
+    if served:
+        print(f"  p50 {percentile(served, 50) * 1000:.0f} ms  p99 {percentile(served, 99) * 1000:.0f} ms  "
+              f"max {max(served) * 1000:.0f} ms")
+    if args.stored_method:
+        print(f"  {upgraded}/{args.users} passwords rehashed to the current policy")
+
+
+if __name__ == '__main__':
+    main()
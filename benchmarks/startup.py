@@ -0,0 +1,143 @@
+"""Worker startup: cold workers that build everything themselves vs. workers forked warm.
+
+Usage: python benchmarks/startup.py [--workers 4] [--db database.db] [--regno REGNO]
+
+Copies --db to a scratch directory and starts --workers workers two ways:
+
+  cold       a fresh interpreter per worker imports app, calls create_app() and serves
+             its first requests, as gunicorn does without preload_app
+  preloaded  one process imports app and calls create_app() once, then forks each
+             worker, which serves its first requests at once (gunicorn.conf.py)
+
+Each worker's first requests are GET /vote and GET /results as --regno (default: the
+first student in the database). For each mode it reports the time from starting a
+worker to those responses, and each worker's private memory, i.e. the pages it does
+not share copy-on-write, from /proc/<pid>/smaps_rollup where Linux provides it.
+gunicorn is not needed: the preloaded mode forks the way its master does. An untimed
+cold worker runs first, so both modes find the template bytecode cache filled.
+"""
+import argparse
+import gc
+import json
+import os
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+
+def private_kb():
+    try:
+        with open('/proc/self/smaps_rollup') as smaps:
+            fields = dict(line.split(':', 1) for line in smaps if ':' in line)
+    except OSError:
+        return None
+    return sum(int(fields[name].split()[0]) for name in ('Private_Clean', 'Private_Dirty') if name in fields)
+
+
+def first_requests(voting, regno):
+    client = voting.app.test_client()
+    with client.session_transaction() as sess:
+        sess.update(user=regno, role='student', name=regno)
+    for path in ('/vote', '/results'):
+        response = client.get(path)
+        assert response.status_code < 400, (path, response.status_code)
+
+
+def worker(regno):
+    # A cold worker: everything from the import on happens in this process
+    import app as voting
+    voting.create_app()
+    first_requests(voting, regno)
+    print(json.dumps({'private_kb': private_kb()}), flush=True)
+
+
+def run_cold(workdir, regno):
+    started = time.perf_counter()
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--worker', '--regno', regno],
+                            cwd=workdir, capture_output=True, text=True, check=True).stdout
+    return time.perf_counter() - started, json.loads(output.splitlines()[-1])['private_kb']
+
+
+def run_preloaded(workers, regno):
+    started = time.perf_counter()
+    import app as voting
+    voting.create_app()
+    preload = time.perf_counter() - started
+    gc.freeze()  # as gunicorn.conf.py's when_ready does
+    samples = []
+    for _ in range(workers):
+        read, write = os.pipe()
+        forked = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read)
+            status = 1
+            try:
+                first_requests(voting, regno)
+                os.write(write, json.dumps({'private_kb': private_kb()}).encode())
+                status = 0
+            finally:
+                os._exit(status)
+        os.close(write)
+        with os.fdopen(read) as pipe:
+            report = pipe.read()
+        elapsed = time.perf_counter() - forked
+        _, status = os.waitpid(pid, 0)
+        assert status == 0 and report, 'worker failed'
+        samples.append((elapsed, json.loads(report)['private_kb']))
+    return preload, samples
+
+
+def summarize(name, samples):
+    times = [elapsed * 1000 for elapsed, _ in samples]
+    memory = [kb for _, kb in samples if kb is not None]
+    line = f"  {name:<10} first response {statistics.median(times):7.1f} ms median, {max(times):7.1f} ms max"
+    if memory:
+        line += f"; private memory {statistics.median(memory) / 1024:6.1f} MiB median"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--db', default=os.path.join(ROOT, 'database.db'))
+    parser.add_argument('--regno', help='student whose first requests are timed')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        worker(args.regno)
+        return
+
+    workdir = tempfile.mkdtemp(prefix='startup-bench-')
+    try:
+        path = os.path.join(workdir, 'database.db')
+        shutil.copy(args.db, path)
+        regno = args.regno
+        if regno is None:
+            conn = sqlite3.connect(path)
+            regno = conn.execute("SELECT regno FROM students WHERE regno != 'admin' ORDER BY regno LIMIT 1").fetchone()[0]
+            conn.close()
+        os.environ['DATABASE'] = path
+
+        run_cold(workdir, regno)  # fills the bytecode cache and the OS page cache
+        cold = [run_cold(workdir, regno) for _ in range(args.workers)]
+        os.chdir(workdir)
+        preload, preloaded = run_preloaded(args.workers, regno)
+
+        print(f"{args.workers} worker(s), first requests as {regno}:")
+        summarize('cold', cold)
+        summarize('preloaded', preloaded)
+        print(f"  preloading the master once took {preload * 1000:.1f} ms")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
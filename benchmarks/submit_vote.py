@@ -0,0 +1,218 @@
+"""Ballot submission throughput: legacy per-row commits vs. the batched transaction.
+
+Usage: python benchmarks/submit_vote.py [--voters 2000] [--threads 16] [--positions 4]
+                                        [--candidates 5] [--dir PATH]
+
+Each mode runs against its own freshly seeded database so journal modes don't leak
+between runs. Put --dir on a real disk; on tmpfs fsync is free and the gap shrinks.
+
+  legacy   the old submit_vote: new connection per request, one INSERT per position,
+           a commit, then a second commit for the audit row
+  batched  the new write path on a pooled WAL connection: BEGIN IMMEDIATE, guarded
+           election_voters claim, executemany for ballots and tallies, one commit
+  group    the batched write path funnelled through the group-commit writer thread
+           (VOTE_GROUP_COMMIT=1), many voters per transaction
+  route    the real /submit_vote route driven through the Flask test client
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+def seed(path, voters, positions, candidates):
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        CREATE TABLE students (regno TEXT PRIMARY KEY, name TEXT NOT NULL, course TEXT NOT NULL,
+                               batch TEXT NOT NULL, password TEXT NOT NULL, voted INTEGER DEFAULT 0);
+        CREATE TABLE elections (id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT NOT NULL,
+                                start_date TEXT, deadline TEXT);
+        CREATE TABLE positions (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL);
+        CREATE TABLE candidates (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL,
+                                 position_id INTEGER NOT NULL, student_regno TEXT);
+        CREATE TABLE ballots (id INTEGER PRIMARY KEY AUTOINCREMENT, student_regno TEXT NOT NULL,
+                              position_id INTEGER NOT NULL, candidate_id INTEGER NOT NULL,
+                              timestamp TEXT NOT NULL);
+        CREATE TABLE audit_log (id INTEGER PRIMARY KEY AUTOINCREMENT, user TEXT NOT NULL,
+                                action TEXT NOT NULL, details TEXT, timestamp TEXT NOT NULL);
+    ''')
+    conn.execute("INSERT INTO elections (id, title, start_date, deadline) VALUES (1, 'Bench', '2000-01-01T00:00', '2999-12-31T23:59')")
+    conn.executemany("INSERT INTO positions (id, name) VALUES (?, ?)",
+                     [(p, f'Position {p}') for p in range(1, positions + 1)])
+    conn.executemany("INSERT INTO candidates (name, position_id) VALUES (?, ?)",
+                     [(f'Candidate {p}.{c}', p) for p in range(1, positions + 1) for c in range(candidates)])
+    conn.executemany("INSERT INTO students (regno, name, course, batch, password) VALUES (?, ?, 'BENCH', '2025', 'x')",
+                     [(f'BENCH_{i}', f'Voter {i}') for i in range(voters)])
+    conn.commit()
+    ballot = {}
+    for row in conn.execute("SELECT id, position_id FROM candidates"):
+        ballot.setdefault(row[1], []).append(row[0])
+    conn.close()
+    return ballot
+
+
+def random_selections(ballot):
+    return [(pos_id, random.choice(ids)) for pos_id, ids in ballot.items()]
+
+
+def legacy_submit(path, student, selections):
+    conn = sqlite3.connect(path, timeout=30)
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    for position_id, candidate_id in selections:
+        conn.execute("INSERT INTO ballots (student_regno, position_id, candidate_id, timestamp) VALUES (?, ?, ?, ?)",
+                     (student, position_id, candidate_id, timestamp))
+    conn.execute("UPDATE students SET voted = 1 WHERE regno = ?", (student,))
+    conn.commit()
+    conn.execute("INSERT INTO audit_log (user, action, details, timestamp) VALUES (?, ?, ?, ?)",
+                 (student, 'Vote Cast', 'Ballot submitted', timestamp))
+    conn.commit()
+    conn.close()
+
+
+def batched_submit(conn, student, selections):
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    conn.execute("BEGIN IMMEDIATE")
+    claimed = conn.execute("INSERT INTO election_voters (election_id, regno, timestamp) VALUES (1, ?, ?) "
+                           "ON CONFLICT (election_id, regno) DO NOTHING", (student, timestamp))
+    if claimed.rowcount != 1:
+        conn.rollback()
+        return
+    conn.executemany("INSERT INTO ballots (election_id, student_regno, position_id, candidate_id, timestamp) "
+                     "VALUES (1, ?, ?, ?, ?)",
+                     [(student, position_id, candidate_id, timestamp) for position_id, candidate_id in selections])
+    conn.executemany('''
+        INSERT INTO tallies (election_id, position_id, candidate_id, votes) VALUES (1, ?, ?, 1)
+        ON CONFLICT (election_id, position_id, candidate_id) DO UPDATE SET votes = votes + 1
+    ''', selections)
+    conn.execute("INSERT INTO audit_log (user, action, details, timestamp) VALUES (?, ?, ?, ?)",
+                 (student, 'Vote Cast', 'Ballot submitted', timestamp))
+    conn.commit()
+
+
+def run_legacy(workdir, args):
+    path = os.path.join(workdir, 'database.db')
+    ballot = seed(path, args.voters, args.positions, args.candidates)
+    jobs = [(f'BENCH_{i}', random_selections(ballot)) for i in range(args.voters)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as pool:
+        list(pool.map(lambda job: legacy_submit(path, *job), jobs))
+    return time.perf_counter() - start
+
+
+def run_batched(workdir, args):
+    from app import DB_PRAGMAS
+    from schema import migrate
+    path = os.path.join(workdir, 'database.db')
+    ballot = seed(path, args.voters, args.positions, args.candidates)
+    migrate(path)
+    local = threading.local()
+
+    def submit(job):
+        conn = getattr(local, 'conn', None)
+        if conn is None:
+            conn = local.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            for pragma in DB_PRAGMAS:
+                conn.execute(f"PRAGMA {pragma}")
+        batched_submit(conn, *job)
+
+    jobs = [(f'BENCH_{i}', random_selections(ballot)) for i in range(args.voters)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as pool:
+        list(pool.map(submit, jobs))
+    return time.perf_counter() - start
+
+
+def run_group(workdir, args):
+    path = os.path.join(workdir, 'database.db')
+    ballot = seed(path, args.voters, args.positions, args.candidates)
+    import app as voting
+    from group_commit import GroupCommitWriter
+    from schema import migrate
+    voting.DATABASE = path
+    migrate(path)
+    writer = GroupCommitWriter(voting.connect_vote_writer, voting.record_ballot,
+                               max_batch=args.batch_size, max_latency=args.batch_latency)
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    jobs = [(f'BENCH_{i}', random_selections(ballot)) for i in range(args.voters)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as pool:
+        recorded = list(pool.map(lambda job: writer.submit(1, job[0], [(p, c, 1) for p, c in job[1]], timestamp), jobs))
+    elapsed = time.perf_counter() - start
+    assert all(recorded)
+    return elapsed
+
+
+def run_route(workdir, args):
+    path = os.path.join(workdir, 'database.db')
+    ballot = seed(path, args.voters, args.positions, args.candidates)
+    import app as voting
+    voting.DATABASE = path
+    from schema import migrate
+    migrate(path)
+    voting.app.config['TESTING'] = True
+
+    local = threading.local()
+
+    def submit(job):
+        student, selections = job
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = voting.app.test_client()
+        with client.session_transaction() as sess:
+            sess.clear()
+            sess.update(user=student, role='student')
+        form = {f'position_{pos_id}': str(cand_id) for pos_id, cand_id in selections}
+        form['election_id'] = '1'
+        response = client.post('/submit_vote', data=form)
+        assert response.status_code == 302, response.status_code
+
+    jobs = [(f'BENCH_{i}', random_selections(ballot)) for i in range(args.voters)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as pool:
+        list(pool.map(submit, jobs))
+    elapsed = time.perf_counter() - start
+
+    conn = sqlite3.connect(path)
+    recorded = conn.execute("SELECT COUNT(*) FROM election_voters WHERE election_id = 1").fetchone()[0]
+    conn.close()
+    assert recorded == args.voters, (recorded, args.voters)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--voters', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--positions', type=int, default=4)
+    parser.add_argument('--candidates', type=int, default=5)
+    parser.add_argument('--batch-size', type=int, default=200)
+    parser.add_argument('--batch-latency', type=float, default=0.005)
+    parser.add_argument('--dir', default=None, help='directory for the benchmark databases')
+    args = parser.parse_args()
+
+    for name, runner in (('legacy', run_legacy), ('batched', run_batched), ('group', run_group), ('route', run_route)):
+        workdir = tempfile.mkdtemp(prefix=f'vote-bench-{name}-', dir=args.dir)
+        cwd = os.getcwd()
+        # app.py touches ./database.db on import, so never import it from the project root
+        os.chdir(workdir)
+        try:
+            elapsed = runner(workdir, args)
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(workdir, ignore_errors=True)
+        print(f"{name:8s} {args.voters} voters x {args.positions} positions, {args.threads} threads: "
+              f"{elapsed:.2f}s, {args.voters / elapsed:,.0f} votes/sec")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,494 @@
+"""Voting hot-path benchmark suite: login, ballot, submit, results and live counts.
+
+Usage: python benchmarks/suite.py [--students 5000] [--positions 4] [--candidates 5]
+                                  [--voted 0.5] [--voters 300] [--concurrency 16]
+                                  [--modes client,server] [--workers 4]
+                                  [--hash-method pbkdf2:sha256:60000]
+                                  [--out results.json] [--compare baseline.json] [--dir PATH]
+
+Seeds a synthetic database with schema.create_schema() plus --students students,
+--positions x --candidates candidates in election 1 and ballots already cast by
+the --voted fraction of students. Then --voters fresh students each run the
+flow below from --concurrency threads:
+
+  login            POST /login
+  vote             GET  /vote
+  submit_vote      POST /submit_vote
+  results          GET  /results
+  live_vote_count  GET  /live_vote_count
+
+Modes:
+  client  the Flask test client, in this process
+  server  a local server with --workers worker processes driven over HTTP: gunicorn
+          with the project's gunicorn.conf.py when it is installed, otherwise threaded
+          Werkzeug servers forked the same way, sharing one listening socket
+
+Each endpoint gets a request count, error count, throughput and p50/p95/p99 latency.
+SQLite lock waits are counted by timing the statements that can block on the write
+lock (BEGIN IMMEDIATE and autocommit writes) and logging those slower than
+--lock-threshold, from every worker process. The report is written as JSON tagged
+with the git commit to benchmarks/results/ (ignored by git) unless --out names a file;
+pass an earlier report to --compare to print the differences.
+Only the --voters who log in get individually salted hashes, since seeding hashes
+for every student at a realistic cost would take minutes; login cost scales with
+--hash-method.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import runpy
+import shutil
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+
+from werkzeug.security import generate_password_hash
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+RESULTS = os.path.join(ROOT, 'benchmarks', 'results')
+sys.path.insert(0, ROOT)
+
+PASSWORD = 'bench-password'
+ENDPOINTS = ('login', 'vote', 'submit_vote', 'results', 'live_vote_count')
+
+
+# ------------------- Synthetic database -------------------
+
+def seed(workdir, args):
+    """Create workdir/database.db and return (voter regnos, {position id: [candidate ids]})."""
+    import schema
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        schema.create_schema()
+    finally:
+        os.chdir(cwd)
+
+    conn = sqlite3.connect(os.path.join(workdir, 'database.db'))
+    conn.execute("UPDATE elections SET start_date = '2000-01-01T00:00', deadline = '2999-12-31T23:59' WHERE id = 1")
+    for table in ('ballots', 'tallies', 'election_voters', 'candidates', 'positions'):
+        conn.execute(f"DELETE FROM {table}")
+
+    shared = generate_password_hash(PASSWORD, method=args.hash_method)
+    regnos = [f'BENCH2025_{1001 + i}' for i in range(args.students)]
+    voted = set(random.sample(range(args.students), int(args.students * args.voted)))
+    fresh = [i for i in range(args.students) if i not in voted][:args.voters]
+    hashes = {i: generate_password_hash(PASSWORD, method=args.hash_method) for i in fresh}
+    conn.executemany("INSERT INTO students (regno, name, course, batch, password) VALUES (?, ?, 'BENCH', '2025', ?)",
+                     [(regno, f'Voter {i}', hashes.get(i, shared)) for i, regno in enumerate(regnos)])
+
+    ballot = {}
+    for p in range(1, args.positions + 1):
+        position_id = conn.execute("INSERT INTO positions (election_id, name) VALUES (1, ?)",
+                                   (f'Position {p}',)).lastrowid
+        ballot[position_id] = [conn.execute("INSERT INTO candidates (election_id, name, position_id) VALUES (1, ?, ?)",
+                                            (f'Candidate {p}.{c}', position_id)).lastrowid
+                               for c in range(args.candidates)]
+
+    timestamp = '2025-01-01 09:00:00'
+    conn.executemany("INSERT INTO election_voters (election_id, regno, timestamp) VALUES (1, ?, ?)",
+                     [(regnos[i], timestamp) for i in voted])
+    conn.executemany("INSERT INTO ballots (election_id, student_regno, position_id, candidate_id, timestamp) "
+                     "VALUES (1, ?, ?, ?, ?)",
+                     [(regnos[i], position_id, random.choice(ids), timestamp)
+                      for i in voted for position_id, ids in ballot.items()])
+    schema.rebuild_tallies(conn)
+    conn.execute("UPDATE versions SET version = version + 1")
+    conn.commit()
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+    return [regnos[i] for i in fresh], ballot
+
+
+# ------------------- Lock-wait accounting -------------------
+
+class LockTimedConnection(sqlite3.Connection):
+    """Connection that logs statements which waited on SQLite's write lock."""
+
+    log_path = None
+    threshold = 0.002
+
+    def execute(self, sql, *args):
+        return self._timed(super().execute, sql, args)
+
+    def executemany(self, sql, *args):
+        return self._timed(super().executemany, sql, args)
+
+    def _timed(self, call, sql, args):
+        head = sql.lstrip()[:16].upper()
+        # Only these can block on the lock: reads never do under WAL, and later writes
+        # in a transaction already hold it
+        waits = head.startswith('BEGIN IMMEDIATE') or (
+            not self.in_transaction and head.startswith(('INSERT', 'UPDATE', 'DELETE', 'REPLACE')))
+        if not waits:
+            return call(sql, *args)
+        started = time.perf_counter()
+        try:
+            return call(sql, *args)
+        except sqlite3.OperationalError as e:
+            if 'locked' in str(e):
+                self._log('timeout', time.perf_counter() - started)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            if elapsed >= self.threshold:
+                self._log('wait', elapsed)
+
+    def _log(self, kind, elapsed):
+        # O_APPEND keeps lines from concurrent worker processes whole
+        fd = os.open(self.log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, f"{kind} {elapsed:.6f}\n".encode())
+        finally:
+            os.close(fd)
+
+
+def install_lock_watch(log_path, threshold):
+    LockTimedConnection.log_path = log_path
+    LockTimedConnection.threshold = threshold
+    sqlite3.connect = partial(sqlite3.connect, factory=LockTimedConnection)
+
+
+def read_lock_log(log_path):
+    waits, timeouts, waited = 0, 0, 0.0
+    if os.path.exists(log_path):
+        with open(log_path) as log:
+            for line in log:
+                kind, elapsed = line.split()
+                if kind == 'timeout':
+                    timeouts += 1
+                else:
+                    waits += 1
+                    waited += float(elapsed)
+    return {'waits': waits, 'timeouts': timeouts, 'wait_seconds': round(waited, 4)}
+
+
+def configure(voting, args):
+    # The app passes its own connection factory, so lock timing has to extend that one
+    factory = type('LockTimedInstrumentedConnection', (LockTimedConnection, voting.app.config['DB_FACTORY']), {})
+    voting.app.config.update(TESTING=True, PASSWORD_HASH_METHOD=args.hash_method, DB_FACTORY=factory)
+
+
+# ------------------- Drivers -------------------
+
+class ClientDriver:
+    """One Flask test client per virtual voter; keeps its own cookies."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, form=None):
+        response = self.client.open(path, method=method, data=form)
+        response.get_data()
+        response.close()
+        return response.status_code
+
+
+class HttpDriver:
+    """Plain HTTP against the local server with a hand-kept session cookie."""
+
+    def __init__(self, port):
+        self.port = port
+        self.cookie = None
+
+    def request(self, method, path, form=None):
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        headers = {'Cookie': self.cookie} if self.cookie else {}
+        body = None
+        if form is not None:
+            body = urllib.parse.urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            for header, value in response.getheaders():
+                if header.lower() == 'set-cookie' and value.startswith('session='):
+                    self.cookie = value.split(';', 1)[0]
+            return response.status
+        finally:
+            conn.close()
+
+
+def run_flows(make_driver, voters, ballot, concurrency):
+    samples = {name: [] for name in ENDPOINTS}
+    errors = {name: 0 for name in ENDPOINTS}
+    lock = threading.Lock()
+
+    def timed(name, expected, driver, method, path, form=None):
+        started = time.perf_counter()
+        try:
+            status = driver.request(method, path, form)
+        except (OSError, http.client.HTTPException):
+            status = None
+        elapsed = time.perf_counter() - started
+        with lock:
+            samples[name].append(elapsed)
+            if status != expected:
+                errors[name] += 1
+
+    def flow(regno):
+        driver = make_driver()
+        form = {f'position_{position_id}': str(random.choice(ids)) for position_id, ids in ballot.items()}
+        form['election_id'] = '1'
+        timed('login', 302, driver, 'POST', '/login', {'regno': regno, 'password': PASSWORD})
+        timed('vote', 200, driver, 'GET', '/vote')
+        timed('submit_vote', 302, driver, 'POST', '/submit_vote', form)
+        timed('results', 200, driver, 'GET', '/results')
+        timed('live_vote_count', 200, driver, 'GET', '/live_vote_count')
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(flow, voters))
+    return samples, errors, time.perf_counter() - started
+
+
+def percentile(ordered, pct):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def summarize(samples, errors, wall):
+    report = {}
+    everything = []
+    for name in ENDPOINTS:
+        ordered = sorted(samples[name])
+        everything.extend(ordered)
+        report[name] = stats(ordered, errors[name], wall)
+    report['total'] = stats(sorted(everything), sum(errors.values()), wall)
+    return report
+
+
+def stats(ordered, errors, wall):
+    if not ordered:
+        return {'requests': 0, 'errors': errors}
+    return {
+        'requests': len(ordered),
+        'errors': errors,
+        'throughput': round(len(ordered) / wall, 2),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 2),
+        'p50_ms': round(percentile(ordered, 50) * 1000, 2),
+        'p95_ms': round(percentile(ordered, 95) * 1000, 2),
+        'p99_ms': round(percentile(ordered, 99) * 1000, 2),
+    }
+
+
+# ------------------- Modes -------------------
+
+def run_client(workdir, voters, ballot, args):
+    log_path = os.path.join(workdir, 'locks.log')
+    install_lock_watch(log_path, args.lock_threshold)
+    cwd = os.getcwd()
+    # app.py touches ./database.db on import, so never import it from the project root
+    os.chdir(workdir)
+    try:
+        import app as voting
+        configure(voting, args)
+        samples, errors, wall = run_flows(lambda: ClientDriver(voting.app), voters, ballot, args.concurrency)
+    finally:
+        os.chdir(cwd)
+    return samples, errors, wall, read_lock_log(log_path)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def run_server(workdir, voters, ballot, args):
+    port = free_port()
+    log_path = os.path.join(workdir, 'locks.log')
+    server = subprocess.Popen([sys.executable, os.path.abspath(__file__), 'serve', '--workdir', workdir,
+                               '--port', str(port), '--workers', str(args.workers),
+                               '--hash-method', args.hash_method, '--lock-threshold', str(args.lock_threshold)],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                break
+            except OSError:
+                if server.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("benchmark server did not start")
+                time.sleep(0.1)
+        samples, errors, wall = run_flows(lambda: HttpDriver(port), voters, ballot, args.concurrency)
+    finally:
+        # The server's own session holds its forked workers too
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait(10)
+    return samples, errors, wall, read_lock_log(log_path)
+
+
+def serve(args):
+    os.chdir(args.workdir)
+    install_lock_watch(os.path.join(args.workdir, 'locks.log'), args.lock_threshold)
+    import app as voting
+    configure(voting, args)
+    voting.app.config['TESTING'] = False
+    # As gunicorn.conf.py does: schema checked and caches warmed once, before the workers fork
+    voting.create_app()
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        # Werkzeug's processes=N forks per request, which would time the fork rather than the app
+        from werkzeug.serving import make_server
+        server = make_server('127.0.0.1', args.port, voting.app, threaded=True)
+        for _ in range(args.workers - 1):
+            if os.fork() == 0:
+                break
+        server.serve_forever()
+        return
+
+    class Server(BaseApplication):
+        def load_config(self):
+            settings = runpy.run_path(os.path.join(ROOT, 'gunicorn.conf.py'))
+            for key, value in settings.items():
+                if key in self.cfg.settings and key != 'wsgi_app':
+                    self.cfg.set(key, value)
+            self.cfg.set('bind', f'127.0.0.1:{args.port}')
+            self.cfg.set('workers', args.workers)
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('threads', 16)
+            self.cfg.set('preload_app', True)
+
+        def load(self):
+            return voting.app
+
+    Server().run()
+
+
+def server_kind():
+    try:
+        import gunicorn  # noqa: F401
+        return 'gunicorn gthread (gunicorn.conf.py)'
+    except ImportError:
+        return 'werkzeug threaded, preforked'
+
+
+# ------------------- Reporting -------------------
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report):
+    print(f"server mode ran on {report['meta']['server']}")
+    for mode, result in report['runs'].items():
+        locks = result['locks']
+        print(f"\n{mode}: {result['wall_seconds']:.2f}s wall, lock waits {locks['waits']} "
+              f"({locks['wait_seconds']:.3f}s), lock timeouts {locks['timeouts']}")
+        print(f"  {'endpoint':16s} {'reqs':>6s} {'errs':>5s} {'req/s':>8s} {'p50':>8s} {'p95':>8s} {'p99':>8s}")
+        for name, row in result['endpoints'].items():
+            if not row['requests']:
+                continue
+            print(f"  {name:16s} {row['requests']:6d} {row['errors']:5d} {row['throughput']:8.1f} "
+                  f"{row['p50_ms']:7.1f}ms {row['p95_ms']:7.1f}ms {row['p99_ms']:7.1f}ms")
+
+
+def print_comparison(report, baseline):
+    print(f"\nCompared with {baseline['meta'].get('commit') or 'baseline'} "
+          f"({baseline['meta'].get('started')}):")
+    for mode, result in report['runs'].items():
+        before = baseline['runs'].get(mode)
+        if before is None:
+            continue
+        print(f"  {mode}")
+        for name, row in result['endpoints'].items():
+            old = before['endpoints'].get(name)
+            if not old or not old.get('requests') or not row.get('requests'):
+                continue
+            changes = []
+            for key in ('p50_ms', 'p99_ms', 'throughput'):
+                delta = (row[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+                changes.append(f"{key} {old[key]:.1f} -> {row[key]:.1f} ({delta:+.0f}%)")
+            print(f"    {name:16s} " + ', '.join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('command', nargs='?', default='run', choices=('run', 'serve'))
+    parser.add_argument('--students', type=int, default=5000)
+    parser.add_argument('--positions', type=int, default=4)
+    parser.add_argument('--candidates', type=int, default=5)
+    parser.add_argument('--voted', type=float, default=0.5, help='fraction of students who have already voted')
+    parser.add_argument('--voters', type=int, default=300, help='students who run the full flow')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--modes', default='client,server')
+    parser.add_argument('--workers', type=int, default=4, help='server worker processes')
+    parser.add_argument('--hash-method', default='pbkdf2:sha256:60000')
+    parser.add_argument('--lock-threshold', type=float, default=0.002,
+                        help='seconds a lock-taking statement may take before it counts as a wait')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', default=None, help='JSON report path (default: benchmarks/results/bench-<commit>-<time>.json)')
+    parser.add_argument('--compare', default=None, help='earlier JSON report to compare against')
+    parser.add_argument('--dir', default=None, help='directory for the benchmark databases')
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        serve(args)
+        return
+
+    random.seed(args.seed)
+    modes = [mode.strip() for mode in args.modes.split(',') if mode.strip()]
+    template = tempfile.mkdtemp(prefix='vote-suite-', dir=args.dir)
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'started': datetime.now().isoformat(timespec='seconds'),
+            'python': sys.version.split()[0],
+            'sqlite': sqlite3.sqlite_version,
+            'server': server_kind(),
+            'args': {key: value for key, value in vars(args).items()
+                     if key not in ('command', 'workdir', 'port', 'out', 'compare', 'dir')},
+        },
+        'runs': {},
+    }
+    try:
+        voters, ballot = seed(template, args)
+        for mode in modes:
+            workdir = tempfile.mkdtemp(prefix=f'vote-suite-{mode}-', dir=args.dir)
+            # Every mode starts from the same seeded file
+            shutil.copy(os.path.join(template, 'database.db'), workdir)
+            try:
+                runner = run_client if mode == 'client' else run_server
+                samples, errors, wall, locks = runner(workdir, voters, ballot, args)
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+            report['runs'][mode] = {'wall_seconds': round(wall, 3), 'locks': locks,
+                                    'endpoints': summarize(samples, errors, wall)}
+    finally:
+        shutil.rmtree(template, ignore_errors=True)
+
+    print_report(report)
+    out = args.out
+    if out is None:
+        os.makedirs(RESULTS, exist_ok=True)
+        out = os.path.join(RESULTS, f"bench-{report['meta']['commit'] or 'nogit'}-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {out}")
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Ranked-choice and approval counting over a large synthetic election.
+
+Usage: python benchmarks/tabulation.py [--ballots 1000000] [--candidates 8] [--depth 5]
+                                       [--method irv] [--seats 1] [--load] [--seed 1]
+
+Builds --ballots ballots that each rank (or, for approval, mark) up to --depth of
+--candidates candidates, with first preferences skewed so the count runs several
+rounds, and times tabulation.tabulate() on them. --load also writes the ballots to a
+scratch SQLite ballots table and times load_ballots() reading them back, which is
+what /results pays for a ranked position. Counting is vectorised when NumPy is
+installed and falls back to pure Python otherwise; the report says which ran.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import tabulation  # noqa: E402
+from tabulation import Ballots, load_ballots, tabulate  # noqa: E402
+
+
+def synthetic(count, candidates, depth, seed):
+    rng = random.Random(seed)
+    ids = list(range(1, candidates + 1))
+    # Earlier candidates are more popular, so the tail is eliminated one round at a time
+    weights = [candidates - i for i in range(candidates)]
+    rows = []
+    for _ in range(count):
+        first = rng.choices(ids, weights)[0]
+        rest = rng.sample([c for c in ids if c != first], min(depth, candidates) - 1)
+        length = rng.randint(1, min(depth, candidates))
+        rows.append([first] + rest[:length - 1])
+    return ids, rows
+
+
+def to_ballots(ids, rows, depth):
+    matrix = [tuple(row) + (0,) * (depth - len(row)) for row in rows]
+    if tabulation.np is not None:
+        matrix = tabulation.np.array(matrix, dtype=tabulation.np.int32).reshape(len(rows), depth)
+    return Ballots(tuple(ids), matrix)
+
+
+def load_from_sqlite(ids, rows, ranked):
+    workdir = tempfile.mkdtemp(prefix='tabulation-bench-')
+    conn = sqlite3.connect(os.path.join(workdir, 'ballots.db'))
+    conn.execute("CREATE TABLE ballots (election_id INTEGER, student_regno TEXT, position_id INTEGER, "
+                 "candidate_id INTEGER, rank INTEGER NOT NULL DEFAULT 1)")
+    conn.execute("CREATE UNIQUE INDEX idx_ballots_election_student "
+                 "ON ballots (election_id, student_regno, position_id, rank)")
+    conn.executemany("INSERT INTO ballots VALUES (1, ?, 1, ?, ?)",
+                     ((f'V{voter:08d}', candidate, rank)
+                      for voter, row in enumerate(rows) for rank, candidate in enumerate(row, start=1)))
+    conn.commit()
+    started = time.perf_counter()
+    ballots = load_ballots(conn, 1, 1, ids, ranked=ranked)
+    elapsed = time.perf_counter() - started
+    conn.close()
+    return ballots, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ballots', type=int, default=1000000)
+    parser.add_argument('--candidates', type=int, default=8)
+    parser.add_argument('--depth', type=int, default=5, help='most candidates ranked on one ballot')
+    parser.add_argument('--method', default='irv', choices=sorted(tabulation.METHODS))
+    parser.add_argument('--seats', type=int, default=1)
+    parser.add_argument('--load', action='store_true', help='also time load_ballots() from SQLite')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    ids, rows = synthetic(args.ballots, args.candidates, args.depth, args.seed)
+    ranked = args.method in tabulation.RANKED
+    if args.load:
+        ballots, load_time = load_from_sqlite(ids, rows, ranked)
+    else:
+        ballots, load_time = to_ballots(ids, rows, min(args.depth, args.candidates)), None
+
+    started = time.perf_counter()
+    result = tabulate(args.method, ballots, args.seats)
+    elapsed = time.perf_counter() - started
+
+    engine = f"NumPy {tabulation.np.__version__}" if tabulation.np is not None else "pure Python (NumPy not installed)"
+    print(f"{args.ballots:,} ballots, {args.candidates} candidates, {tabulation.METHODS[args.method]}: {engine}")
+    if load_time is not None:
+        print(f"  load_ballots  {load_time * 1000:,.0f} ms")
+    print(f"  tabulate      {elapsed * 1000:,.0f} ms over {len(result.rounds)} round(s), "
+          f"{result.exhausted:,.0f} exhausted")
+    print(f"  elected: {', '.join(str(c) for c in result.winners) or 'none'}")
+
+
+if __name__ == '__main__':
+    main()
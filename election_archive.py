@@ -0,0 +1,67 @@
+import sqlite3
+
+# Election-scoped tables, moved out of the hot database when an election is archived
+ARCHIVED_TABLES = ('positions', 'candidates', 'ballots', 'tallies', 'election_voters', 'turnout_minutes')
+
+
+def _columns(conn, schema, table):
+    return [row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+
+def _ensure_table(conn, table):
+    # Archive tables mirror the live columns; constraints are unnecessary for read-only history
+    columns = _columns(conn, 'main', table)
+    if not _columns(conn, 'archive', table):
+        conn.execute(f"CREATE TABLE archive.{table} AS SELECT * FROM main.{table} WHERE 0")
+    for column in columns:
+        if column not in _columns(conn, 'archive', table):
+            conn.execute(f"ALTER TABLE archive.{table} ADD COLUMN {column}")
+    if table != 'elections':
+        conn.execute(f"CREATE INDEX IF NOT EXISTS archive.idx_{table}_election ON {table} (election_id)")
+    return ', '.join(columns)
+
+
+def archive_election(database, election_id, archive_path):
+    """Move a closed election's positions, candidates, ballots, tallies, voters and turnout into `archive_path`.
+
+    The archive is an ordinary SQLite file, ATTACHed for the copy, so the hot database only
+    keeps the elections row (marked 'archived' with the file it went to). Returns the number
+    of ballots moved. Raises ValueError unless the election exists and is closed.
+    """
+    conn = sqlite3.connect(database, timeout=30)
+    try:
+        status = conn.execute("SELECT status FROM elections WHERE id = ?", (election_id,)).fetchone()
+        if status is None or status[0] != 'closed':
+            raise ValueError("Only closed elections can be archived.")
+
+        # ATTACH is not allowed inside a transaction
+        conn.execute("ATTACH DATABASE ? AS archive", (archive_path,))
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                columns = _ensure_table(conn, 'elections')
+                conn.execute("DELETE FROM archive.elections WHERE id = ?", (election_id,))
+                conn.execute(f"INSERT INTO archive.elections ({columns}) SELECT {columns} FROM main.elections "
+                             f"WHERE id = ?", (election_id,))
+                moved = 0
+                for table in ARCHIVED_TABLES:
+                    columns = _ensure_table(conn, table)
+                    # Across attached WAL databases the commit is atomic per file, so a crash
+                    # can leave a partial copy behind; clearing first makes a rerun safe
+                    conn.execute(f"DELETE FROM archive.{table} WHERE election_id = ?", (election_id,))
+                    copied = conn.execute(f"INSERT INTO archive.{table} ({columns}) SELECT {columns} "
+                                          f"FROM main.{table} WHERE election_id = ?", (election_id,)).rowcount
+                    conn.execute(f"DELETE FROM main.{table} WHERE election_id = ?", (election_id,))
+                    if table == 'ballots':
+                        moved = copied
+                conn.execute("UPDATE main.elections SET status = 'archived', archive_file = ? WHERE id = ?",
+                             (archive_path, election_id))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        finally:
+            conn.execute("DETACH DATABASE archive")
+        return moved
+    finally:
+        conn.close()
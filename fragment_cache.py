@@ -0,0 +1,95 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+from instrumentation import current_request
+
+# cost: seconds the body took to render, which every hit saves
+Fragment = namedtuple('Fragment', 'html cost expires')
+
+
+class FragmentCache:
+    """Thread-safe LRU of rendered template fragments, filled by {% cache %} blocks.
+
+    Keys carry the versions a fragment was rendered from (the ballot and tallies versions,
+    say), so after a change the next render misses under its new key and the stale entry
+    ages out. A ttl bounds fragments that have no version to key on.
+    """
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires is not None and entry.expires <= time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key, html, cost, ttl=None):
+        with self._lock:
+            self._entries[key] = Fragment(html, cost, None if ttl is None else time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class FragmentCacheExtension(Extension):
+    """{% cache key[, ttl] %}...{% endcache %}: render the body once per key and reuse its HTML.
+
+    The key is one expression (a tuple for several parts) and must cover everything the
+    body depends on; the block's template and line are added, so two blocks never share
+    entries. Without environment.fragment_cache the body simply renders every time.
+    """
+
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = parser.parse_expression()
+        ttl = parser.parse_expression() if parser.stream.skip_if('comma') else nodes.Const(None)
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        site = nodes.Const(f'{parser.name}:{lineno}')
+        return nodes.CallBlock(self.call_method('_render', [site, key, ttl]), [], [], body).set_lineno(lineno)
+
+    def _render(self, site, key, ttl, caller):
+        cache = self.environment.fragment_cache
+        if cache is None:
+            return caller()
+        stats = current_request()
+        entry = cache.get((site, key))
+        if entry is not None:
+            if stats is not None:
+                stats.fragment_hits += 1
+                stats.fragment_saved += entry.cost
+            return entry.html
+        started = time.perf_counter()
+        html = caller()
+        cache.set((site, key), html, time.perf_counter() - started, ttl)
+        if stats is not None:
+            stats.fragment_misses += 1
+        return html
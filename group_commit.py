@@ -0,0 +1,125 @@
+import queue
+import threading
+import time
+
+
+class WriterBusy(Exception):
+    """Raised by submit() when the write was not committed within its timeout."""
+
+
+class _Pending:
+    __slots__ = ('args', 'done', 'result', 'error', 'abandoned')
+
+    def __init__(self, args):
+        self.args = args
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.abandoned = False
+
+
+class GroupCommitWriter:
+    """Funnel writes from many request threads through one writer thread.
+
+    Callers block in submit() until the transaction holding their write has
+    committed. The writer drains up to max_batch queued writes, waiting at most
+    max_latency seconds for stragglers, and commits them together so a burst of
+    voters costs one fsync per batch rather than one per voter.
+
+    `connect` returns a new sqlite3 connection for the writer thread and
+    `write(conn, *args)` performs one caller's work inside the open transaction;
+    its return value is handed back to that caller.
+
+    A caller waits at most `timeout` seconds and then gets WriterBusy; a write it gave
+    up on before the writer reached it is dropped. If connecting or committing fails,
+    the batch's callers get the error and the writer reconnects for the next batch.
+    """
+
+    def __init__(self, connect, write, max_batch=200, max_latency=0.005, timeout=10.0):
+        self.connect = connect
+        self.write = write
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, *args):
+        self._ensure_started()
+        item = _Pending(args)
+        self._queue.put(item)
+        if not item.done.wait(self.timeout):
+            item.abandoned = True
+            raise WriterBusy()
+        if item.error is not None:
+            raise item.error
+        return item.result
+
+    def _ensure_started(self):
+        # Started lazily so each forked gunicorn worker gets its own writer thread
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='group-commit-writer', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        conn = None
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_latency
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            batch = [item for item in batch if not item.abandoned]
+            if not batch:
+                continue
+            try:
+                if conn is None:
+                    conn = self.connect()
+                self._flush(conn, batch)
+            except Exception as e:
+                # The connection is unusable; fail whoever is still waiting and start afresh
+                for item in batch:
+                    if not item.done.is_set():
+                        item.error = e
+                        item.done.set()
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+                conn = None
+
+    def _flush(self, conn, batch):
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            results = [self.write(conn, *item.args) for item in batch]
+            conn.commit()
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            # Replay one write per transaction so a single bad write can't fail the whole batch
+            for item in batch:
+                self._flush_one(conn, item)
+            return
+        for item, result in zip(batch, results):
+            item.result = result
+            item.done.set()
+
+    def _flush_one(self, conn, item):
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            item.result = self.write(conn, *item.args)
+            conn.commit()
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            item.error = e
+        item.done.set()
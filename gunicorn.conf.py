@@ -0,0 +1,26 @@
+"""gunicorn settings: build the app once in the master and fork warm workers from it.
+
+With preload_app the master runs app:create_app() before forking, so the schema is checked
+once and every worker starts with the ballot, results and template caches already built and
+shared copy-on-write. GUNICORN_PRELOAD=0 turns that off (e.g. to reload workers' code
+without restarting the master); the master then only checks the schema.
+"""
+import gc
+import os
+
+wsgi_app = 'app:create_app()'
+# gunicorn's own default is a single worker; live-count streams need several to spread over
+workers = int(os.environ.get('WEB_CONCURRENCY', (os.cpu_count() or 1) * 2 + 1))
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+
+def on_starting(server):
+    if not server.cfg.preload_app:
+        from schema import prepare
+        prepare(os.environ.get('DATABASE', 'database.db'))
+
+
+def when_ready(server):
+    if server.cfg.preload_app:
+        # Keep the collector from touching (and so copying) the preloaded objects in every worker
+        gc.freeze()
@@ -0,0 +1,411 @@
+import bisect
+import cProfile
+import heapq
+import io
+import itertools
+import os
+import pstats
+import random
+import sqlite3
+import sys
+import threading
+import time
+from functools import lru_cache
+
+from werkzeug.wsgi import ClosingIterator
+
+# Upper bounds in seconds, as Prometheus histogram buckets
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_LABEL = 160  # characters of normalised SQL kept per statement
+
+_local = threading.local()
+
+
+def current_request():
+    """The RequestStats of the request running on this thread, or None."""
+    return getattr(_local, 'stats', None)
+
+
+class Histogram:
+    __slots__ = ('counts', 'count', 'sum')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Estimate the q-quantile by interpolating inside its bucket, as Prometheus does."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = BUCKETS[i - 1] if i else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return BUCKETS[-1]
+
+
+class RequestStats:
+    __slots__ = ('endpoint', 'started', 'sql_seconds', 'sql_statements', 'statements', 'templates',
+                 'renders', 'status', 'fragment_hits', 'fragment_misses', 'fragment_saved')
+
+    def __init__(self):
+        self.endpoint = 'unmatched'
+        self.started = time.perf_counter()
+        self.sql_seconds = 0.0
+        self.sql_statements = 0
+        self.statements = {}  # label -> [calls, seconds]
+        self.templates = []  # (template, seconds rendering, SQL excluded)
+        self.renders = []  # stack of (template, started, sql seconds so far)
+        self.status = 0
+        self.fragment_hits = 0  # {% cache %} blocks served from the fragment cache
+        self.fragment_misses = 0
+        self.fragment_saved = 0.0  # seconds those hits took to render when they were cached
+
+    def add_sql(self, label, elapsed, calls=0):
+        # Fetches add time to the statement that produced the rows without counting as a call
+        self.sql_seconds += elapsed
+        entry = self.statements.get(label)
+        if entry is None:
+            self.statements[label] = [calls, elapsed]
+        else:
+            entry[0] += calls
+            entry[1] += elapsed
+
+
+@lru_cache(maxsize=1024)
+def _label(sql):
+    return ' '.join(sql.split())[:STATEMENT_LABEL]
+
+
+def _count_statement(statement):
+    # sqlite3 trace callback: fires for every statement SQLite runs, including the
+    # implicit BEGIN and COMMIT the sqlite3 module issues
+    stats = current_request()
+    if stats is not None:
+        stats.sql_statements += 1
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that charges execute and fetch time to the current request's statement totals."""
+
+    _statement = None
+
+    def execute(self, sql, *args):
+        self._statement = _label(sql)
+        return self._timed(super().execute, sql, *args, calls=1)
+
+    def executemany(self, sql, *args):
+        self._statement = _label(sql)
+        return self._timed(super().executemany, sql, *args, calls=1)
+
+    def fetchone(self):
+        return self._timed(super().fetchone)
+
+    def fetchmany(self, *args):
+        return self._timed(super().fetchmany, *args)
+
+    def fetchall(self):
+        return self._timed(super().fetchall)
+
+    def __next__(self):
+        return self._timed(super().__next__)
+
+    def _timed(self, call, *args, calls=0):
+        stats = current_request()
+        if stats is None:
+            return call(*args)
+        started = time.perf_counter()
+        try:
+            return call(*args)
+        finally:
+            stats.add_sql(self._statement, time.perf_counter() - started, calls)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose statements are timed per request; pass as `factory` to sqlite3.connect."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.set_trace_callback(_count_statement)
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # Connection.execute bypasses cursor(), so route the shortcuts through it
+    def execute(self, sql, *args):
+        return self.cursor().execute(sql, *args)
+
+    def executemany(self, sql, *args):
+        return self.cursor().executemany(sql, *args)
+
+    def commit(self):
+        stats = current_request()
+        if stats is None:
+            return super().commit()
+        started = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            stats.add_sql('COMMIT', time.perf_counter() - started, 1)
+
+
+class Metrics:
+    """Aggregated request, SQL and template timings for this process.
+
+    Every gunicorn worker keeps its own; a Prometheus scrape sees the worker that served it,
+    which is what the `pid` in the output is for.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.since = time.time()
+            self.requests = {}  # endpoint -> Histogram of wall time
+            self.sql = {}  # endpoint -> Histogram of SQL time per request
+            self.templates = {}  # (endpoint, template) -> Histogram of render time, SQL excluded
+            self.statement_counts = {}  # endpoint -> statements SQLite ran
+            self.errors = {}  # endpoint -> 5xx responses
+            self.statements = {}  # label -> [calls, seconds, slowest call total in one request]
+            self.fragments = {}  # endpoint -> [fragment cache hits, misses, seconds saved]
+
+    def record(self, stats, elapsed):
+        endpoint = stats.endpoint
+        with self._lock:
+            self._histogram(self.requests, endpoint).observe(elapsed)
+            self._histogram(self.sql, endpoint).observe(stats.sql_seconds)
+            for template, seconds in stats.templates:
+                self._histogram(self.templates, (endpoint, template)).observe(seconds)
+            self.statement_counts[endpoint] = self.statement_counts.get(endpoint, 0) + stats.sql_statements
+            if stats.status >= 500:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+            if stats.fragment_hits or stats.fragment_misses:
+                fragments = self.fragments.setdefault(endpoint, [0, 0, 0.0])
+                fragments[0] += stats.fragment_hits
+                fragments[1] += stats.fragment_misses
+                fragments[2] += stats.fragment_saved
+            for label, (calls, seconds) in stats.statements.items():
+                entry = self.statements.get(label)
+                if entry is None:
+                    self.statements[label] = [calls, seconds, seconds]
+                else:
+                    entry[0] += calls
+                    entry[1] += seconds
+                    entry[2] = max(entry[2], seconds)
+
+    @staticmethod
+    def _histogram(table, key):
+        histogram = table.get(key)
+        if histogram is None:
+            histogram = table[key] = Histogram()
+        return histogram
+
+    def summary(self, top=25):
+        """Per-endpoint rows and the most expensive statements, for the admin page."""
+        with self._lock:
+            template_seconds = {}
+            for (endpoint, _), histogram in self.templates.items():
+                template_seconds[endpoint] = template_seconds.get(endpoint, 0.0) + histogram.sum
+            endpoints = []
+            for endpoint, histogram in self.requests.items():
+                sql = self.sql[endpoint].sum
+                rendered = template_seconds.get(endpoint, 0.0)
+                hits, misses, saved = self.fragments.get(endpoint, (0, 0, 0.0))
+                endpoints.append({
+                    'endpoint': endpoint,
+                    'requests': histogram.count,
+                    'errors': self.errors.get(endpoint, 0),
+                    'mean_ms': histogram.sum / histogram.count * 1000,
+                    'p50_ms': histogram.quantile(0.5) * 1000,
+                    'p95_ms': histogram.quantile(0.95) * 1000,
+                    'p99_ms': histogram.quantile(0.99) * 1000,
+                    'sql_ms': sql / histogram.count * 1000,
+                    'statements': self.statement_counts.get(endpoint, 0) / histogram.count,
+                    'template_ms': rendered / histogram.count * 1000,
+                    'python_ms': max(0.0, histogram.sum - sql - rendered) / histogram.count * 1000,
+                    'fragment_hit_rate': hits / (hits + misses) if hits + misses else None,
+                    'saved_ms': saved / histogram.count * 1000,
+                    'total_s': histogram.sum,
+                })
+            endpoints.sort(key=lambda row: row['total_s'], reverse=True)
+            statements = [{'sql': label, 'calls': calls, 'total_ms': seconds * 1000,
+                           'mean_ms': seconds / calls * 1000, 'worst_request_ms': worst * 1000}
+                          for label, (calls, seconds, worst) in self.statements.items()]
+        statements.sort(key=lambda row: row['total_ms'], reverse=True)
+        return endpoints, statements[:top]
+
+    def prometheus(self, prefix='voting'):
+        """Render everything in the Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        pid = os.getpid()
+        with self._lock:
+            self._histogram_lines(lines, f'{prefix}_request_seconds',
+                                  'Wall time from receiving a request to the end of its response body.',
+                                  {(('endpoint', e),): h for e, h in self.requests.items()}, pid)
+            self._histogram_lines(lines, f'{prefix}_request_sql_seconds',
+                                  'Time spent executing and fetching SQLite statements per request.',
+                                  {(('endpoint', e),): h for e, h in self.sql.items()}, pid)
+            self._histogram_lines(lines, f'{prefix}_template_render_seconds',
+                                  'Jinja rendering time per template, excluding SQL run while rendering.',
+                                  {(('endpoint', e), ('template', t)): h for (e, t), h in self.templates.items()},
+                                  pid)
+            self._counter_lines(lines, f'{prefix}_sql_statements_total', 'Statements SQLite ran, by endpoint.',
+                                {(('endpoint', e),): n for e, n in self.statement_counts.items()}, pid)
+            self._counter_lines(lines, f'{prefix}_request_errors_total', 'Responses with a 5xx status.',
+                                {(('endpoint', e),): n for e, n in self.errors.items()}, pid)
+            self._counter_lines(lines, f'{prefix}_fragment_cache_hits_total',
+                                'Template fragments served from the fragment cache.',
+                                {(('endpoint', e),): v[0] for e, v in self.fragments.items()}, pid)
+            self._counter_lines(lines, f'{prefix}_fragment_cache_misses_total',
+                                'Template fragments rendered and stored in the fragment cache.',
+                                {(('endpoint', e),): v[1] for e, v in self.fragments.items()}, pid)
+            self._counter_lines(lines, f'{prefix}_fragment_cache_saved_seconds_total',
+                                'Rendering time the fragment cache hits saved, as measured when each was stored.',
+                                {(('endpoint', e),): v[2] for e, v in self.fragments.items()}, pid)
+            self._counter_lines(lines, f'{prefix}_sql_statement_seconds_total',
+                                'Time spent in each distinct SQL statement.',
+                                {(('statement', s),): v[1] for s, v in self.statements.items()}, pid)
+            self._counter_lines(lines, f'{prefix}_sql_statement_calls_total',
+                                'Executions of each distinct SQL statement.',
+                                {(('statement', s),): v[0] for s, v in self.statements.items()}, pid)
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _labels(labels, pid, extra=()):
+        pairs = labels + (('pid', pid),) + extra
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+    def _histogram_lines(self, lines, name, help_text, histograms, pid):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+        for labels, histogram in sorted(histograms.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(BUCKETS + ('+Inf',), histogram.counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{self._labels(labels, pid, (("le", bound),))} {cumulative}')
+            lines.append(f'{name}_sum{self._labels(labels, pid)} {histogram.sum:.6f}')
+            lines.append(f'{name}_count{self._labels(labels, pid)} {histogram.count}')
+
+    def _counter_lines(self, lines, name, help_text, values, pid):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} counter')
+        for labels, value in sorted(values.items()):
+            lines.append(f'{name}{self._labels(labels, pid)} {value:.6f}' if isinstance(value, float)
+                         else f'{name}{self._labels(labels, pid)} {value}')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class SlowRequestProfiler:
+    """Opt-in cProfile capture that keeps the `keep` slowest profiled requests.
+
+    While enabled, a `sample_rate` fraction of requests run under cProfile; only the
+    report text of the slowest ones is kept. Off by default, since profiling roughly
+    doubles the cost of Python-heavy requests.
+    """
+
+    def __init__(self, keep=10, sample_rate=1.0, enabled=False):
+        self.keep = keep
+        self.sample_rate = sample_rate
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._slowest = []  # min-heap of (seconds, id, profile dict)
+
+    def start(self):
+        if not self.enabled or sys.getprofile() is not None or random.random() >= self.sample_rate:
+            return None  # also skipped when a debugger or another profiler owns this thread
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def finish(self, profiler, endpoint, path, seconds):
+        profiler.disable()
+        with self._lock:
+            if len(self._slowest) >= self.keep and seconds <= self._slowest[0][0]:
+                return
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(40)
+        entry = {'id': next(self._ids), 'endpoint': endpoint, 'path': path, 'ms': seconds * 1000,
+                 'captured': time.strftime('%Y-%m-%d %H:%M:%S'), 'report': out.getvalue()}
+        with self._lock:
+            heapq.heappush(self._slowest, (seconds, entry['id'], entry))
+            while len(self._slowest) > self.keep:
+                heapq.heappop(self._slowest)
+
+    def profiles(self):
+        with self._lock:
+            return [entry for _, _, entry in sorted(self._slowest, reverse=True)]
+
+    def get(self, profile_id):
+        with self._lock:
+            return next((entry for _, _, entry in self._slowest if entry['id'] == profile_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._slowest = []
+
+
+class InstrumentationMiddleware:
+    """WSGI wrapper that times each request end to end, body streaming included.
+
+    Wrapping the WSGI app rather than using before/after_request also covers the
+    session lookup and save. Flask hooks fill in the endpoint and template timings
+    through current_request().
+    """
+
+    def __init__(self, wsgi_app, metrics, profiler):
+        self.wsgi_app = wsgi_app
+        self.metrics = metrics
+        self.profiler = profiler
+
+    def __call__(self, environ, start_response):
+        stats = _local.stats = RequestStats()
+        profiler = self.profiler.start()
+
+        def capture_status(status, headers, exc_info=None):
+            stats.status = int(status.split(' ', 1)[0])
+            return start_response(status, headers, exc_info)
+
+        def finish():
+            elapsed = time.perf_counter() - stats.started
+            if profiler is not None:
+                self.profiler.finish(profiler, stats.endpoint, environ.get('PATH_INFO', ''), elapsed)
+            _local.stats = None
+            self.metrics.record(stats, elapsed)
+
+        try:
+            body = self.wsgi_app(environ, capture_status)
+        except BaseException:
+            stats.status = 500
+            finish()
+            raise
+        return ClosingIterator(body, finish)
+
+
+def template_started(template):
+    stats = current_request()
+    if stats is not None:
+        stats.renders.append((template.name or 'string', time.perf_counter(), stats.sql_seconds))
+
+
+def template_finished(template):
+    stats = current_request()
+    if stats is not None and stats.renders:
+        name, started, sql_before = stats.renders.pop()
+        seconds = time.perf_counter() - started - (stats.sql_seconds - sql_before)
+        stats.templates.append((name, max(0.0, seconds)))
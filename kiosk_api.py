@@ -0,0 +1,60 @@
+import hashlib
+import hmac
+import json
+import secrets
+from datetime import datetime
+
+# Fields covered by a kiosk's signature; anything else in a ballot (e.g. the kiosk's own id) is not trusted
+SIGNED_FIELDS = ('election_id', 'regno', 'selections', 'cast_at')
+
+
+def create_kiosk(db, name):
+    """Register a polling-station kiosk; returns (kiosk id, signing secret). The caller commits."""
+    kiosk_id = f'kiosk-{secrets.token_hex(4)}'
+    secret = secrets.token_urlsafe(32)
+    db.execute("INSERT INTO kiosks (id, name, secret, created) VALUES (?, ?, ?, ?)",
+               (kiosk_id, name, secret, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+    return kiosk_id, secret
+
+
+def canonical_ballot(ballot):
+    """The bytes a kiosk signs: the signed fields as compact JSON with sorted keys."""
+    return json.dumps({field: ballot.get(field) for field in SIGNED_FIELDS},
+                      sort_keys=True, separators=(',', ':')).encode()
+
+
+def sign_ballot(secret, ballot):
+    return hmac.new(secret.encode(), canonical_ballot(ballot), hashlib.sha256).hexdigest()
+
+
+def parse_ballot(secret, ballot, timestamp_format):
+    """Check one uploaded ballot's signature and shape.
+
+    A ballot looks like {"election_id": 1, "regno": "CSE2025_1001", "selections":
+    {"<position id>": <candidate id>, ...}, "cast_at": "2025-01-01 09:30:00", "signature":
+    "<hex HMAC-SHA256 of canonical_ballot() with the kiosk secret>"}. Approval and ranked
+    positions take a list of candidate ids instead, ranked ones in order of preference.
+    Returns (election_id, regno, {position_id: [candidate_id, ...]}, cast_at); raises
+    ValueError with a message for the kiosk otherwise.
+    """
+    if not isinstance(ballot, dict):
+        raise ValueError("Ballot must be a JSON object.")
+    signature = ballot.get('signature')
+    if not isinstance(signature, str) or not hmac.compare_digest(signature, sign_ballot(secret, ballot)):
+        raise ValueError("Signature does not match.")
+
+    election_id, regno, selections, cast_at = (ballot.get(field) for field in SIGNED_FIELDS)
+    if type(election_id) is not int or not isinstance(regno, str) or not isinstance(selections, dict):
+        raise ValueError("election_id, regno and selections are required.")
+    try:
+        picks = {int(position_id): candidate_ids if isinstance(candidate_ids, list) else [candidate_ids]
+                 for position_id, candidate_ids in selections.items()}
+    except ValueError:
+        raise ValueError("Selection keys must be position ids.") from None
+    if any(type(candidate_id) is not int for candidate_ids in picks.values() for candidate_id in candidate_ids):
+        raise ValueError("Selections must map position ids to candidate ids.")
+    try:
+        datetime.strptime(cast_at, timestamp_format)
+    except (TypeError, ValueError):
+        raise ValueError(f"cast_at must look like {datetime(2025, 1, 1, 9, 30).strftime(timestamp_format)}.") from None
+    return election_id, regno, picks, cast_at
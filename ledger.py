@@ -0,0 +1,378 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+# Entries per Merkle checkpoint; baked into the dirty-block triggers, so never change it on a live database
+BLOCK_SIZE = 1024
+GENESIS = '0' * 64
+Checkpoint = namedtuple('Checkpoint', 'block first_seq last_seq merkle_root last_hash verified')
+SEAL_CHUNK = 50000  # entries hashed per transaction, so a big backlog never holds the write lock for long
+
+# Every ballot and audit change appends a ledger entry in the same transaction, whichever
+# connection makes it; the app only hashes entries afterwards (seal), so no SQL function
+# needs registering and the sqlite3 shell still works
+TRIGGERS = {
+    'ledger_ballot_insert': ('AFTER INSERT ON ballots', 'ballots', 'ballot', 'NEW'),
+    'ledger_ballot_update': ('AFTER UPDATE ON ballots', 'ballots', 'ballot_changed', 'NEW'),
+    'ledger_ballot_delete': ('AFTER DELETE ON ballots', 'ballots', 'ballot_removed', 'OLD'),
+    'ledger_audit_insert': ('AFTER INSERT ON audit_log', 'audit_log', 'audit', 'NEW'),
+    'ledger_audit_update': ('AFTER UPDATE ON audit_log', 'audit_log', 'audit_changed', 'NEW'),
+    'ledger_audit_delete': ('AFTER DELETE ON audit_log', 'audit_log', 'audit_removed', 'OLD'),
+}
+# Changes to sealed entries or checkpoints flag their block for the next incremental verify
+DIRTY_TRIGGERS = {
+    'ledger_sealed_update': f'''AFTER UPDATE ON ledger WHEN OLD.hash IS NOT NULL
+        BEGIN INSERT OR IGNORE INTO ledger_dirty (block) VALUES ((OLD.seq - 1) / {BLOCK_SIZE}); END''',
+    'ledger_sealed_delete': f'''AFTER DELETE ON ledger
+        BEGIN INSERT OR IGNORE INTO ledger_dirty (block) VALUES ((OLD.seq - 1) / {BLOCK_SIZE}); END''',
+    'ledger_checkpoint_update': '''AFTER UPDATE OF block, first_seq, last_seq, merkle_root, last_hash ON ledger_checkpoints
+        BEGIN INSERT OR IGNORE INTO ledger_dirty (block) VALUES (OLD.block); END''',
+    'ledger_checkpoint_delete': '''AFTER DELETE ON ledger_checkpoints
+        BEGIN INSERT OR IGNORE INTO ledger_dirty (block) VALUES (OLD.block); END''',
+}
+
+
+def create_ledger(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ledger (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            ref INTEGER NOT NULL,
+            payload TEXT NOT NULL,
+            hash TEXT
+        )
+    ''')
+    # Covers the live-ballot consistency check and per-row lookups
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_ledger_kind_ref ON ledger (kind, ref)")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ledger_checkpoints (
+            block INTEGER PRIMARY KEY,
+            first_seq INTEGER NOT NULL,
+            last_seq INTEGER NOT NULL,
+            merkle_root TEXT NOT NULL,
+            last_hash TEXT NOT NULL,
+            created TEXT NOT NULL,
+            verified TEXT
+        )
+    ''')
+    conn.execute("CREATE TABLE IF NOT EXISTS ledger_dirty (block INTEGER PRIMARY KEY) WITHOUT ROWID")
+    # verify() reports, newest last, so the admin page serves one instead of verifying on the request thread
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ledger_reports (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            finished TEXT NOT NULL,
+            requested_by TEXT,
+            ok INTEGER NOT NULL,
+            report TEXT NOT NULL
+        )
+    ''')
+    for name, (event, table, kind, row) in TRIGGERS.items():
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {name} {event}
+            BEGIN
+                INSERT INTO ledger (kind, ref, payload) VALUES ('{kind}', {row}.id, {_payload(conn, table, row)});
+            END
+        ''')
+    for name, body in DIRTY_TRIGGERS.items():
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+
+
+def _payload(conn, table, row):
+    # Every column but id, so columns added later are covered once refresh_triggers() runs
+    columns = [info[1] for info in conn.execute(f"PRAGMA table_info({table})") if info[1] != 'id']
+    pairs = ', '.join(f"'{column}', {row}.{column}" for column in columns)
+    return f"json_object({pairs})"
+
+
+def refresh_triggers(conn, table):
+    """Recreate `table`'s ledger triggers after a migration adds columns to it."""
+    for name, (_, trigger_table, _, _) in TRIGGERS.items():
+        if trigger_table == table:
+            conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    create_ledger(conn)
+
+
+def backfill(conn):
+    """Record the rows that predate the ledger, ballots then audit rows, each in id order."""
+    for table, kind in (('ballots', 'ballot'), ('audit_log', 'audit')):
+        conn.execute(f"INSERT INTO ledger (kind, ref, payload) SELECT '{kind}', id, {_payload(conn, table, table)} "
+                     f"FROM {table} ORDER BY id")
+
+
+def entry_hash(prev, seq, kind, ref, payload):
+    return hashlib.sha256(f'{prev}|{seq}|{kind}|{ref}|{payload}'.encode()).hexdigest()
+
+
+def merkle_root(hashes):
+    level = [bytes.fromhex(h) for h in hashes]
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+        level = [hashlib.sha256(level[i] + level[i + 1]).digest() for i in range(0, len(level), 2)]
+    return level[0].hex() if level else GENESIS
+
+
+def _block_range(block):
+    return block * BLOCK_SIZE + 1, (block + 1) * BLOCK_SIZE
+
+
+def seal(conn):
+    """Hash-chain every unhashed entry and checkpoint each block that is now full.
+
+    Returns the number of entries sealed. Safe to run from several processes at once:
+    each pass holds the write lock for at most SEAL_CHUNK entries.
+    """
+    sealed = 0
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            head = conn.execute("SELECT seq, hash FROM ledger WHERE hash IS NOT NULL "
+                                "ORDER BY seq DESC LIMIT 1").fetchone()
+            head_seq, prev = (head[0], head[1]) if head else (0, GENESIS)
+            rows = conn.execute("SELECT seq, kind, ref, payload FROM ledger WHERE seq > ? ORDER BY seq LIMIT ?",
+                                (head_seq, SEAL_CHUNK)).fetchall()
+            updates = []
+            for seq, kind, ref, payload in rows:
+                prev = entry_hash(prev, seq, kind, ref, payload)
+                updates.append((prev, seq))
+            conn.executemany("UPDATE ledger SET hash = ? WHERE seq = ?", updates)
+            _checkpoint(conn, updates[-1][1] if updates else head_seq)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        sealed += len(rows)
+        if len(rows) < SEAL_CHUNK:
+            return sealed
+
+
+def _checkpoint(conn, sealed_through):
+    row = conn.execute("SELECT MAX(block) FROM ledger_checkpoints").fetchone()
+    block = 0 if row[0] is None else row[0] + 1
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    while _block_range(block)[1] <= sealed_through:
+        first, last = _block_range(block)
+        hashes = [h for (h,) in conn.execute("SELECT hash FROM ledger WHERE seq BETWEEN ? AND ? ORDER BY seq",
+                                             (first, last))]
+        conn.execute("INSERT INTO ledger_checkpoints (block, first_seq, last_seq, merkle_root, last_hash, created) "
+                     "VALUES (?, ?, ?, ?, ?, ?)", (block, first, last, merkle_root(hashes), hashes[-1], now))
+        block += 1
+
+
+def _check_block(conn, block, checkpoint, prev):
+    """Recompute one sealed block from `prev`; returns a list of problems."""
+    first, last = _block_range(block)
+    rows = conn.execute("SELECT seq, kind, ref, payload, hash FROM ledger WHERE seq BETWEEN ? AND ? ORDER BY seq",
+                        (first, last)).fetchall()
+    if len(rows) != BLOCK_SIZE:
+        return [f"block {block}: {BLOCK_SIZE - len(rows)} entr(ies) missing"]
+    problems = []
+    hashes = []
+    for seq, kind, ref, payload, stored in rows:
+        # Each link is checked against the stored hash before it, so one edit is reported once
+        if stored != entry_hash(prev, seq, kind, ref, payload) and len(problems) < 5:
+            problems.append(f"block {block}: entry {seq} ({kind} {ref}) does not match its hash")
+        hashes.append(stored)
+        prev = stored
+    if checkpoint is None:
+        problems.append(f"block {block}: checkpoint missing")
+    elif (checkpoint.first_seq, checkpoint.last_seq) != (first, last) \
+            or merkle_root(hashes) != checkpoint.merkle_root or hashes[-1] != checkpoint.last_hash:
+        problems.append(f"block {block}: Merkle root or chain head differs from its checkpoint")
+    return problems
+
+
+def _check_ballots(conn, since=None, limit=5):
+    """Compare live ballots with the latest ledger entry for their id; returns a list of problems.
+
+    With `since` (a ledger seq) only ballots named by later entries, and ballots newer than any
+    entry up to it, are compared; otherwise every ballot is.
+    """
+    kinds = "kind IN ('ballot', 'ballot_changed', 'ballot_removed')"
+    ref_scope = id_scope = ''
+    if since is not None:
+        refs = (f"(SELECT ref FROM ledger WHERE seq > {int(since)} AND {kinds} "
+                f"UNION SELECT id FROM ballots WHERE id > (SELECT COALESCE(MAX(ref), 0) FROM ledger "
+                f"WHERE seq <= {int(since)} AND {kinds}))")
+        ref_scope, id_scope = f"AND ref IN {refs}", f"AND b.id IN {refs}"
+    latest = (f"SELECT l.ref, l.kind, l.payload FROM ledger l JOIN (SELECT ref, MAX(seq) AS seq FROM ledger "
+              f"WHERE {kinds} {ref_scope} GROUP BY ref) m ON m.seq = l.seq")
+    problems = []
+    rows = conn.execute(f'''
+        SELECT b.id, e.kind, e.payload, {_payload(conn, 'ballots', 'b')}
+        FROM ballots b LEFT JOIN ({latest}) e ON e.ref = b.id
+        WHERE (e.kind IS NULL OR e.kind = 'ballot_removed' OR e.payload != {_payload(conn, 'ballots', 'b')})
+              {id_scope}
+        ORDER BY b.id
+    ''')
+    for ballot_id, kind, recorded, current in rows:
+        if kind is None:
+            problems.append(f"ballot {ballot_id}: not in the ledger")
+        elif kind == 'ballot_removed':
+            problems.append(f"ballot {ballot_id}: the ledger records it as removed")
+        else:
+            # Entries written before a migration added a column lack that key; compare the rest
+            recorded, current = json.loads(recorded), json.loads(current)
+            changed = sorted(key for key in recorded if recorded[key] != current.get(key))
+            if not changed:
+                continue
+            problems.append(f"ballot {ballot_id}: {', '.join(changed)} differ(s) from the ledger")
+    for (ballot_id,) in conn.execute(f"SELECT e.ref FROM ({latest}) e WHERE e.kind != 'ballot_removed' "
+                                     "AND NOT EXISTS (SELECT 1 FROM ballots b WHERE b.id = e.ref) ORDER BY e.ref"):
+        problems.append(f"ballot {ballot_id}: in the ledger but missing from ballots")
+    if len(problems) > limit:
+        problems[limit:] = [f"ballots: {len(problems) - limit} more mismatch(es)"]
+    return problems
+
+
+def verify(conn, full=False):
+    """Check the ledger and return a report dict; `ok` is False when anything was tampered with.
+
+    Seals pending entries first. Incremental runs re-hash only blocks never verified and
+    blocks whose sealed entries or checkpoint changed since (flagged by triggers), plus the
+    unfilled tail; full=True re-hashes everything. Also checks the ledger triggers are
+    still installed and that live ballots match their latest ledger entry: those touched by
+    the entries being re-hashed on incremental runs, every ballot on full ones.
+    """
+    started = time.perf_counter()
+    seal(conn)
+    problems = []
+
+    installed = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+    for name in (*TRIGGERS, *DIRTY_TRIGGERS):
+        if name not in installed:
+            problems.append(f"trigger {name} is missing; changes are no longer being recorded")
+
+    checkpoints = {row[0]: Checkpoint(*row) for row in conn.execute(
+        f"SELECT {', '.join(Checkpoint._fields)} FROM ledger_checkpoints")}
+    last_block = max(checkpoints, default=-1)
+    dirty = {block for (block,) in conn.execute("SELECT block FROM ledger_dirty")}
+    if full:
+        blocks = set(range(last_block + 1))
+    else:
+        blocks = {b for b, row in checkpoints.items() if row.verified is None} | dirty
+    for block in set(checkpoints) ^ set(range(last_block + 1)):
+        problems.append(f"block {block}: checkpoint missing")
+
+    entries = 0
+    for block in sorted(b for b in blocks if b <= last_block):
+        prev = GENESIS if block == 0 else checkpoints[block - 1].last_hash if block - 1 in checkpoints else None
+        if prev is None:
+            continue
+        problems.extend(_check_block(conn, block, checkpoints.get(block), prev))
+        entries += BLOCK_SIZE
+
+    # Entries after the last full block chain on from its head; re-hashed on every run
+    prev = checkpoints[last_block].last_hash if last_block >= 0 else GENESIS
+    tail = conn.execute("SELECT seq, kind, ref, payload, hash FROM ledger WHERE seq > ? AND hash IS NOT NULL "
+                        "ORDER BY seq", (_block_range(last_block)[1],)).fetchall()
+    expected_seq = _block_range(last_block)[1] + 1
+    for seq, kind, ref, payload, stored in tail:
+        if seq != expected_seq:
+            problems.append(f"tail: entries {expected_seq}-{seq - 1} missing")
+        if stored != entry_hash(prev, seq, kind, ref, payload):
+            problems.append(f"tail: entry {seq} ({kind} {ref}) does not match its hash")
+        prev = stored
+        expected_seq = seq + 1
+    entries += len(tail)
+    # AUTOINCREMENT never reuses a seq, so entries cut off the end still leave a gap here
+    allocated, newest = conn.execute("SELECT (SELECT seq FROM sqlite_sequence WHERE name = 'ledger'), "
+                                     "(SELECT MAX(seq) FROM ledger)").fetchone()
+    newest = newest or 0
+    if (allocated or 0) != newest:
+        problems.append(f"tail: entries {newest + 1}-{allocated} missing")
+
+    # Entries up to `since` were cross-checked by an earlier run that passed
+    since = None if full else _block_range(min(blocks))[0] - 1 if blocks else _block_range(last_block)[1]
+    problems.extend(_check_ballots(conn, since))
+
+    if not problems:
+        conn.execute("BEGIN IMMEDIATE")
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        conn.executemany("UPDATE ledger_checkpoints SET verified = ? WHERE block = ?", [(now, b) for b in blocks])
+        conn.execute("DELETE FROM ledger_dirty")
+        conn.commit()
+
+    return {
+        'ok': not problems,
+        'problems': problems,
+        'full': full,
+        'blocks_checked': len([b for b in blocks if b <= last_block]),
+        'blocks_sealed': last_block + 1,
+        'entries_checked': entries,
+        'entries_total': newest,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+def record_report(conn, report, requested_by=None):
+    """Store a verify() report inside the caller's transaction, for last_report() to serve."""
+    report = dict(report, finished=datetime.now().strftime('%Y-%m-%d %H:%M:%S'), requested_by=requested_by)
+    conn.execute("INSERT INTO ledger_reports (finished, requested_by, ok, report) VALUES (?, ?, ?, ?)",
+                 (report['finished'], requested_by, report['ok'], json.dumps(report)))
+    return report
+
+
+def last_report(conn):
+    row = conn.execute("SELECT id, report FROM ledger_reports ORDER BY id DESC LIMIT 1").fetchone()
+    return dict(json.loads(row[1]), id=row[0]) if row else None
+
+
+class LedgerSealer:
+    """Background thread that seals new ledger entries every `interval` seconds.
+
+    Bounds how long an entry sits unhashed; started lazily so each forked worker has its own.
+    It also runs the verifications queued with verify_soon(), recording each report and
+    passing it, with the thread's connection, to `on_report` before committing.
+    """
+
+    def __init__(self, connect, interval=5.0, on_report=None):
+        self.connect = connect
+        self.interval = interval
+        self.on_report = on_report
+        self._thread = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pending = None  # (full, requested_by) of the next verification
+
+    def verify_soon(self, full=False, requested_by=None):
+        """Queue a verification for the sealer thread; a queued full run is never downgraded."""
+        with self._lock:
+            full = full or bool(self._pending and self._pending[0])
+            self._pending = (full, requested_by)
+        self.ensure_started()
+        self._wake.set()
+
+    def ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='ledger-sealer', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        conn = self.connect()
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            with self._lock:
+                pending, self._pending = self._pending, None
+            try:
+                if pending is None:
+                    seal(conn)
+                    continue
+                report = record_report(conn, verify(conn, full=pending[0]), pending[1])
+                if self.on_report is not None:
+                    self.on_report(conn, report)
+                conn.commit()
+            except sqlite3.OperationalError:
+                # Database busy; the next pass catches up, and retries a verification it dropped
+                if conn.in_transaction:
+                    conn.rollback()
+                if pending is not None:
+                    with self._lock:
+                        self._pending = self._pending or pending
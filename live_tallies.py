@@ -0,0 +1,167 @@
+import json
+import threading
+import time
+
+
+class TallyBroadcaster:
+    """Share one tally computation per change among every live-count viewer in the process.
+
+    A single background thread watches the 'ballot' and 'tallies' rows of the versions
+    table (one primary-key lookup per poll, or immediately after notify() is called by a
+    local vote commit). When either moves it reloads the tally snapshot of every unarchived
+    election once and publishes the candidates whose counts changed. Viewers in other
+    gunicorn workers pick the change up on their own process's next poll.
+
+    Viewers only ever see their own election's candidates. An open stream holds a worker
+    thread, so at most `max_streams` run at once per process; viewers beyond that are told
+    to poll() instead, which answers at once. A failing poll (database locked, say) is
+    counted in `errors` and retried after `interval`, so viewers never wait on a dead thread.
+    The thread starts with the first stream or poll and stops once no stream is open and
+    nobody has polled for `idle` seconds; the next viewer then waits for a fresh load.
+    """
+
+    def __init__(self, connect, interval=1.0, heartbeat=15.0, lifetime=300.0, max_streams=4, ready_timeout=5.0,
+                 idle=30.0):
+        self.connect = connect
+        self.interval = interval
+        self.heartbeat = heartbeat
+        self.lifetime = lifetime  # EventSource reconnects by itself, freeing the worker thread
+        self.max_streams = max_streams
+        self.ready_timeout = ready_timeout
+        self.idle = idle  # a few of live_tallies.js's poll intervals
+        self.errors = 0
+        self._cond = threading.Condition()
+        self._wake = threading.Event()
+        self._thread = None
+        self._streams = 0
+        self._polled = 0.0  # time.monotonic() of the last poll()
+        self._seq = 0
+        self._layout = None
+        self._counts = {}  # election id -> {candidate id (str): votes}
+        self._changes = {}  # election id -> changes published with _seq
+
+    def notify(self):
+        self._wake.set()
+
+    def poll(self, election_id, since=None):
+        """The update a poller at sequence `since` needs, as a dict with its `seq` and `type`:
+        'snapshot' (layout and counts), 'tallies' (changes) or 'none'; None until the first load."""
+        self._ensure_started()
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._layout is not None, timeout=self.ready_timeout):
+                return None
+            if since == self._seq:
+                return {'seq': self._seq, 'type': 'none'}
+            if since == self._seq - 1:
+                return {'seq': self._seq, 'type': 'tallies', 'changes': self._changes.get(election_id, [])}
+            return {'seq': self._seq, 'type': 'snapshot', 'layout': self._layout,
+                    'counts': self._counts.get(election_id, {})}
+
+    def stream(self, election_id):
+        """Yield server-sent events for one election: a full snapshot first, then tally deltas as
+        they commit. Sends a single 'busy' event instead when the process has no stream to spare."""
+        with self._cond:
+            admitted = self._streams < self.max_streams
+            if admitted:
+                self._streams += 1
+        if not admitted:
+            yield self._event('busy', {})
+            return
+        try:
+            update = self.poll(election_id)
+            if update is None:
+                yield self._event('busy', {})
+                return
+            seq, layout = update['seq'], update['layout']
+            yield self._event('snapshot', update)
+
+            expires = time.monotonic() + self.lifetime
+            while time.monotonic() < expires:
+                with self._cond:
+                    self._cond.wait_for(lambda: self._seq != seq,
+                                        timeout=max(0, min(self.heartbeat, expires - time.monotonic())))
+                    if self._seq == seq:
+                        event = ': keep-alive\n\n'
+                    elif self._layout != layout or self._seq != seq + 1:
+                        # Positions/candidates changed or we fell behind: resend everything
+                        event = self._event('snapshot', {'layout': self._layout,
+                                                         'counts': self._counts.get(election_id, {})})
+                    else:
+                        changes = self._changes.get(election_id)
+                        event = self._event('tallies', {'changes': changes}) if changes else ': keep-alive\n\n'
+                    seq, layout = self._seq, self._layout
+                yield event
+        finally:
+            with self._cond:
+                self._streams -= 1
+
+    def _event(self, name, data):
+        return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+    def _ensure_started(self):
+        with self._cond:
+            self._polled = time.monotonic()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='tally-broadcaster', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        conn, versions = None, None
+        while not self._stop_if_idle(conn):
+            try:
+                if conn is None:
+                    conn = self.connect()
+                current = dict(conn.execute(
+                    "SELECT name, version FROM versions WHERE name IN ('ballot', 'tallies')").fetchall())
+                key = (current.get('ballot', 0), current.get('tallies', 0))
+                if key != versions:
+                    self._publish(key[0], conn.execute('''
+                        SELECT e.id, c.id, COALESCE(t.votes, 0)
+                        FROM elections e
+                        JOIN candidates c ON c.election_id = e.id
+                        LEFT JOIN tallies t ON t.election_id = e.id AND t.candidate_id = c.id
+                                           AND t.position_id = c.position_id
+                        WHERE e.status != 'archived'
+                    ''').fetchall())
+                    versions = key
+            except Exception:
+                # Reconnect and retry on the next round rather than leave viewers waiting
+                self.errors += 1
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+                conn = None
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def _stop_if_idle(self, conn):
+        with self._cond:
+            if self._streams or time.monotonic() - self._polled < self.idle:
+                return False
+            # Counts go stale from here on: make the next viewer wait for a fresh load, and
+            # bump the sequence so every poller gets a full snapshot after it
+            self._thread, self._layout, self._counts, self._changes = None, None, {}, {}
+            self._seq += 1
+        if conn is not None:
+            conn.close()
+        return True
+
+    def _publish(self, layout, rows):
+        counts = {}
+        for election_id, candidate_id, votes in rows:
+            counts.setdefault(election_id, {})[str(candidate_id)] = votes
+        with self._cond:
+            changes = {}
+            for election_id, current in counts.items():
+                previous = self._counts.get(election_id, {})
+                changed = [{'candidate_id': int(cid), 'votes': votes}
+                           for cid, votes in current.items() if previous.get(cid) != votes]
+                if changed:
+                    changes[election_id] = changed
+            if not changes and layout == self._layout:
+                return
+            self._layout, self._counts, self._changes = layout, counts, changes
+            self._seq += 1
+            self._cond.notify_all()
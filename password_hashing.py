@@ -0,0 +1,90 @@
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class LoginBusy(Exception):
+    """Raised when a password check could not get a hashing slot within the queue timeout."""
+
+
+class PasswordHasher:
+    """Run password hashing for logins on a bounded pool with admission control.
+
+    `method` is a Werkzeug method string such as 'pbkdf2:sha256:600000' or 'scrypt';
+    shorthands are expanded to the full method Werkzeug writes into the hash, and stored
+    hashes made with anything else are reported by needs_rehash() so the login route can
+    upgrade them while it has the plain password.
+
+    At most `workers` hashes run at once (hashlib releases the GIL, so threads use
+    every core) and at most `max_pending` checks may be admitted, running or queued.
+    Anyone beyond that waits up to `queue_timeout` seconds for a slot and then gets
+    LoginBusy, so a login storm sheds load instead of piling up request threads.
+
+    Successful checks are remembered for `cache_ttl` seconds under an HMAC of the stored
+    hash and the password with a per-process key, so a student who signs in again on a
+    flaky connection is not charged a second full hash. Changing the password changes the
+    stored hash (and its salt), which retires the entry.
+    """
+
+    def __init__(self, method, workers=None, max_pending=None, queue_timeout=2.0,
+                 cache_size=4096, cache_ttl=900.0):
+        self.method = method
+        # What Werkzeug writes before the first '$', e.g. 'pbkdf2' -> 'pbkdf2:sha256:600000'
+        self.method_prefix = generate_password_hash('', method).split('$', 1)[0]
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 8
+        self.queue_timeout = queue_timeout
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._pool = None
+        self._lock = threading.Lock()
+        self._key = os.urandom(32)
+        self._verified = OrderedDict()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        key = self._cache_key(pwhash, password)
+        with self._lock:
+            expires = self._verified.get(key)
+            if expires is not None and expires > time.monotonic():
+                self._verified.move_to_end(key)
+                return True
+        if not self._run(check_password_hash, pwhash, password):
+            return False
+        with self._lock:
+            self._verified[key] = time.monotonic() + self.cache_ttl
+            self._verified.move_to_end(key)
+            while len(self._verified) > self.cache_size:
+                self._verified.popitem(last=False)
+        return True
+
+    def needs_rehash(self, pwhash):
+        return pwhash.split('$', 1)[0] != self.method_prefix
+
+    def _cache_key(self, pwhash, password):
+        return hmac.new(self._key, f"{pwhash}\0{password}".encode(), hashlib.sha256).digest()
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise LoginBusy()
+        try:
+            return self._executor().submit(func, *args).result()
+        finally:
+            self._slots.release()
+
+    def _executor(self):
+        # Created lazily so each forked gunicorn worker gets its own threads
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix='password-hash')
+        return self._pool
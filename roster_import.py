@@ -0,0 +1,135 @@
+import csv
+import io
+import multiprocessing
+import os
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+from werkzeug.security import generate_password_hash
+
+DEFAULT_PASSWORD = 'voter123'
+CHUNK_SIZE = 500
+REQUIRED_COLUMNS = ('name', 'course', 'batch')
+ERROR_LIMIT = 200  # per-row errors kept for the report; the count is always exact
+
+ImportReport = namedtuple('ImportReport', 'imported failed errors elapsed')
+
+
+def regno_prefix(course, batch):
+    return f"{course.upper()}{batch}_"
+
+
+def allocate_regnos(db, prefix, count):
+    """Reserve `count` consecutive regno numbers for a prefix; call inside the write transaction."""
+    next_num = db.execute('''
+        INSERT INTO regno_sequences (prefix, next_num) VALUES (?, 1001 + ?)
+        ON CONFLICT (prefix) DO UPDATE SET next_num = next_num + excluded.next_num - 1001
+        RETURNING next_num
+    ''', (prefix, count)).fetchone()[0]
+    return range(next_num - count, next_num)
+
+
+def read_roster(stream, filename):
+    """Yield (line number, {column: value}) from an uploaded CSV or XLSX roster without loading it whole."""
+    if filename.lower().endswith('.xlsx'):
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            raise ValueError("XLSX import needs the openpyxl package; upload a CSV instead.")
+        sheet = load_workbook(stream, read_only=True).active
+        rows = sheet.iter_rows(values_only=True)
+        header = [str(cell or '').strip().lower() for cell in next(rows, ())]
+        for line, values in enumerate(rows, start=2):
+            yield line, {key: '' if value is None else str(value).strip() for key, value in zip(header, values)}
+        return
+
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    reader = csv.DictReader(text)
+    reader.fieldnames = [name.strip().lower() for name in reader.fieldnames or []]
+    for row in reader:
+        yield reader.line_num, {key: (value or '').strip() for key, value in row.items() if key}
+
+
+def _hash_passwords(passwords, pool, method):
+    # PBKDF2 is CPU-bound, so spread each chunk over the pool's workers
+    hash_one = partial(generate_password_hash, method=method)
+    if pool is None:
+        return [hash_one(password) for password in passwords]
+    return list(pool.map(hash_one, passwords, chunksize=max(1, len(passwords) // 32)))
+
+
+def import_roster(db, rows, default_password=DEFAULT_PASSWORD, chunk_size=CHUNK_SIZE, workers=None,
+                  method='pbkdf2:sha256:600000', processes=True):
+    """Insert students from (line, row) pairs in chunked transactions and return an ImportReport.
+
+    Rows need name, course and batch;
+    an optional password column overrides the default. Regnos are allocated per prefix from
+    regno_sequences. Passwords are hashed across a pool of `workers` before each chunk's write
+    transaction opens, so the database lock is only held for the inserts.
+
+    The pool is spawned processes, never forked ones, whose children could inherit locks held
+    by other threads. Pass processes=False inside a web worker to hash on threads instead:
+    hashlib releases the GIL, so they still use every core without starting any processes.
+    """
+    started = time.perf_counter()
+    imported, failed, errors = 0, 0, []
+    workers = workers or os.cpu_count() or 1
+    if workers < 2:
+        pool = None
+    elif processes:
+        pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+    else:
+        pool = ThreadPoolExecutor(workers, thread_name_prefix='roster-hash')
+
+    def fail(line, message):
+        nonlocal failed
+        failed += 1
+        if len(errors) < ERROR_LIMIT:
+            errors.append((line, message))
+
+    def flush(chunk):
+        nonlocal imported
+        if not chunk:
+            return
+        hashes = _hash_passwords([row.get('password') or default_password for _, row in chunk], pool, method)
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            numbers = {prefix: iter(allocate_regnos(db, prefix, count))
+                       for prefix, count in Counter(regno_prefix(row['course'], row['batch'])
+                                                    for _, row in chunk).items()}
+            records = []
+            for (line, row), password_hash in zip(chunk, hashes):
+                prefix = regno_prefix(row['course'], row['batch'])
+                records.append((f"{prefix}{next(numbers[prefix])}", row['name'], row['course'], row['batch'],
+                                password_hash))
+            db.executemany("INSERT INTO students (regno, name, course, batch, password, voted) "
+                           "VALUES (?, ?, ?, ?, ?, 0)", records)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            for line, _ in chunk:
+                fail(line, f"not imported: {e}")
+            return
+        imported += len(records)
+
+    try:
+        chunk = []
+        for line, row in rows:
+            missing = [column for column in REQUIRED_COLUMNS if not row.get(column)]
+            if missing:
+                fail(line, f"missing {', '.join(missing)}")
+                continue
+            chunk.append((line, row))
+            if len(chunk) >= chunk_size:
+                flush(chunk)
+                chunk = []
+        flush(chunk)
+    except (ValueError, csv.Error, UnicodeDecodeError) as e:
+        fail(0, f"could not read file: {e}")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    return ImportReport(imported, failed, errors, time.perf_counter() - started)
@@ -1,9 +1,383 @@
+import os
 import sqlite3
 from werkzeug.security import generate_password_hash
 from datetime import datetime
+from ledger import backfill, create_ledger, refresh_triggers
+from tabulation import RANKED
+from turnout import create_turnout, rebuild_turnout
 
-def create_schema():
-    conn = sqlite3.connect('database.db')
+def create_tallies(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS tallies (
+            position_id INTEGER NOT NULL,
+            candidate_id INTEGER NOT NULL,
+            votes INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (position_id, candidate_id)
+        )
+    ''')
+
+def create_election_tallies(c):
+    # Partitioned by election: the primary key leads on election_id
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS tallies (
+            election_id INTEGER NOT NULL,
+            position_id INTEGER NOT NULL,
+            candidate_id INTEGER NOT NULL,
+            votes INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (election_id, position_id, candidate_id)
+        )
+    ''')
+
+def create_versions(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+# Ballot rows that count in tallies: every pick for a plurality or approval position, first preferences for ranked ones
+UNRANKED_POSITIONS = f"(SELECT id FROM positions WHERE method NOT IN ({', '.join(repr(method) for method in RANKED)}))"
+TALLIED = f"(rank = 1 OR position_id IN {UNRANKED_POSITIONS})"
+
+def rebuild_tallies(conn):
+    """Recount the tallies table from scratch using the ballots table."""
+    conn.execute("DELETE FROM tallies")
+    if 'election_id' in [row[1] for row in conn.execute("PRAGMA table_info(tallies)")]:
+        # Ranked ballots only tally their first preferences
+        ranked = 'rank' in [row[1] for row in conn.execute("PRAGMA table_info(ballots)")]
+        conn.execute(f'''
+            INSERT INTO tallies (election_id, position_id, candidate_id, votes)
+            SELECT election_id, position_id, candidate_id, COUNT(*)
+            FROM ballots
+            {f'WHERE {TALLIED}' if ranked else ''}
+            GROUP BY election_id, position_id, candidate_id
+        ''')
+        return
+    conn.execute('''
+        INSERT INTO tallies (position_id, candidate_id, votes)
+        SELECT position_id, candidate_id, COUNT(*)
+        FROM ballots
+        GROUP BY position_id, candidate_id
+    ''')
+
+def add_column(conn, table, column, definition):
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+# ------------------- Migrations -------------------
+# Each step runs once, in order, inside its own transaction; PRAGMA user_version
+# records how many have been applied. Append new steps, never reorder or edit old ones.
+
+def migration_tallies(conn):
+    create_tallies(conn)
+    rebuild_tallies(conn)
+
+def migration_versions(conn):
+    create_versions(conn)
+
+def migration_missing_columns(conn):
+    add_column(conn, 'students', 'avatar', 'TEXT')
+    add_column(conn, 'candidates', 'student_regno', 'TEXT')
+
+def migration_indexes(conn):
+    # A student holds at most one ballot per position. Duplicates left by double submits (all but
+    # the first) move to ballots_quarantine, stamped with when, so an admin can review them
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    duplicates = "id NOT IN (SELECT MIN(id) FROM ballots GROUP BY student_regno, position_id)"
+    if conn.execute(f"SELECT EXISTS (SELECT 1 FROM ballots WHERE {duplicates})").fetchone()[0]:
+        conn.execute("CREATE TABLE IF NOT EXISTS ballots_quarantine AS "
+                     "SELECT *, '' AS quarantined FROM ballots WHERE 0")
+        moved = conn.execute(f"INSERT INTO ballots_quarantine SELECT *, ? FROM ballots WHERE {duplicates}",
+                             (now,)).rowcount
+        conn.execute(f"DELETE FROM ballots WHERE {duplicates}")
+        conn.execute("INSERT INTO audit_log (user, action, details, timestamp) VALUES (?, ?, ?, ?)",
+                     ('system', 'Migration', f"Moved {moved} duplicate ballot(s) to ballots_quarantine "
+                      "before adding unique index", now))
+        rebuild_tallies(conn)
+    # Also serves lookups by student_regno alone, so no separate index on that column
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_ballots_student_position ON ballots (student_regno, position_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_ballots_candidate_position ON ballots (candidate_id, position_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_candidates_position ON candidates (position_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_audit_log_timestamp ON audit_log (timestamp)")
+
+def migration_student_indexes(conn):
+    # Prefix search (LIKE 'x%') and sorting for the admin roster; NOCASE so LIKE can use them
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_students_regno_nocase ON students (regno COLLATE NOCASE)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_students_name ON students (name COLLATE NOCASE, regno)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_students_course ON students (course COLLATE NOCASE, regno)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_students_batch ON students (batch COLLATE NOCASE, regno)")
+    # Small covering index for the COUNT(*)/SUM(voted) turnout totals
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_students_voted ON students (voted, regno)")
+
+def migration_audit_log_keyset(conn):
+    # log_audit_entry used to store str(datetime) ("... 20:08:09.706078"); normalize to whole seconds
+    conn.execute('''
+        UPDATE audit_log SET timestamp = replace(substr(timestamp, 1, 19), 'T', ' ')
+        WHERE length(timestamp) > 19 OR instr(timestamp, 'T') > 0
+    ''')
+    # Keyset pagination walks (timestamp, id); the filtered views walk the same order per user/action
+    conn.execute("DROP INDEX IF EXISTS idx_audit_log_timestamp")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_audit_log_timestamp_id ON audit_log (timestamp, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_audit_log_user ON audit_log (user, timestamp, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_audit_log_action ON audit_log (action, timestamp, id)")
+
+def migration_regno_sequences(conn):
+    # Next free regno number per "<COURSE><BATCH>_" prefix, so allocation never scans students
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS regno_sequences (
+            prefix TEXT PRIMARY KEY,
+            next_num INTEGER NOT NULL
+        )
+    ''')
+    highest = {}
+    for (regno,) in conn.execute("SELECT regno FROM students WHERE regno LIKE '%\\_%' ESCAPE '\\'"):
+        prefix, _, number = regno.rpartition('_')
+        if number.isdigit():
+            highest[prefix + '_'] = max(highest.get(prefix + '_', 0), int(number))
+    conn.executemany("INSERT OR REPLACE INTO regno_sequences (prefix, next_num) VALUES (?, ?)",
+                     [(prefix, max(number + 1, 1001)) for prefix, number in highest.items()])
+
+def migration_sessions(conn):
+    # Server-side sessions; the cookie only carries the id
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sessions (
+            id TEXT PRIMARY KEY,
+            user TEXT,
+            role TEXT,
+            data TEXT NOT NULL,
+            expires REAL NOT NULL
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions (user)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_role ON sessions (role)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires)")
+
+def migration_elections(conn):
+    # Several elections per deployment, each optionally limited to one course and/or batch
+    add_column(conn, 'elections', 'course', 'TEXT')  # NULL: open to every course
+    add_column(conn, 'elections', 'batch', 'TEXT')  # NULL: open to every batch
+    add_column(conn, 'elections', 'status', "TEXT NOT NULL DEFAULT 'open'")  # open, closed or archived
+    add_column(conn, 'elections', 'archive_file', 'TEXT')
+    # Everything that existed so far belongs to the original election
+    for table in ('positions', 'candidates', 'ballots'):
+        add_column(conn, table, 'election_id', 'INTEGER NOT NULL DEFAULT 1')
+    conn.execute("UPDATE candidates SET election_id = COALESCE((SELECT election_id FROM positions p WHERE p.id = candidates.position_id), 1)")
+    conn.execute("UPDATE ballots SET election_id = COALESCE((SELECT election_id FROM positions p WHERE p.id = ballots.position_id), 1)")
+
+    # Who has voted in which election; replaces the single students.voted flag
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS election_voters (
+            election_id INTEGER NOT NULL,
+            regno TEXT NOT NULL,
+            timestamp TEXT,
+            PRIMARY KEY (election_id, regno)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        INSERT OR IGNORE INTO election_voters (election_id, regno, timestamp)
+        SELECT 1, s.regno, (SELECT MIN(b.timestamp) FROM ballots b WHERE b.student_regno = s.regno)
+        FROM students s WHERE s.voted = 1
+    ''')
+
+    conn.execute("DROP TABLE tallies")
+    create_election_tallies(conn)
+    rebuild_tallies(conn)
+
+    # Every hot query is scoped to one election, so the indexes lead on election_id
+    conn.execute("DROP INDEX IF EXISTS idx_ballots_student_position")
+    conn.execute("DROP INDEX IF EXISTS idx_ballots_candidate_position")
+    conn.execute("DROP INDEX IF EXISTS idx_candidates_position")
+    conn.execute("DROP INDEX IF EXISTS idx_students_voted")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_ballots_election_student ON ballots (election_id, student_regno, position_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_ballots_election_candidate ON ballots (election_id, candidate_id, position_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_positions_election ON positions (election_id, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_candidates_election ON candidates (election_id, position_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_elections_status ON elections (status, start_date)")
+
+def migration_kiosks(conn):
+    # Polling-station kiosks that upload signed offline ballots; the secret is their HMAC key
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS kiosks (
+            id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            secret TEXT NOT NULL,
+            active INTEGER NOT NULL DEFAULT 1,
+            created TEXT
+        )
+    ''')
+
+def migration_audit_structured(conn):
+    # Structured audit records: which election and object an action touched, and from where.
+    # uid keeps replays of the audit spill file idempotent.
+    add_column(conn, 'audit_log', 'uid', 'TEXT')
+    add_column(conn, 'audit_log', 'election_id', 'INTEGER')
+    add_column(conn, 'audit_log', 'target', 'TEXT')
+    add_column(conn, 'audit_log', 'remote_addr', 'TEXT')
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_audit_log_uid ON audit_log (uid) WHERE uid IS NOT NULL")
+
+def migration_ledger(conn):
+    # Hash-chained record of every ballot and audit change, kept by triggers; see ledger.py
+    create_ledger(conn)
+    backfill(conn)
+
+def migration_tabulation(conn):
+    # How each position is counted (see tabulation.METHODS) and how many seats it fills.
+    # ballots.rank orders a voter's preferences; plurality and approval picks are all rank 1.
+    add_column(conn, 'positions', 'method', "TEXT NOT NULL DEFAULT 'plurality'")
+    add_column(conn, 'positions', 'seats', 'INTEGER NOT NULL DEFAULT 1')
+    add_column(conn, 'ballots', 'rank', 'INTEGER NOT NULL DEFAULT 1')
+    # A voter may now have several rows per position: one per approved or ranked candidate
+    conn.execute("DROP INDEX IF EXISTS idx_ballots_election_student")
+    conn.execute("CREATE UNIQUE INDEX idx_ballots_election_student "
+                 "ON ballots (election_id, student_regno, position_id, rank, candidate_id)")
+    refresh_triggers(conn, 'ballots')
+
+def migration_turnout(conn):
+    # Per-minute turnout and eligible students per group, so the analytics never group raw rows; see turnout.py
+    create_turnout(conn)
+    rebuild_turnout(conn)
+
+def migration_ballot_ranks(conn):
+    # One row per (voter, position, rank): approval picks are numbered in the order they were cast
+    # instead of all sharing rank 1, so the unique index no longer needs candidate_id to tell them apart
+    conn.execute(f'''
+        UPDATE ballots SET rank = numbered.rank
+        FROM (SELECT id, ROW_NUMBER() OVER (PARTITION BY election_id, student_regno, position_id ORDER BY id) AS rank
+              FROM ballots
+              WHERE position_id IN {UNRANKED_POSITIONS}
+             ) AS numbered
+        WHERE numbered.id = ballots.id AND numbered.rank != ballots.rank
+    ''')
+    conn.execute("DROP INDEX IF EXISTS idx_ballots_election_student")
+    conn.execute("CREATE UNIQUE INDEX idx_ballots_election_student "
+                 "ON ballots (election_id, student_regno, position_id, rank)")
+
+def migration_ledger_reports(conn):
+    # Adds ledger_reports; every other ledger table and trigger already exists, so nothing else changes
+    create_ledger(conn)
+
+MIGRATIONS = [
+    migration_tallies,
+    migration_versions,
+    migration_missing_columns,
+    migration_indexes,
+    migration_student_indexes,
+    migration_audit_log_keyset,
+    migration_regno_sequences,
+    migration_sessions,
+    migration_elections,
+    migration_kiosks,
+    migration_audit_structured,
+    migration_ledger,
+    migration_tabulation,
+    migration_turnout,
+    migration_ballot_ranks,
+    migration_ledger_reports,
+]
+
+def apply_migrations(conn):
+    """Bring an open connection up to the latest schema version; returns the number of steps applied."""
+    current = conn.execute("PRAGMA user_version").fetchone()[0]
+    for version, step in enumerate(MIGRATIONS[current:], start=current + 1):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            step(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return len(MIGRATIONS) - min(current, len(MIGRATIONS))
+
+def migrate(database='database.db'):
+    conn = sqlite3.connect(database)
+    try:
+        return apply_migrations(conn)
+    finally:
+        conn.close()
+
+# ------------------- Query plan checks -------------------
+# Hot-path queries that must be answered from an index. check_query_plans() flags any
+# of them whose plan falls back to a full table scan or a temporary sort.
+
+PLAN_CHECKS = {
+    'ballot_summary': ('''
+        SELECT p.name as position, c.name as candidate
+        FROM ballots b
+        JOIN candidates c ON b.candidate_id = c.id
+        JOIN positions p ON c.position_id = p.id
+        WHERE b.election_id = ? AND b.student_regno = ?
+        ORDER BY b.position_id, b.rank
+    ''', (1, 'S1001')),
+    'reset_vote': ("DELETE FROM ballots WHERE election_id = ? AND student_regno = ?", (1, 'S1001')),
+    'reset_vote tallies': (f'''
+        UPDATE tallies SET votes = votes - (
+            SELECT COUNT(*) FROM ballots
+            WHERE election_id = ? AND student_regno = ?
+              AND ballots.election_id = tallies.election_id
+              AND ballots.position_id = tallies.position_id
+              AND ballots.candidate_id = tallies.candidate_id
+              AND {TALLIED}
+        )
+        WHERE (election_id, position_id, candidate_id) IN (
+            SELECT election_id, position_id, candidate_id FROM ballots
+            WHERE election_id = ? AND student_regno = ? AND {TALLIED}
+        )
+    ''', (1, 'S1001', 1, 'S1001')),
+    'tabulation ballots': ("SELECT student_regno, rank, candidate_id FROM ballots "
+                           "WHERE election_id = ? AND position_id = ? ORDER BY student_regno", (1, 1)),
+    'candidate ballots': ("SELECT COUNT(*) FROM ballots WHERE election_id = ? AND candidate_id = ? AND position_id = ?",
+                          (1, 1, 1)),
+    'results': ('''
+        SELECT p.name as position, c.name as candidate, COALESCE(t.votes, 0) as votes
+        FROM positions p
+        JOIN candidates c ON c.election_id = p.election_id AND p.id = c.position_id
+        LEFT JOIN tallies t ON t.election_id = p.election_id AND t.candidate_id = c.id AND t.position_id = p.id
+        WHERE p.election_id = ?
+    ''', (1,)),
+    'audit_log page': ("SELECT * FROM audit_log WHERE (timestamp, id) < (?, ?) "
+                       "ORDER BY timestamp DESC, id DESC LIMIT 51", ('2025-01-01 00:00:00', 10)),
+    'audit_log by user': ("SELECT * FROM audit_log WHERE user = ? AND (timestamp, id) < (?, ?) "
+                          "ORDER BY timestamp DESC, id DESC LIMIT 51", ('admin', '2025-01-01 00:00:00', 10)),
+    'student page': ("SELECT s.regno, s.name, s.course, s.batch, ev.regno IS NOT NULL AS voted FROM students s "
+                     "LEFT JOIN election_voters ev ON ev.election_id = ? AND ev.regno = s.regno "
+                     "ORDER BY s.name COLLATE NOCASE, s.regno LIMIT 25 OFFSET 0", (1,)),
+    'student search': ("SELECT COUNT(*) FROM students WHERE regno LIKE ? ESCAPE '\\' OR name LIKE ? ESCAPE '\\' "
+                       "OR course LIKE ? ESCAPE '\\' OR batch LIKE ? ESCAPE '\\'", ('a%',) * 4),
+    'turnout totals': ("SELECT COUNT(*) FROM election_voters WHERE election_id = ?", (1,)),
+    'eligible voters': ("SELECT COALESCE(SUM(students), 0) FROM student_groups "
+                        "WHERE (? IS NULL OR course = ?) AND (? IS NULL OR batch = ?)", ('CSE', 'CSE', None, None)),
+    'turnout minutes': ("SELECT minute, course, batch, votes FROM turnout_minutes WHERE election_id = ? ORDER BY minute",
+                        (1,)),
+    'reset_vote turnout': ('''
+        UPDATE turnout_minutes SET votes = votes - 1
+        WHERE (election_id, minute, course, batch) IN (
+            SELECT ev.election_id, COALESCE(strftime('%Y-%m-%d %H:%M', ev.timestamp), ''),
+                   COALESCE(s.course, ''), COALESCE(s.batch, '')
+            FROM election_voters ev LEFT JOIN students s ON s.regno = ev.regno
+            WHERE ev.election_id = ? AND ev.regno = ?
+        )
+    ''', (1, 'S1001')),
+}
+
+# Small tables that every results page lists in full anyway, and one row per course and batch
+ALLOWED_SCANS = ('positions', 'p', 'candidates', 'c', 'student_groups')
+
+def check_query_plans(conn):
+    """Return [(check name, plan detail)] for every hot query that regressed to a scan."""
+    problems = []
+    for name, (sql, params) in PLAN_CHECKS.items():
+        for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params):
+            detail = row[-1]
+            scanned = detail.startswith('SCAN ') and 'INDEX' not in detail and detail.split()[1] not in ALLOWED_SCANS
+            if scanned or 'USE TEMP B-TREE' in detail:
+                problems.append((name, detail))
+    return problems
+
+def create_schema(database='database.db'):
+    conn = sqlite3.connect(database)
     c = conn.cursor()
 
     # Students table
@@ -14,7 +388,8 @@ def create_schema():
             course TEXT NOT NULL,
             batch TEXT NOT NULL,
             password TEXT NOT NULL,
-            voted INTEGER DEFAULT 0
+            voted INTEGER DEFAULT 0,
+            avatar TEXT
         )
     ''')
 
@@ -42,6 +417,7 @@ def create_schema():
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             name TEXT NOT NULL,
             position_id INTEGER NOT NULL,
+            student_regno TEXT,
             FOREIGN KEY (position_id) REFERENCES positions(id)
         )
     ''')
@@ -79,6 +455,10 @@ def create_schema():
         )
     ''')
 
+    # Tallies, versions, indexes and later additions
+    conn.commit()
+    apply_migrations(conn)
+
     # Insert default election if missing
     c.execute("SELECT * FROM elections WHERE id=1")
     if not c.fetchone():
@@ -96,24 +476,50 @@ def create_schema():
     c.execute("INSERT OR IGNORE INTO candidates (id, name, position_id) VALUES (?, ?, ?)", (2, 'Jane Smith', 1))
     c.execute("INSERT OR IGNORE INTO candidates (id, name, position_id) VALUES (?, ?, ?)", (3, 'Emily Davis', 2))
 
-    # Insert sample students
+    # Insert sample students and the admin user; passwords are only hashed for accounts still missing
     students = [
-        ('S1001', 'Alice Johnson', 'Computer Science', '2023', generate_password_hash('alice123')),
-        ('S1002', 'Bob Smith', 'IT', '2023', generate_password_hash('bob123')),
-        ('S1003', 'Charlie Lee', 'ECE', '2022', generate_password_hash('charlie123'))
+        ('S1001', 'Alice Johnson', 'Computer Science', '2023', 'alice123'),
+        ('S1002', 'Bob Smith', 'IT', '2023', 'bob123'),
+        ('S1003', 'Charlie Lee', 'ECE', '2022', 'charlie123'),
+        ('admin', 'Administrator', '', '', 'admin'),
     ]
-    for s in students:
-        c.execute("INSERT OR IGNORE INTO students (regno, name, course, batch, password) VALUES (?, ?, ?, ?, ?)", s)
-
-    # Insert admin user
-    admin_regno = 'admin'
-    admin_password_hash = generate_password_hash('admin')
-    c.execute("INSERT OR IGNORE INTO students (regno, name, course, batch, password, voted) VALUES (?, ?, ?, ?, ?, ?)",
-              (admin_regno, 'Administrator', '', '', admin_password_hash, 0))
+    existing = {row[0] for row in c.execute(
+        f"SELECT regno FROM students WHERE regno IN ({', '.join('?' * len(students))})", [s[0] for s in students])}
+    for regno, name, course, batch, password in students:
+        if regno not in existing:
+            c.execute("INSERT INTO students (regno, name, course, batch, password) VALUES (?, ?, ?, ?, ?)",
+                      (regno, name, course, batch, generate_password_hash(password)))
 
     conn.commit()
     conn.close()
     print("✅ Database initialized with election, positions, candidates, students, and admin.")
 
+def prepare(database='database.db'):
+    """Create `database` if it does not exist yet, else apply any pending migrations."""
+    if os.path.exists(database):
+        migrate(database)
+    else:
+        create_schema(database)
+
 if __name__ == "__main__":
-    create_schema()
+    import sys
+    if sys.argv[1:] == ['rebuild-tallies']:
+        conn = sqlite3.connect('database.db')
+        rebuild_tallies(conn)
+        conn.commit()
+        conn.close()
+        print("✅ Tallies rebuilt from ballots.")
+    elif sys.argv[1:] == ['migrate']:
+        print(f"✅ Applied {migrate()} migration(s).")
+    elif sys.argv[1:] == ['check-plans']:
+        conn = sqlite3.connect('database.db')
+        apply_migrations(conn)
+        problems = check_query_plans(conn)
+        conn.close()
+        for name, detail in problems:
+            print(f"❌ {name}: {detail}")
+        if problems:
+            sys.exit(1)
+        print("✅ All hot queries use an index.")
+    else:
+        create_schema()
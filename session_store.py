@@ -0,0 +1,231 @@
+import json
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+
+def new_session_id():
+    return secrets.token_urlsafe(32)
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    """Session data kept on the server; only `sid` travels in the cookie."""
+
+    def __init__(self, initial=None, sid=None, expires=0.0):
+        def on_update(self):
+            self.modified = True
+        CallbackDict.__init__(self, initial, on_update)
+        self.new = sid is None
+        self.sid = sid or new_session_id()
+        self.expires = expires
+        self.replaced = None
+        self.modified = False
+        self.accessed = False
+
+    # Track reads as Flask's cookie session does, so responses that never look at the
+    # session (static files, the kiosk API) are not marked Vary: Cookie
+    def __getitem__(self, key):
+        self.accessed = True
+        return super().__getitem__(key)
+
+    def __contains__(self, key):
+        self.accessed = True
+        return super().__contains__(key)
+
+    def get(self, key, default=None):
+        self.accessed = True
+        return super().get(key, default)
+
+    def setdefault(self, key, default=None):
+        self.accessed = True
+        return super().setdefault(key, default)
+
+    def regenerate(self):
+        # Issue a fresh id (e.g. on login) so an id planted before authentication is useless afterwards
+        if self.replaced is None and not self.new:
+            self.replaced = self.sid
+        self.sid = new_session_id()
+        self.new = True
+        self.modified = True
+
+
+class MemorySessionStore:
+    """LRU of sessions with expiry, for a single process (dev server or one worker)."""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+
+    def load(self, sid):
+        with self._lock:
+            entry = self._sessions.get(sid)
+            if entry is None:
+                return None
+            if entry[3] <= time.time():
+                del self._sessions[sid]
+                return None
+            self._sessions.move_to_end(sid)
+            return dict(entry[2]), entry[3]
+
+    def save(self, sid, data, expires):
+        with self._lock:
+            self._sessions[sid] = (data.get('user'), data.get('role'), dict(data), expires)
+            self._sessions.move_to_end(sid)
+            while len(self._sessions) > self.max_entries:
+                self._sessions.popitem(last=False)
+
+    def delete(self, sid):
+        with self._lock:
+            self._sessions.pop(sid, None)
+
+    def revoke(self, user=None, role=None, keep=None):
+        with self._lock:
+            doomed = [sid for sid, (owner, owner_role, _, _) in self._sessions.items()
+                      if sid != keep and (user is None or owner == user) and (role is None or owner_role == role)]
+            for sid in doomed:
+                del self._sessions[sid]
+        return len(doomed)
+
+
+class SqliteSessionStore:
+    """Sessions in the `sessions` table, so every gunicorn worker sees the same logins.
+
+    `connect` opens a database connection; each thread keeps its own, apart from the request's,
+    so committing a session write never commits a view's unfinished transaction. Loaded sessions
+    are kept in a small per-process cache for `cache_ttl` seconds, so a page that triggers
+    several requests costs one lookup; revocations made in another worker therefore take
+    effect within that window. Expired rows are purged at most once per `purge_interval`.
+    """
+
+    def __init__(self, connect, cache_ttl=2.0, cache_size=10000, purge_interval=300.0):
+        self.connect = connect
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.purge_interval = purge_interval
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._purged_at = 0.0
+        self._local = threading.local()
+
+    def _db(self):
+        db = getattr(self._local, 'conn', None)
+        if db is None:
+            db = self._local.conn = self.connect()
+        return db
+
+    def load(self, sid):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(sid)
+            if cached is not None and cached[0] > now:
+                data, expires = cached[1], cached[2]
+                if expires > time.time():
+                    return dict(data), expires
+        row = self._db().execute("SELECT data, expires FROM sessions WHERE id = ? AND expires > ?",
+                                 (sid, time.time())).fetchone()
+        if row is None:
+            self._forget(sid)
+            return None
+        data = json.loads(row[0])
+        self._remember(sid, data, row[1])
+        return dict(data), row[1]
+
+    def save(self, sid, data, expires):
+        db = self._db()
+        db.execute('''
+            INSERT INTO sessions (id, user, role, data, expires) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (id) DO UPDATE SET user = excluded.user, role = excluded.role,
+                                           data = excluded.data, expires = excluded.expires
+        ''', (sid, data.get('user'), data.get('role'), json.dumps(data, separators=(',', ':')), expires))
+        if time.monotonic() - self._purged_at > self.purge_interval:
+            self._purged_at = time.monotonic()
+            db.execute("DELETE FROM sessions WHERE expires <= ?", (time.time(),))
+        db.commit()
+        self._remember(sid, data, expires)
+
+    def delete(self, sid):
+        db = self._db()
+        db.execute("DELETE FROM sessions WHERE id = ?", (sid,))
+        db.commit()
+        self._forget(sid)
+
+    def revoke(self, user=None, role=None, keep=None):
+        """Delete every session matching user and/or role, except `keep`; returns how many went."""
+        clauses, params = ["id != ?"], [keep or '']
+        if user is not None:
+            clauses.append("user = ?")
+            params.append(user)
+        if role is not None:
+            clauses.append("role = ?")
+            params.append(role)
+        db = self._db()
+        revoked = db.execute(f"DELETE FROM sessions WHERE {' AND '.join(clauses)}", params).rowcount
+        db.commit()
+        with self._lock:
+            self._cache.clear()
+        return revoked
+
+    def _remember(self, sid, data, expires):
+        with self._lock:
+            self._cache[sid] = (time.monotonic() + self.cache_ttl, dict(data), expires)
+            self._cache.move_to_end(sid)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _forget(self, sid):
+        with self._lock:
+            self._cache.pop(sid, None)
+
+
+class ServerSessionInterface(SessionInterface):
+    """Flask session interface that keeps data in `store` and puts an opaque id in the cookie.
+
+    Stored sessions live for PERMANENT_SESSION_LIFETIME from their last write and are
+    re-saved once half of that has passed, so active users are not logged out mid-election.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        # Static files never use the session; skip the store lookup for them
+        if sid and not request.path.startswith(f'{app.static_url_path}/'):
+            loaded = self.store.load(sid)
+            if loaded is not None:
+                data, expires = loaded
+                return ServerSession(data, sid=sid, expires=expires)
+        return ServerSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if session.replaced is not None:
+            self.store.delete(session.replaced)
+
+        if not session:
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app),
+                                       httponly=self.get_cookie_httponly(app))
+            return
+
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        stale = session.expires - time.time() < lifetime / 2
+        if not (session.modified or stale):
+            return
+        self.store.save(session.sid, dict(session), time.time() + lifetime)
+        response.set_cookie(name, session.sid, expires=self.get_expiration_time(app, session),
+                            httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                            secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
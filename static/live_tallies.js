@@ -0,0 +1,63 @@
+// Keep vote counts current from the /stream/tallies server-sent events
+// instead of reloading the page. The server sends a full snapshot on
+// connect and only the changed candidates after each committed vote.
+// When the server has no stream to spare (or the browser has no
+// EventSource) the page polls pollUrl for the same updates instead.
+const TALLY_POLL_INTERVAL = 5000;  // milliseconds
+
+function subscribeTallies(url, pollUrl, layout, apply) {
+  const snapshot = (data) => {
+    if (data.layout !== layout) {
+      // Positions or candidates were edited; the charts need a fresh render
+      location.reload();
+      return false;
+    }
+    apply(Object.entries(data.counts).map(([id, votes]) => ({ candidate_id: Number(id), votes })));
+    return true;
+  };
+
+  const poll = (since) => {
+    const query = since === null ? '' : `?since=${since}`;
+    fetch(pollUrl + query, { credentials: 'same-origin' })
+      .then((response) => response.ok ? response.json() : null)
+      .then((update) => {
+        if (update && update.type === 'snapshot' && !snapshot(update)) return;
+        if (update && update.type === 'tallies') apply(update.changes);
+        setTimeout(() => poll(update ? update.seq : since), TALLY_POLL_INTERVAL);
+      })
+      .catch(() => setTimeout(() => poll(since), TALLY_POLL_INTERVAL));
+  };
+
+  if (!window.EventSource) {
+    poll(null);
+    return;
+  }
+  const source = new EventSource(url);
+  source.addEventListener('busy', () => {
+    source.close();
+    poll(null);
+  });
+  source.addEventListener('snapshot', (e) => {
+    if (!snapshot(JSON.parse(e.data))) source.close();
+  });
+  source.addEventListener('tallies', (e) => apply(JSON.parse(e.data).changes));
+}
+
+// charts: [[Chart, [candidate ids in dataset order]], ...]
+function bindChartTallies(url, pollUrl, layout, charts) {
+  const index = {};
+  charts.forEach(([chart, ids]) => ids.forEach((id, i) => { index[id] = [chart, i]; }));
+  subscribeTallies(url, pollUrl, layout, (changes) => {
+    const touched = new Set();
+    changes.forEach(({ candidate_id, votes }) => {
+      const hit = index[candidate_id];
+      if (!hit) return;
+      const data = hit[0].data.datasets[0].data;
+      if (data[hit[1]] !== votes) {
+        data[hit[1]] = votes;
+        touched.add(hit[0]);
+      }
+    });
+    touched.forEach((chart) => chart.update());
+  });
+}
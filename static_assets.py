@@ -0,0 +1,132 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+
+try:
+    import brotli
+except ImportError:  # optional: gzip alone when the brotli package is not installed
+    brotli = None
+
+BUILD_DIR = 'build'
+MANIFEST = 'manifest.json'
+SPRITE_DIR = 'icons'
+# Not fingerprinted: earlier build output, and uploads whose content changes under a fixed name
+SKIP_DIRS = {BUILD_DIR, 'uploads'}
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.map', '.txt', '.html')
+CSS_URL = re.compile(r'''url\(\s*(['"]?)(?!data:|https?:|#)([^'")]+)\1\s*\)''')
+
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def _fingerprinted(name, data):
+    stem, ext = os.path.splitext(name)
+    return f'{BUILD_DIR}/{stem}.{_digest(data)}{ext}'
+
+
+def _write(static_folder, name, data):
+    path = os.path.join(static_folder, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    if name.endswith(COMPRESSIBLE):
+        # Pre-compressed once here so requests never spend CPU on it; dropped if it does not help
+        variants = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variants.append(('.br', brotli.compress(data, quality=11)))
+        for suffix, compressed in variants:
+            if len(compressed) < len(data):
+                with open(path + suffix, 'wb') as f:
+                    f.write(compressed)
+
+
+def build_sprite(icon_dir):
+    """Stack every icon in `icon_dir` into one SVG; `sprite.svg#home` shows only icons/home.svg.
+
+    Each icon becomes a nested <svg id="name"> that is hidden unless it is the :target of the
+    URL fragment, so templates keep using <img> (and their CSS filters) unchanged.
+    """
+    parts = ['<svg xmlns="http://www.w3.org/2000/svg" width="24" height="24" viewBox="0 0 24 24">'
+             '<style>svg>svg{display:none}svg>svg:target{display:inline}</style>']
+    names = []
+    for filename in sorted(os.listdir(icon_dir)):
+        name, ext = os.path.splitext(filename)
+        if ext != '.svg':
+            continue
+        with open(os.path.join(icon_dir, filename), encoding='utf-8') as f:
+            icon = f.read().strip()
+        # Nested ids would collide across icons; such files stay standalone
+        if ' id=' in icon or not icon.startswith('<svg'):
+            continue
+        icon = re.sub(r'\s(?:width|height|class)="[^"]*"', '', icon.split('>', 1)[0]) + '>' + icon.split('>', 1)[1]
+        parts.append(icon.replace('<svg', f'<svg id="{name}" width="100%" height="100%"', 1))
+        names.append(name)
+    parts.append('</svg>')
+    return '\n'.join(parts).encode(), names
+
+
+def build_assets(static_folder):
+    """Write fingerprinted, pre-compressed copies of the static files to static/build.
+
+    Returns the manifest: original filename -> built filename, plus a `#fragment` for
+    icons served from the sprite. Files left over from earlier builds are removed.
+    """
+    build_root = os.path.join(static_folder, BUILD_DIR)
+    shutil.rmtree(build_root, ignore_errors=True)
+    manifest = {}
+    stylesheets = []
+    for root, dirs, files in os.walk(static_folder):
+        dirs[:] = sorted(d for d in dirs if os.path.relpath(os.path.join(root, d), static_folder) not in SKIP_DIRS)
+        for filename in sorted(files):
+            path = os.path.join(root, filename)
+            name = os.path.relpath(path, static_folder).replace(os.sep, '/')
+            if name.endswith('.css'):
+                stylesheets.append(name)
+                continue
+            with open(path, 'rb') as f:
+                data = f.read()
+            manifest[name] = _fingerprinted(name, data)
+            _write(static_folder, manifest[name], data)
+
+    icon_dir = os.path.join(static_folder, SPRITE_DIR)
+    if os.path.isdir(icon_dir):
+        sprite, names = build_sprite(icon_dir)
+        built = _fingerprinted(f'{SPRITE_DIR}.svg', sprite)
+        _write(static_folder, built, sprite)
+        for name in names:
+            manifest[f'{SPRITE_DIR}/{name}.svg'] = f'{built}#{name}'
+
+    # Stylesheets last, pointing their url()s at the fingerprinted files
+    for name in stylesheets:
+        with open(os.path.join(static_folder, name), encoding='utf-8') as f:
+            css = f.read()
+        base = os.path.dirname(name)
+
+        def rewrite(match):
+            target = match.group(2).strip()
+            key = target[len('/static/'):] if target.startswith('/static/') else os.path.normpath(
+                os.path.join(base, target)).replace(os.sep, '/')
+            if key not in manifest or '#' in manifest[key]:
+                return match.group(0)
+            return f'url({match.group(1)}/static/{manifest[key]}{match.group(1)})'
+
+        data = CSS_URL.sub(rewrite, css).encode()
+        manifest[name] = _fingerprinted(name, data)
+        _write(static_folder, manifest[name], data)
+
+    with open(os.path.join(build_root, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    return manifest
+
+
+def load_manifest(static_folder):
+    """The manifest from the last build, or {} so unbuilt checkouts serve the plain files."""
+    try:
+        with open(os.path.join(static_folder, BUILD_DIR, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
@@ -0,0 +1,264 @@
+from collections import namedtuple
+
+try:
+    import numpy as np
+except ImportError:  # optional: the same counts in pure Python, fine for class-sized elections
+    np = None
+
+METHODS = {
+    'plurality': 'Plurality',
+    'approval': 'Approval',
+    'irv': 'Instant runoff',
+    'stv': 'Single transferable vote',
+}
+RANKED = ('irv', 'stv')
+
+# matrix: one row per voter of dense candidate indices in preference order, 0-padded;
+# index i stands for candidates[i - 1]. An int32 ndarray, or a list of tuples without NumPy.
+Ballots = namedtuple('Ballots', 'candidates matrix')
+# counts: candidate id -> votes held this round (fractional under STV)
+Round = namedtuple('Round', 'counts elected eliminated tiebreak')
+# counts are the final round's; winners in the order they were elected; tied lists candidates
+# level for the last seat that plurality and approval leave for the returning officer
+Tabulation = namedtuple('Tabulation', 'method seats ballots exhausted counts winners tied rounds')
+
+
+def load_ballots(db, election_id, position_id, candidate_ids, ranked=True):
+    """Read one position's ballots into a Ballots matrix.
+
+    Ranked rows land in the column of their rank (unranked picks just fill the row); picks
+    for candidates not in `candidate_ids` (since deleted) stay 0, skipped like a blank.
+    """
+    # Grouped by voter straight off idx_ballots_election_student, without a sort
+    rows = db.execute("SELECT student_regno, rank, candidate_id FROM ballots WHERE election_id = ? AND position_id = ? "
+                      "ORDER BY student_regno", (election_id, position_id)).fetchall()
+    if np is not None:
+        return Ballots(tuple(candidate_ids), _matrix(rows, candidate_ids, ranked))
+    index = {candidate_id: i for i, candidate_id in enumerate(candidate_ids, start=1)}
+    voters, columns, values = [], [], []
+    voter, last_regno = -1, None
+    for regno, rank, candidate_id in rows:
+        if regno != last_regno:
+            voter, last_regno, column = voter + 1, regno, 0
+        voters.append(voter)
+        columns.append(rank - 1 if ranked else column)
+        values.append(index.get(candidate_id, 0))
+        column += 1
+    rows = [[0] * (max(columns, default=-1) + 1) for _ in range(voter + 1)]
+    for voter, column, value in zip(voters, columns, values):
+        rows[voter][column] = value
+    return Ballots(tuple(candidate_ids), [tuple(row) for row in rows])
+
+
+def _matrix(rows, candidate_ids, ranked):
+    # The same layout as the loop in load_ballots, built column-wise in NumPy
+    if not rows:
+        return np.zeros((0, 0), dtype=np.int32)
+    regnos, ranks, picks = (np.array(column) for column in zip(*rows))
+    starts = np.ones(len(rows), dtype=bool)
+    starts[1:] = regnos[1:] != regnos[:-1]
+    voters = np.cumsum(starts) - 1
+    if ranked:
+        columns = ranks.astype(np.intp) - 1
+    else:
+        positions = np.arange(len(rows))
+        columns = positions - np.maximum.accumulate(np.where(starts, positions, 0))
+    ids = np.asarray(candidate_ids, dtype=np.int64)
+    order = np.argsort(ids, kind='stable')
+    found = np.minimum(np.searchsorted(ids[order], picks), max(len(ids) - 1, 0))
+    values = np.where(ids[order][found] == picks, order[found] + 1, 0) if len(ids) else np.zeros(len(rows))
+    matrix = np.zeros((voters[-1] + 1, columns.max() + 1), dtype=np.int32)
+    matrix[voters, columns] = values
+    return matrix
+
+
+# ---- array steps; each has a NumPy and a pure-Python version ----
+
+def _flags(size):
+    # flags[i] is True while candidate index i is continuing; index 0 (no choice) never is
+    if np is not None:
+        flags = np.ones(size + 1, dtype=bool)
+    else:
+        flags = [True] * (size + 1)
+    flags[0] = False
+    return flags
+
+
+def _weights(count):
+    return np.ones(count) if np is not None else [1.0] * count
+
+
+def _first_choices(matrix, continuing):
+    """Each ballot's highest-ranked continuing candidate, or 0 once it is exhausted."""
+    if np is not None:
+        if not len(matrix) or not matrix.shape[1]:
+            return np.zeros(len(matrix), dtype=np.int32)
+        live = continuing[matrix]
+        first = live.argmax(axis=1)
+        rows = np.arange(len(matrix))
+        return np.where(live[rows, first], matrix[rows, first], 0)
+    return [next((c for c in row if continuing[c]), 0) for row in matrix]
+
+
+def _count(tops, size, weights=None):
+    if np is not None:
+        return np.bincount(tops, weights=weights, minlength=size + 1).tolist()
+    counts = [0] * (size + 1)
+    if weights is None:
+        for c in tops:
+            counts[c] += 1
+    else:
+        for c, weight in zip(tops, weights):
+            counts[c] += weight
+    return counts
+
+
+def _every_choice(matrix, size):
+    # Approval: every candidate marked on a ballot gets its vote
+    if np is not None:
+        return np.bincount(matrix.ravel(), minlength=size + 1).tolist()
+    counts = [0] * (size + 1)
+    for row in matrix:
+        for c in row:
+            counts[c] += 1
+    return counts
+
+
+def _scale(weights, tops, candidate, factor):
+    if np is not None:
+        weights[tops == candidate] *= factor
+        return
+    for i, c in enumerate(tops):
+        if c == candidate:
+            weights[i] *= factor
+
+
+# ---- methods ----
+
+def _lowest(candidates, counts, history):
+    """The candidate to eliminate, and how a tie for last place was broken (None if there was none).
+
+    Ties go to the candidate with fewer votes in the latest earlier round that separates
+    them; failing that, the one listed last on the ballot is eliminated.
+    """
+    fewest = min(counts[c] for c in candidates)
+    tied = [c for c in candidates if counts[c] == fewest]
+    if len(tied) == 1:
+        return tied[0], None
+    for earlier in reversed(history):
+        fewest = min(earlier[c] for c in tied)
+        tied = [c for c in tied if earlier[c] == fewest]
+        if len(tied) == 1:
+            return tied[0], 'earlier rounds'
+    return max(tied), 'ballot order'
+
+
+def _by_id(candidates, counts, indices):
+    return {candidates[i - 1]: counts[i] for i in indices}
+
+
+def _top_counts(method, seats, counts, ballots):
+    # Plurality and approval: the `seats` highest counts win, ties at the cut-off stay unresolved
+    order = sorted(counts, key=lambda c: -counts[c])
+    cutoff = counts[order[seats - 1]] if 0 < seats <= len(order) else None
+    winners = [c for c in order[:seats] if counts[c] > 0 and (cutoff is None or counts[c] > cutoff)]
+    tied = [c for c in order if cutoff and counts[c] == cutoff]
+    if len(winners) + len(tied) <= seats:
+        winners, tied = winners + tied, []
+    return Tabulation(method, seats, ballots, 0, counts, tuple(winners), tuple(tied),
+                      (Round(counts, tuple(winners), (), None),))
+
+
+def tabulate_counts(method, counts, seats=1):
+    """Plurality or approval results straight from per-candidate totals (the tallies table)."""
+    return _top_counts(method, seats, dict(counts), None)
+
+
+def plurality(ballots, seats=1):
+    counts = _count(_first_choices(ballots.matrix, _flags(len(ballots.candidates))), len(ballots.candidates))
+    return _top_counts('plurality', seats, _by_id(ballots.candidates, counts, range(1, len(counts))),
+                       len(ballots.matrix))
+
+
+def approval(ballots, seats=1):
+    counts = _every_choice(ballots.matrix, len(ballots.candidates))
+    return _top_counts('approval', seats, _by_id(ballots.candidates, counts, range(1, len(counts))),
+                       len(ballots.matrix))
+
+
+def instant_runoff(ballots, seats=1):
+    """Eliminate the last-placed candidate and transfer their ballots until one has a majority."""
+    candidates, size = ballots.candidates, len(ballots.candidates)
+    continuing = _flags(size)
+    remaining = list(range(1, size + 1))
+    rounds, history = [], []
+    while remaining:
+        counts = _count(_first_choices(ballots.matrix, continuing), size)
+        active = sum(counts[c] for c in remaining)
+        if not active:
+            break
+        leader = max(remaining, key=lambda c: (counts[c], -c))
+        if counts[leader] * 2 > active or len(remaining) == 1:
+            rounds.append(Round(_by_id(candidates, counts, remaining), (candidates[leader - 1],), (), None))
+            return Tabulation('irv', 1, len(ballots.matrix), counts[0], rounds[-1].counts,
+                              (candidates[leader - 1],), (), tuple(rounds))
+        loser, tiebreak = _lowest(remaining, counts, history)
+        rounds.append(Round(_by_id(candidates, counts, remaining), (), (candidates[loser - 1],), tiebreak))
+        history.append(counts)
+        continuing[loser] = False
+        remaining.remove(loser)
+    return Tabulation('irv', 1, len(ballots.matrix), len(ballots.matrix), {}, (), (), tuple(rounds))
+
+
+def single_transferable_vote(ballots, seats):
+    """STV with the Droop quota; surpluses move on at a reduced weight (Gregory method)."""
+    candidates, size = ballots.candidates, len(ballots.candidates)
+    continuing = _flags(size)
+    remaining = list(range(1, size + 1))
+    weights = _weights(len(ballots.matrix))
+    winners, rounds, history = [], [], []
+    quota = None
+    exhausted = 0
+    while len(winners) < seats and remaining:
+        tops = _first_choices(ballots.matrix, continuing)
+        counts = _count(tops, size, weights)
+        exhausted = counts[0]
+        if quota is None:
+            quota = int(sum(counts[1:])) // (seats + 1) + 1
+        if len(remaining) <= seats - len(winners):
+            # No one left to eliminate: everyone still standing fills the remaining seats
+            elected = sorted(remaining, key=lambda c: (-counts[c], c))
+            rounds.append(Round(_by_id(candidates, counts, remaining), tuple(candidates[c - 1] for c in elected),
+                                (), None))
+            winners.extend(elected)
+            break
+        reached = sorted((c for c in remaining if counts[c] >= quota), key=lambda c: (-counts[c], c))
+        reached = reached[:seats - len(winners)]
+        if reached:
+            for c in reached:
+                _scale(weights, tops, c, (counts[c] - quota) / counts[c])
+                continuing[c] = False
+                remaining.remove(c)
+            winners.extend(reached)
+            rounds.append(Round(_by_id(candidates, counts, remaining + reached),
+                                tuple(candidates[c - 1] for c in reached), (), None))
+        else:
+            loser, tiebreak = _lowest(remaining, counts, history)
+            rounds.append(Round(_by_id(candidates, counts, remaining), (), (candidates[loser - 1],), tiebreak))
+            continuing[loser] = False
+            remaining.remove(loser)
+        history.append(counts)
+    final = rounds[-1].counts if rounds else {}
+    return Tabulation('stv', seats, len(ballots.matrix), exhausted, final,
+                      tuple(candidates[c - 1] for c in winners), (), tuple(rounds))
+
+
+def tabulate(method, ballots, seats=1):
+    """Count `ballots` with `method` (a METHODS key); every method returns a Tabulation."""
+    if method == 'irv':
+        return instant_runoff(ballots)
+    if method == 'stv':
+        return single_transferable_vote(ballots, seats)
+    if method == 'approval':
+        return approval(ballots, seats)
+    return plurality(ballots, seats)
@@ -0,0 +1,67 @@
+import sqlite3
+
+import pytest
+
+from audit import AUDIT_COLUMNS, AuditUnavailable, AuditWriter, audit_record
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / 'audit.db')
+    conn = sqlite3.connect(path)
+    conn.execute(f"CREATE TABLE audit_log (id INTEGER PRIMARY KEY, {', '.join(AUDIT_COLUMNS)})")
+    conn.execute("CREATE UNIQUE INDEX idx_audit_log_uid ON audit_log (uid)")
+    conn.commit()
+    conn.close()
+    return path
+
+
+def connect_to(path):
+    return lambda: sqlite3.connect(path, check_same_thread=False)
+
+
+def actions(path):
+    conn = sqlite3.connect(path)
+    try:
+        return sorted(action for (action,) in conn.execute("SELECT action FROM audit_log"))
+    finally:
+        conn.close()
+
+
+def test_sync_log_is_written_before_it_returns(path, tmp_path):
+    writer = AuditWriter(connect_to(path), str(tmp_path / 'spill.jsonl'))
+    writer.log(audit_record('First', 'admin'))
+    writer.log(audit_record('Second', 'admin'), sync=True)
+    assert actions(path) == ['First', 'Second']
+
+
+def test_spill_failure_keeps_the_writer_alive(path, tmp_path):
+    attempts = []
+
+    def connect():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise sqlite3.OperationalError('unable to open database file')
+        return connect_to(path)()
+
+    # The spill file's directory is missing, so spilling fails as on a full or read-only disk
+    writer = AuditWriter(connect, str(tmp_path / 'missing' / 'spill.jsonl'))
+    with pytest.raises(AuditUnavailable):
+        writer.log(audit_record('Lost', 'admin'), sync=True)
+    assert writer.lost == 1
+    writer.log(audit_record('Kept', 'admin'), sync=True)
+    assert actions(path) == ['Kept']
+
+
+def test_sync_log_times_out(path, tmp_path):
+    writer = AuditWriter(connect_to(path), str(tmp_path / 'spill.jsonl'), sync_timeout=0.05)
+    conn = sqlite3.connect(path)
+    conn.execute("BEGIN EXCLUSIVE")
+    try:
+        writer.busy_timeout = 1.0
+        with pytest.raises(AuditUnavailable):
+            writer.log(audit_record('Slow', 'admin'), sync=True)
+    finally:
+        conn.rollback()
+        conn.close()
+    writer.flush()
@@ -0,0 +1,98 @@
+import sqlite3
+import threading
+
+import pytest
+
+from group_commit import GroupCommitWriter, WriterBusy
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / 'writes.db')
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE writes (value INTEGER UNIQUE)")
+    conn.commit()
+    conn.close()
+    return path
+
+
+def insert(conn, value):
+    conn.execute("INSERT INTO writes (value) VALUES (?)", (value,))
+    return value * 2
+
+
+def connect_to(path):
+    return lambda: sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+
+
+def stored(path):
+    conn = sqlite3.connect(path)
+    try:
+        return sorted(value for (value,) in conn.execute("SELECT value FROM writes"))
+    finally:
+        conn.close()
+
+
+def test_concurrent_writes_are_committed_and_answered(path):
+    writer = GroupCommitWriter(connect_to(path), insert, max_batch=50, max_latency=0.01)
+    results = {}
+
+    def submit(value):
+        results[value] = writer.submit(value)
+
+    threads = [threading.Thread(target=submit, args=(value,)) for value in range(100)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == {value: value * 2 for value in range(100)}
+    assert stored(path) == list(range(100))
+
+
+def test_a_failing_write_does_not_fail_its_batch(path):
+    writer = GroupCommitWriter(connect_to(path), insert, max_latency=0.05)
+    writer.submit(1)
+    errors, results = [], []
+
+    def submit(value):
+        try:
+            results.append(writer.submit(value))
+        except sqlite3.IntegrityError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=submit, args=(value,)) for value in (1, 2, 3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(errors) == 1 and sorted(results) == [4, 6]
+    assert stored(path) == [1, 2, 3]
+
+
+def test_connect_failure_fails_callers_and_the_writer_recovers(path):
+    attempts = []
+
+    def connect():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise sqlite3.OperationalError('unable to open database file')
+        return connect_to(path)()
+
+    writer = GroupCommitWriter(connect, insert, timeout=5)
+    with pytest.raises(sqlite3.OperationalError):
+        writer.submit(1)
+    assert writer.submit(2) == 4
+    assert stored(path) == [2]
+
+
+def test_submit_gives_up_after_its_timeout(path):
+    release = threading.Event()
+
+    def slow_insert(conn, value):
+        release.wait(5)
+        return insert(conn, value)
+
+    writer = GroupCommitWriter(connect_to(path), slow_insert, timeout=0.1)
+    with pytest.raises(WriterBusy):
+        writer.submit(1)
+    release.set()
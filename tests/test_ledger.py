@@ -0,0 +1,108 @@
+import os
+import shutil
+import sqlite3
+import time
+
+import pytest
+
+import ledger
+import schema
+
+SEED = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'database.db')
+
+
+@pytest.fixture
+def conn(tmp_path):
+    # Migrating the bundled database backfills ledger entries from before ballots.rank existed
+    path = str(tmp_path / 'database.db')
+    shutil.copy(SEED, path)
+    schema.migrate(path)
+    conn = sqlite3.connect(path, isolation_level=None)
+    yield conn
+    conn.close()
+
+
+def behind_the_ledger(conn, trigger, sql, params=()):
+    # What someone editing the file directly would do: drop the trigger, change the row, put it back
+    conn.execute(f"DROP TRIGGER {trigger}")
+    conn.execute(sql, params)
+    ledger.create_ledger(conn)
+
+
+def first_ballot(conn):
+    return conn.execute("SELECT id, candidate_id FROM ballots ORDER BY id LIMIT 1").fetchone()
+
+
+def test_untouched_ledger_verifies(conn):
+    report = ledger.verify(conn)
+    assert report['ok'], report['problems']
+    assert report['entries_total'] > 0
+    assert ledger.verify(conn, full=True)['ok']
+
+
+def test_recorded_changes_still_verify(conn):
+    ballot_id, candidate_id = first_ballot(conn)
+    conn.execute("UPDATE ballots SET candidate_id = ? WHERE id = ?", (candidate_id + 100, ballot_id))
+    conn.execute("DELETE FROM ballots WHERE id = (SELECT MAX(id) FROM ballots)")
+    assert ledger.verify(conn)['problems'] == []
+
+
+def test_changed_vote_is_reported(conn):
+    ballot_id, candidate_id = first_ballot(conn)
+    behind_the_ledger(conn, 'ledger_ballot_update', "UPDATE ballots SET candidate_id = ? WHERE id = ?",
+                      (candidate_id + 100, ballot_id))
+    report = ledger.verify(conn)
+    assert not report['ok']
+    assert report['problems'] == [f"ballot {ballot_id}: candidate_id differ(s) from the ledger"]
+
+
+def test_incremental_verify_checks_only_new_entries(conn):
+    # Entries are cross-checked again until their block is sealed and verified, so fill one first
+    conn.executemany("INSERT INTO audit_log (user, action, details, timestamp) VALUES ('t', 'x', '', '')",
+                     [()] * ledger.BLOCK_SIZE)
+    assert ledger.verify(conn)['ok']
+    ballot_id, candidate_id = first_ballot(conn)
+    behind_the_ledger(conn, 'ledger_ballot_update', "UPDATE ballots SET candidate_id = ? WHERE id = ?",
+                      (candidate_id + 100, ballot_id))
+    # Verified entries are not cross-checked again until a full run
+    assert ledger.verify(conn)['ok']
+    assert ledger.verify(conn, full=True)['problems'] == [f"ballot {ballot_id}: candidate_id differ(s) from the ledger"]
+    # A later recorded change to the same ballot brings it back into the incremental check
+    behind_the_ledger(conn, 'ledger_ballot_update', "UPDATE ballots SET timestamp = timestamp WHERE id = ?", (ballot_id,))
+    conn.execute("UPDATE ballots SET candidate_id = ? WHERE id = ?", (candidate_id, ballot_id))
+    assert ledger.verify(conn)['ok']
+
+
+def test_removed_and_added_ballots_are_reported(conn):
+    ballot_id, _ = first_ballot(conn)
+    behind_the_ledger(conn, 'ledger_ballot_delete', "DELETE FROM ballots WHERE id = ?", (ballot_id,))
+    behind_the_ledger(conn, 'ledger_ballot_insert',
+                      "INSERT INTO ballots (election_id, student_regno, position_id, candidate_id, timestamp) "
+                      "SELECT election_id, 'X1', position_id, candidate_id, timestamp FROM ballots "
+                      "ORDER BY id DESC LIMIT 1")
+    added = conn.execute("SELECT MAX(id) FROM ballots").fetchone()[0]
+    problems = ledger.verify(conn)['problems']
+    assert f"ballot {added}: not in the ledger" in problems
+    assert f"ballot {ballot_id}: in the ledger but missing from ballots" in problems
+
+
+def test_edited_entry_breaks_the_chain(conn):
+    ledger.seal(conn)
+    conn.execute("UPDATE ledger SET payload = payload || ' ' WHERE seq = 1")
+    problems = ledger.verify(conn)['problems']
+    assert any('entry 1 ' in problem for problem in problems)
+
+
+def test_sealer_runs_queued_verifications(conn):
+    reports = []
+    path = conn.execute("PRAGMA database_list").fetchone()[2]
+    sealer = ledger.LedgerSealer(lambda: sqlite3.connect(path, check_same_thread=False), interval=0.02,
+                                 on_report=lambda db, report: reports.append(report))
+    assert ledger.last_report(conn) is None
+    sealer.verify_soon(full=True, requested_by='admin')
+    deadline = time.monotonic() + 5
+    while ledger.last_report(conn) is None and time.monotonic() < deadline:
+        time.sleep(0.02)
+    report = ledger.last_report(conn)
+    assert report['ok'] and report['full'] and report['requested_by'] == 'admin'
+    assert reports == [{key: value for key, value in report.items() if key != 'id'}]
@@ -0,0 +1,40 @@
+import sqlite3
+import time
+
+import pytest
+
+import schema
+from live_tallies import TallyBroadcaster
+
+
+@pytest.fixture
+def broadcaster(tmp_path):
+    path = str(tmp_path / 'database.db')
+    schema.create_schema(path)
+    return TallyBroadcaster(lambda: sqlite3.connect(path, check_same_thread=False), interval=0.02, idle=0.2)
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_poller_runs_only_while_someone_watches(broadcaster):
+    assert broadcaster._thread is None
+    first = broadcaster.poll(1)
+    assert first['type'] == 'snapshot'
+    assert broadcaster.poll(1, first['seq'])['type'] == 'none'
+    assert wait_until(lambda: broadcaster._thread is None)
+    # Counts may have moved while nobody watched, so a returning poller gets everything again
+    assert broadcaster.poll(1, first['seq'])['type'] == 'snapshot'
+
+
+def test_open_stream_keeps_the_poller_running(broadcaster):
+    stream = broadcaster.stream(1)
+    assert 'event: snapshot' in next(stream)
+    time.sleep(0.4)
+    assert broadcaster._thread is not None and broadcaster._thread.is_alive()
+    stream.close()
+    assert wait_until(lambda: broadcaster._thread is None)
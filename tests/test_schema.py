@@ -0,0 +1,125 @@
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+import schema
+
+SEED = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'database.db')
+
+
+@pytest.fixture
+def seeded(tmp_path):
+    # The bundled database predates every migration, so it exercises all of them
+    path = str(tmp_path / 'database.db')
+    shutil.copy(SEED, path)
+    return path
+
+
+@pytest.fixture
+def fresh(tmp_path):
+    path = str(tmp_path / 'fresh.db')
+    schema.create_schema(path)
+    return path
+
+
+def user_version(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_migrations_reach_the_latest_version_once(seeded):
+    assert schema.migrate(seeded) == len(schema.MIGRATIONS)
+    assert user_version(seeded) == len(schema.MIGRATIONS)
+    assert schema.migrate(seeded) == 0
+
+
+def test_migrations_keep_tallies_in_step_with_ballots(seeded):
+    schema.migrate(seeded)
+    conn = sqlite3.connect(seeded)
+    tallied = dict(((e, p, c), votes) for e, p, c, votes in
+                   conn.execute("SELECT election_id, position_id, candidate_id, votes FROM tallies WHERE votes > 0"))
+    counted = dict(((e, p, c), votes) for e, p, c, votes in conn.execute(f'''
+        SELECT election_id, position_id, candidate_id, COUNT(*) FROM ballots WHERE {schema.TALLIED}
+        GROUP BY election_id, position_id, candidate_id
+    '''))
+    conn.close()
+    assert tallied == counted
+
+
+def test_duplicate_ballots_are_quarantined_not_dropped(seeded):
+    conn = sqlite3.connect(seeded)
+    conn.execute("INSERT INTO ballots (student_regno, position_id, candidate_id, timestamp) "
+                 "SELECT student_regno, position_id, candidate_id, '2025-07-08 09:00:00' FROM ballots WHERE id = 1")
+    conn.commit()
+    conn.close()
+    schema.migrate(seeded)
+    conn = sqlite3.connect(seeded)
+    try:
+        assert conn.execute("SELECT student_regno, position_id, timestamp FROM ballots_quarantine").fetchall() \
+            == [('S1001', 1, '2025-07-08 09:00:00')]
+        assert conn.execute("SELECT COUNT(*) FROM ballots WHERE student_regno = 'S1001' AND position_id = 1").fetchone()[0] == 1
+        assert conn.execute("SELECT details FROM audit_log WHERE action = 'Migration'").fetchone()[0].startswith(
+            "Moved 1 duplicate ballot(s) to ballots_quarantine")
+    finally:
+        conn.close()
+
+
+def test_create_schema_is_current_and_rerunnable(fresh):
+    assert user_version(fresh) == len(schema.MIGRATIONS)
+    schema.create_schema(fresh)
+    conn = sqlite3.connect(fresh)
+    assert conn.execute("SELECT COUNT(*) FROM students").fetchone()[0] == 4
+    conn.close()
+
+
+@pytest.mark.parametrize('fixture', ['seeded', 'fresh'])
+def test_hot_queries_use_an_index(request, fixture):
+    path = request.getfixturevalue(fixture)
+    schema.migrate(path)
+    conn = sqlite3.connect(path)
+    try:
+        assert schema.check_query_plans(conn) == []
+    finally:
+        conn.close()
+
+
+def test_query_plan_check_reports_a_dropped_index(fresh):
+    conn = sqlite3.connect(fresh)
+    try:
+        conn.execute("DROP INDEX idx_audit_log_timestamp_id")
+        problems = schema.check_query_plans(conn)
+    finally:
+        conn.close()
+    assert ('audit_log page', 'SCAN audit_log') in problems
+
+
+def test_approval_picks_get_distinct_ranks(seeded):
+    schema.migrate(seeded)
+    conn = sqlite3.connect(seeded)
+    # Roll back to before migration_ballot_ranks, with two approvals at rank 1 as they used to be stored
+    conn.execute("DROP INDEX idx_ballots_election_student")
+    before = schema.MIGRATIONS.index(schema.migration_ballot_ranks)
+    conn.execute(f"PRAGMA user_version = {before}")
+    position_id, = conn.execute("SELECT id FROM positions WHERE election_id = 1 ORDER BY id LIMIT 1").fetchone()
+    conn.execute("UPDATE positions SET method = 'approval' WHERE id = ?", (position_id,))
+    conn.executemany("INSERT INTO ballots (election_id, student_regno, position_id, candidate_id, rank, timestamp) "
+                     "VALUES (1, 'X1', ?, ?, 1, '2025-01-01 09:00:00')", [(position_id, 101), (position_id, 102)])
+    conn.commit()
+    conn.close()
+    assert schema.migrate(seeded) == len(schema.MIGRATIONS) - before
+    conn = sqlite3.connect(seeded)
+    try:
+        assert conn.execute("SELECT candidate_id, rank FROM ballots WHERE student_regno = 'X1' ORDER BY id").fetchall() \
+            == [(101, 1), (102, 2)]
+        # Both approvals still count, and the index now holds one row per (voter, position, rank)
+        assert conn.execute(f"SELECT COUNT(*) FROM ballots WHERE student_regno = 'X1' AND {schema.TALLIED}").fetchone()[0] == 2
+        with pytest.raises(sqlite3.IntegrityError):
+            conn.execute("INSERT INTO ballots (election_id, student_regno, position_id, candidate_id, rank, timestamp) "
+                         "VALUES (1, 'X1', ?, 103, 2, '')", (position_id,))
+    finally:
+        conn.close()
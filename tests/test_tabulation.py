@@ -0,0 +1,142 @@
+import sqlite3
+
+import pytest
+
+import tabulation
+
+
+@pytest.fixture(params=['numpy', 'python'])
+def backend(request, monkeypatch):
+    # Every method has a NumPy and a pure-Python path; both must agree
+    if request.param == 'numpy':
+        if tabulation.np is None:
+            pytest.skip('NumPy is not installed')
+    else:
+        monkeypatch.setattr(tabulation, 'np', None)
+    return request.param
+
+
+@pytest.fixture
+def db():
+    conn = sqlite3.connect(':memory:')
+    conn.execute('''
+        CREATE TABLE ballots (
+            id INTEGER PRIMARY KEY,
+            election_id INTEGER NOT NULL,
+            student_regno TEXT NOT NULL,
+            position_id INTEGER NOT NULL,
+            candidate_id INTEGER NOT NULL,
+            rank INTEGER NOT NULL DEFAULT 1
+        )
+    ''')
+    yield conn
+    conn.close()
+
+
+def cast(db, *ballots, copies=1, position_id=1):
+    """Add `copies` voters for each ballot, a tuple of candidate ids in preference order."""
+    voter = db.execute("SELECT COUNT(DISTINCT student_regno) FROM ballots").fetchone()[0]
+    for ballot in ballots:
+        for _ in range(copies):
+            voter += 1
+            db.executemany("INSERT INTO ballots (election_id, student_regno, position_id, candidate_id, rank) "
+                           "VALUES (1, ?, ?, ?, ?)",
+                           [(f'S{voter:04}', position_id, c, rank) for rank, c in enumerate(ballot, start=1)])
+
+
+def count(db, method, candidates, seats=1):
+    ranked = method in tabulation.RANKED
+    return tabulation.tabulate(method, tabulation.load_ballots(db, 1, 1, candidates, ranked), seats)
+
+
+def rows(matrix):
+    return [tuple(int(c) for c in row) for row in matrix]
+
+
+def test_load_ballots_layout(db, backend):
+    cast(db, (10, 30), (20,))
+    cast(db, (99, 10))  # 99 has since been deleted
+    db.execute("INSERT INTO ballots (election_id, student_regno, position_id, candidate_id) VALUES (1, 'S0001', 2, 10)")
+    ballots = tabulation.load_ballots(db, 1, 1, [10, 20, 30])
+    assert ballots.candidates == (10, 20, 30)
+    assert rows(ballots.matrix) == [(1, 3), (2, 0), (0, 1)]
+    assert rows(tabulation.load_ballots(db, 1, 3, [10]).matrix) == []
+
+
+def test_unranked_picks_fill_the_row(db, backend):
+    db.executemany("INSERT INTO ballots (election_id, student_regno, position_id, candidate_id) VALUES (1, ?, 1, ?)",
+                   [('S1', 10), ('S1', 20), ('S2', 30)])
+    ballots = tabulation.load_ballots(db, 1, 1, [10, 20, 30], ranked=False)
+    assert rows(ballots.matrix) == [(1, 2), (3, 0)]
+
+
+def test_plurality(db, backend):
+    cast(db, (1,), copies=3)
+    cast(db, (2,), copies=2)
+    result = count(db, 'plurality', [1, 2, 3])
+    assert result.winners == (1,)
+    assert result.counts == {1: 3, 2: 2, 3: 0}
+    assert result.ballots == 5
+
+
+def test_plurality_tie_is_left_open(db, backend):
+    cast(db, (1,), (2,))
+    result = count(db, 'plurality', [1, 2])
+    assert result.winners == ()
+    assert set(result.tied) == {1, 2}
+
+
+def test_approval(db, backend):
+    db.executemany("INSERT INTO ballots (election_id, student_regno, position_id, candidate_id) VALUES (1, ?, 1, ?)",
+                   [('S1', 1), ('S1', 2), ('S2', 2), ('S3', 3), ('S4', 2), ('S4', 3)])
+    ballots = tabulation.load_ballots(db, 1, 1, [1, 2, 3], ranked=False)
+    result = tabulation.tabulate('approval', ballots, seats=2)
+    assert result.counts == {1: 1, 2: 3, 3: 2}
+    assert result.winners == (2, 3)
+
+
+def test_instant_runoff_transfers_eliminated_ballots(db, backend):
+    cast(db, (1,), copies=4)
+    cast(db, (2, 3), copies=3)
+    cast(db, (3, 2), copies=2)
+    result = count(db, 'irv', [1, 2, 3])
+    assert result.winners == (2,)
+    assert [r.eliminated for r in result.rounds] == [(3,), ()]
+    assert result.rounds[0].counts == {1: 4, 2: 3, 3: 2}
+    assert result.counts == {1: 4, 2: 5}
+    assert result.exhausted == 0
+
+
+def test_instant_runoff_breaks_ties_on_earlier_rounds(db, backend):
+    cast(db, (1,), copies=4)
+    cast(db, (2,), copies=3)
+    cast(db, (3, 2), copies=2)
+    cast(db, (4, 3), copies=1)
+    result = count(db, 'irv', [1, 2, 3, 4])
+    # 2 and 3 are level after 4 goes; 3 had fewer first preferences, so it goes next
+    assert result.rounds[0].eliminated == (4,)
+    assert result.rounds[1].counts == {1: 4, 2: 3, 3: 3}
+    assert result.rounds[1].eliminated == (3,)
+    assert result.rounds[1].tiebreak == 'earlier rounds'
+    assert result.winners == (2,)
+
+
+def test_single_transferable_vote_passes_on_surplus(db, backend):
+    cast(db, (1, 2), copies=6)
+    cast(db, (2,), copies=2)
+    cast(db, (3,), copies=3)
+    result = count(db, 'stv', [1, 2, 3], seats=2)
+    # Droop quota: 11 // 3 + 1 = 4; 1's surplus of 2 moves on to 2 at a third of a vote per ballot
+    assert result.winners == (1, 2)
+    assert result.rounds[0].elected == (1,)
+    assert result.rounds[1].counts[2] == pytest.approx(4)
+    assert result.rounds[1].counts[3] == pytest.approx(3)
+
+
+def test_tabulate_counts_matches_plurality(db, backend):
+    cast(db, (1,), copies=2)
+    cast(db, (2,), copies=5)
+    from_ballots = count(db, 'plurality', [1, 2])
+    from_tallies = tabulation.tabulate_counts('plurality', {1: 2, 2: 5})
+    assert from_tallies.winners == from_ballots.winners == (2,)
+    assert from_tallies.counts == from_ballots.counts
@@ -0,0 +1,197 @@
+from datetime import datetime, timedelta
+
+MINUTE_FORMAT = '%Y-%m-%d %H:%M'
+# Chart resolution: the finest step (in minutes) that keeps a series under MAX_POINTS
+STEPS = (1, 5, 15, 60, 240, 1440)
+MAX_POINTS = 720
+# Sliding windows (in minutes) searched for the busiest stretch of voting
+PEAK_WINDOWS = (1, 5, 15, 60)
+
+# Eligible students per course and batch, kept by triggers so every roster path (the admin
+# forms, roster imports, the sqlite3 shell) stays counted; course matches elections' NOCASE scoping
+STUDENT_GROUP_TRIGGERS = {
+    'student_groups_insert': '''AFTER INSERT ON students WHEN NEW.regno != 'admin'
+        BEGIN
+            INSERT INTO student_groups (course, batch, students) VALUES (NEW.course, NEW.batch, 1)
+            ON CONFLICT (course, batch) DO UPDATE SET students = students + 1;
+        END''',
+    'student_groups_delete': '''AFTER DELETE ON students WHEN OLD.regno != 'admin'
+        BEGIN
+            UPDATE student_groups SET students = students - 1 WHERE course = OLD.course AND batch = OLD.batch;
+        END''',
+    'student_groups_update': '''AFTER UPDATE OF course, batch ON students WHEN OLD.regno != 'admin'
+        BEGIN
+            UPDATE student_groups SET students = students - 1 WHERE course = OLD.course AND batch = OLD.batch;
+            INSERT INTO student_groups (course, batch, students) VALUES (NEW.course, NEW.batch, 1)
+            ON CONFLICT (course, batch) DO UPDATE SET students = students + 1;
+        END''',
+}
+
+
+def create_turnout(conn):
+    # Ballots cast per minute and voter group. Rows keep the voter's course and batch as they
+    # were when the vote was cast; minute is '' for legacy voters with no recorded time.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS turnout_minutes (
+            election_id INTEGER NOT NULL,
+            minute TEXT NOT NULL,
+            course TEXT NOT NULL COLLATE NOCASE,
+            batch TEXT NOT NULL,
+            votes INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (election_id, minute, course, batch)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS student_groups (
+            course TEXT NOT NULL COLLATE NOCASE,
+            batch TEXT NOT NULL,
+            students INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (course, batch)
+        ) WITHOUT ROWID
+    ''')
+    for name, body in STUDENT_GROUP_TRIGGERS.items():
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+
+
+# The voter's bucket: their minute and group, or '' for whatever is unknown
+_BUCKET = f'''
+    SELECT ev.election_id, COALESCE(strftime('{MINUTE_FORMAT}', ev.timestamp), '') AS minute,
+           COALESCE(s.course, '') AS course, COALESCE(s.batch, '') AS batch
+    FROM election_voters ev
+    LEFT JOIN students s ON s.regno = ev.regno
+'''
+
+
+def rebuild_turnout(conn):
+    """Recount both rollups from election_voters and students."""
+    conn.execute("DELETE FROM turnout_minutes")
+    conn.execute(f'''
+        INSERT INTO turnout_minutes (election_id, minute, course, batch, votes)
+        SELECT election_id, minute, course, batch, COUNT(*) FROM ({_BUCKET})
+        GROUP BY election_id, minute, course COLLATE NOCASE, batch
+    ''')
+    conn.execute("DELETE FROM student_groups")
+    conn.execute('''
+        INSERT INTO student_groups (course, batch, students)
+        SELECT course, batch, COUNT(*) FROM students WHERE regno != 'admin'
+        GROUP BY course COLLATE NOCASE, batch
+    ''')
+
+
+def add_turnout(db, election_id, regno, timestamp):
+    # Called by record_ballot, in the same transaction as the election_voters row
+    db.execute(f'''
+        INSERT INTO turnout_minutes (election_id, minute, course, batch, votes)
+        SELECT ?, COALESCE(strftime('{MINUTE_FORMAT}', ?), ''), COALESCE(s.course, ''), COALESCE(s.batch, ''), 1
+        FROM (SELECT ? AS regno) AS voter
+        LEFT JOIN students s ON s.regno = voter.regno
+        WHERE true
+        ON CONFLICT (election_id, minute, course, batch) DO UPDATE SET votes = votes + 1
+    ''', (election_id, timestamp, regno))
+
+
+def remove_turnout(db, election_id, regno):
+    # Take a voter back out of their bucket before their election_voters row is deleted
+    db.execute(f'''
+        UPDATE turnout_minutes SET votes = votes - 1
+        WHERE (election_id, minute, course, batch) IN ({_BUCKET} WHERE ev.election_id = ? AND ev.regno = ?)
+    ''', (election_id, regno))
+
+
+def eligible_voters(db, course=None, batch=None):
+    """Students an election scoped to `course` and `batch` (None: any) is open to."""
+    return db.execute('''
+        SELECT COALESCE(SUM(students), 0) FROM student_groups
+        WHERE (? IS NULL OR course = ?) AND (? IS NULL OR batch = ?)
+    ''', (course, course, batch, batch)).fetchone()[0]
+
+
+def _peaks(per_minute):
+    """The busiest window of each PEAK_WINDOWS length, as dicts of window, start, ballots and rate."""
+    # The best window can always start on a minute that had votes, so only those are visited
+    minutes = sorted(per_minute)
+    offsets = [int((minute - minutes[0]).total_seconds() // 60) for minute in minutes]
+    peaks = []
+    for window in PEAK_WINDOWS:
+        best, start, total, end = 0, 0, 0, 0
+        for i, offset in enumerate(offsets):
+            while end < len(offsets) and offsets[end] < offset + window:
+                total += per_minute[minutes[end]]
+                end += 1
+            if total > best:
+                best, start = total, i
+            total -= per_minute[minutes[i]]
+        peaks.append({'window': window, 'start': minutes[start].strftime(MINUTE_FORMAT),
+                      'ballots': best, 'per_minute': best / window})
+    return peaks
+
+
+def turnout_report(db, election):
+    """Turnout for `election` (an elections row) from the rollups: overall and per group,
+    ballots per chart step, cumulative turnout per group and the peak voting windows."""
+    # Course is NOCASE in both rollups, so groups are matched on its upper-cased form
+    per_minute, per_group, groups, stamps = {}, {}, {}, {}
+    for minute, course, batch, votes in db.execute(
+            "SELECT minute, course, batch, votes FROM turnout_minutes WHERE election_id = ? ORDER BY minute",
+            (election['id'],)):
+        if not votes:
+            continue
+        key = (course.upper(), batch)
+        groups.setdefault(key, {'course': course, 'batch': batch, 'eligible': 0})
+        per_group.setdefault(key, []).append((minute, votes))
+        if minute:
+            # Rows arrive minute by minute, one per group, so each minute is parsed once
+            stamp = stamps.get(minute)
+            if stamp is None:
+                stamp = stamps[minute] = datetime.strptime(minute, MINUTE_FORMAT)
+            per_minute[stamp] = per_minute.get(stamp, 0) + votes
+    for course, batch, students in db.execute('''
+        SELECT course, batch, students FROM student_groups
+        WHERE students > 0 AND (? IS NULL OR course = ?) AND (? IS NULL OR batch = ?)
+    ''', (election['course'], election['course'], election['batch'], election['batch'])):
+        groups[(course.upper(), batch)] = {'course': course, 'batch': batch, 'eligible': students}
+
+    labels, ballots, step = [], [], STEPS[0]
+    if per_minute:
+        first, last = min(per_minute), max(per_minute)
+        span = int((last - first).total_seconds() // 60) + 1
+        step = next((s for s in STEPS if span / s <= MAX_POINTS), STEPS[-1])
+        # Buckets line up on whole steps of the day, so 15-minute steps read 10:00, 10:15, ...
+        origin = first - timedelta(minutes=(first.hour * 60 + first.minute) % step)
+        points = int((last - origin).total_seconds() // 60) // step + 1
+        labels = [(origin + timedelta(minutes=i * step)).strftime(MINUTE_FORMAT) for i in range(points)]
+        ballots = [0] * points
+        for minute, votes in per_minute.items():
+            ballots[int((minute - origin).total_seconds() // 60) // step] += votes
+
+    # Where each chart step ends, as minute strings comparable with the rollup's
+    ends = [(datetime.strptime(label, MINUTE_FORMAT) + timedelta(minutes=step)).strftime(MINUTE_FORMAT)
+            for label in labels]
+    rows = []
+    for key, group in sorted(groups.items()):
+        series = per_group.get(key, [])
+        # Untimed ('') rows sort first, so they open the running total
+        cumulative, running, i = [], 0, 0
+        for end in ends:
+            while i < len(series) and series[i][0] < end:
+                running += series[i][1]
+                i += 1
+            cumulative.append(running)
+        voted = sum(votes for _, votes in series)
+        rows.append(dict(group, voted=voted, cumulative=cumulative,
+                         turnout=voted / group['eligible'] if group['eligible'] else None))
+
+    eligible = sum(row['eligible'] for row in rows)
+    voted = sum(row['voted'] for row in rows)
+    return {
+        'election_id': election['id'],
+        'eligible': eligible,
+        'voted': voted,
+        'turnout': voted / eligible if eligible else None,
+        'untimed': sum(votes for series in per_group.values() for minute, votes in series if not minute),
+        'step': step,
+        'labels': labels,
+        'ballots': ballots,
+        'groups': rows,
+        'peaks': _peaks(per_minute) if per_minute else [],
+    }